@@ -0,0 +1,904 @@
+"""
+MarkItDown / MinerU 两个 API 服务共用的基础组件
+
+- 进程内指标、相同请求合并（single-flight）、受管理的临时工作空间
+- 响应序列化与压缩协商
+- 异步任务结果存储、回调投递、任务日志与优雅下线
+
+镜像构建时与 api_server.py 复制到同一目录；在仓库中直接运行服务时需把 docker/common
+加入 PYTHONPATH，例如 PYTHONPATH=docker/common python docker/mineru/api_server.py。
+"""
+
+import fcntl
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Request  # type: ignore
+from fastapi.responses import Response  # type: ignore
+
+# 可选依赖：更快的 JSON 编码器、zstd / brotli 压缩和 msgpack 响应格式
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# 进程内指标（计数器 / 观测值），通过 /metrics 暴露
+_METRICS_LOCK = threading.Lock()
+_METRICS: Dict[str, float] = {}
+
+
+def metric_inc(name: str, value: float = 1) -> None:
+    with _METRICS_LOCK:
+        _METRICS[name] = _METRICS.get(name, 0) + value
+
+
+def metric_observe(name: str, value: float) -> None:
+    """记录一次观测值，累计 count / sum / max"""
+    with _METRICS_LOCK:
+        _METRICS[f"{name}_count"] = _METRICS.get(f"{name}_count", 0) + 1
+        _METRICS[f"{name}_sum"] = _METRICS.get(f"{name}_sum", 0) + value
+        _METRICS[f"{name}_max"] = max(_METRICS.get(f"{name}_max", value), value)
+
+
+def metrics_snapshot() -> Dict[str, float]:
+    with _METRICS_LOCK:
+        return dict(_METRICS)
+
+
+class _Flight:
+    """一次正在进行中的处理任务，供相同请求共享结果"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.refs = 0
+
+
+class SingleFlight:
+    """
+    进行中请求合并（single-flight）
+
+    相同 key 的并发请求只执行一次 fn，其余请求等待并共享同一结果。
+    所有参与者退出后调用 cleanup 释放结果占用的资源（例如临时目录）。
+    """
+
+    def __init__(self, name: str, cleanup: Optional[Callable[[Any], None]] = None) -> None:
+        self.name = name
+        self._cleanup = cleanup
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+
+    @contextmanager
+    def join(self, key: str, fn: Callable[[], Any]) -> Iterator[Tuple[Any, bool]]:
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+            flight.refs += 1
+
+        if is_leader:
+            try:
+                flight.result = fn()
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+        else:
+            metric_inc(f"{self.name}_coalesced_waiters_total")
+            logger.info(f"Joined in-flight {self.name} job: {key[:16]}...")
+            flight.done.wait()
+
+        try:
+            if flight.error is not None:
+                raise flight.error
+            yield flight.result, not is_leader
+        finally:
+            with self._lock:
+                flight.refs -= 1
+                is_last = flight.refs == 0
+            if is_last and self._cleanup and flight.result is not None:
+                self._cleanup(flight.result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+
+def flight_key(data: bytes, **params: object) -> str:
+    """根据文件内容哈希和处理参数生成合并 key"""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest}:{json.dumps(params, sort_keys=True)}"
+
+
+class ScratchQuotaExceeded(RuntimeError):
+    """临时空间配额不足"""
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for item in files:
+            try:
+                total += os.lstat(os.path.join(root, item)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class ScratchSpace:
+    """
+    受管理的临时工作空间
+
+    - 小文件优先放在 tmpfs（内存盘），超过阈值或内存盘空间不足时落到磁盘
+    - 按请求和总量两级配额预留空间，超出时拒绝请求
+    - 每个进程持有一个 owner 锁文件，进程崩溃后锁自动释放，
+      清理线程据此删除崩溃进程遗留的工作目录
+    """
+
+    _OWNER_PREFIX = ".owner-"
+
+    def __init__(
+        self,
+        name: str,
+        root: str,
+        tmpfs_root: Optional[str],
+        tmpfs_max_bytes: int,
+        request_quota: int,
+        total_quota: int,
+        orphan_ttl: int,
+    ) -> None:
+        self.name = name
+        self.root = root
+        self.tmpfs_root = tmpfs_root or None
+        self.tmpfs_max_bytes = tmpfs_max_bytes
+        self.request_quota = request_quota
+        self.total_quota = total_quota
+        self.orphan_ttl = orphan_ttl
+        self._lock = threading.Lock()
+        self._reserved: Dict[str, int] = {}
+        self._owner_pid: Optional[int] = None
+        self._owner_id = ""
+        self._owner_fds: List[int] = []
+        self._sweeper: Optional[threading.Thread] = None
+
+    def _roots(self) -> List[str]:
+        return [r for r in (self.root, self.tmpfs_root) if r]
+
+    def _ensure_owner(self) -> str:
+        """为当前进程创建 owner 锁（fork 后的子进程会重新创建）"""
+        if self._owner_pid == os.getpid():
+            return self._owner_id
+        owner_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        fds: List[int] = []
+        for root in self._roots():
+            os.makedirs(root, exist_ok=True)
+            lock_path = os.path.join(root, f"{self._OWNER_PREFIX}{owner_id}")
+            fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            fds.append(fd)
+        self._owner_pid = os.getpid()
+        self._owner_id = owner_id
+        self._owner_fds = fds
+        return owner_id
+
+    def _pick_root(self, expected_bytes: int) -> str:
+        if self.tmpfs_root and expected_bytes <= self.tmpfs_max_bytes:
+            try:
+                os.makedirs(self.tmpfs_root, exist_ok=True)
+                if shutil.disk_usage(self.tmpfs_root).free > expected_bytes * 2:
+                    return self.tmpfs_root
+            except OSError as e:
+                logger.warning(f"tmpfs scratch unavailable, spilling to disk: {e}")
+        return self.root
+
+    def allocate(self, expected_bytes: int) -> str:
+        """预留空间并创建工作目录，返回目录路径"""
+        if expected_bytes > self.request_quota:
+            metric_inc(f"{self.name}_quota_rejections_total")
+            raise ScratchQuotaExceeded(
+                f"单个请求预计占用 {expected_bytes // (1024 * 1024)}MB 临时空间，"
+                f"超过配额 {self.request_quota // (1024 * 1024)}MB"
+            )
+        with self._lock:
+            owner_id = self._ensure_owner()
+            reserved = sum(self._reserved.values())
+            if reserved + expected_bytes > self.total_quota:
+                metric_inc(f"{self.name}_quota_rejections_total")
+                raise ScratchQuotaExceeded(
+                    f"临时空间总配额不足（已预留 {reserved // (1024 * 1024)}MB，"
+                    f"总配额 {self.total_quota // (1024 * 1024)}MB）"
+                )
+            root = self._pick_root(expected_bytes)
+            path = tempfile.mkdtemp(prefix=f"{owner_id}--", dir=root)
+            self._reserved[path] = expected_bytes
+        medium = "tmpfs" if root == self.tmpfs_root else "disk"
+        metric_inc(f"{self.name}_{medium}_allocations_total")
+        return path
+
+    def release(self, path: str) -> None:
+        """删除工作目录并释放预留空间"""
+        used = dir_size(path)
+        metric_observe(f"{self.name}_request_bytes", used)
+        with self._lock:
+            reserved = self._reserved.pop(path, 0)
+        if used > self.request_quota:
+            metric_inc(f"{self.name}_quota_overruns_total")
+            logger.warning(
+                f"Scratch dir {path} used {used} bytes, exceeding request quota {self.request_quota} "
+                f"(reserved {reserved})"
+            )
+        shutil.rmtree(path, ignore_errors=True)
+
+    @contextmanager
+    def workdir(self, expected_bytes: int) -> Iterator[str]:
+        path = self.allocate(expected_bytes)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def _owner_alive(self, root: str, owner_id: str) -> bool:
+        if owner_id == self._owner_id and self._owner_pid == os.getpid():
+            return True
+        lock_path = os.path.join(root, f"{self._OWNER_PREFIX}{owner_id}")
+        try:
+            fd = os.open(lock_path, os.O_RDWR)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    def sweep_orphans(self) -> int:
+        """删除已退出进程遗留（或超过 TTL）的工作目录，返回删除数量"""
+        removed = 0
+        now = time.time()
+        for root in self._roots():
+            if not os.path.isdir(root):
+                continue
+            with self._lock:
+                active = set(self._reserved)
+            alive_owners: Dict[str, bool] = {}
+            for entry in os.scandir(root):
+                if entry.name.startswith(self._OWNER_PREFIX):
+                    owner_id = entry.name[len(self._OWNER_PREFIX):]
+                    if owner_id not in alive_owners:
+                        alive_owners[owner_id] = self._owner_alive(root, owner_id)
+                    continue
+                if "--" not in entry.name:
+                    continue
+                if entry.path in active:
+                    continue
+                owner_id = entry.name.split("--", 1)[0]
+                if owner_id not in alive_owners:
+                    alive_owners[owner_id] = self._owner_alive(root, owner_id)
+                try:
+                    expired = now - entry.stat().st_mtime > self.orphan_ttl
+                except OSError:
+                    continue
+                if alive_owners[owner_id] and not expired:
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+            for owner_id, alive in alive_owners.items():
+                if alive:
+                    continue
+                lock_path = os.path.join(root, f"{self._OWNER_PREFIX}{owner_id}")
+                try:
+                    # 新建的锁文件在 flock 之前可能短暂处于未加锁状态，只删除足够旧的
+                    if now - os.stat(lock_path).st_mtime > 60:
+                        os.unlink(lock_path)
+                except OSError:
+                    pass
+        if removed:
+            metric_inc(f"{self.name}_orphans_removed_total", removed)
+            logger.info(f"Removed {removed} orphaned scratch dirs")
+        return removed
+
+    def start_sweeper(self, interval: int) -> None:
+        """启动时清理一次，并在后台线程中定期清理"""
+        self._ensure_owner()
+        try:
+            self.sweep_orphans()
+        except Exception as e:
+            logger.error(f"Scratch sweep failed: {e}")
+        if interval <= 0 or self._sweeper is not None:
+            return
+
+        def _loop() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep_orphans()
+                except Exception as e:
+                    logger.error(f"Scratch sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=_loop, name=f"{self.name}-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            reserved = sum(self._reserved.values())
+            active = len(self._reserved)
+        usage: Dict[str, object] = {}
+        for label, root in (("disk", self.root), ("tmpfs", self.tmpfs_root)):
+            if not root or not os.path.isdir(root):
+                continue
+            disk = shutil.disk_usage(root)
+            usage[label] = {
+                "root": root,
+                "used_bytes": dir_size(root),
+                "fs_free_bytes": disk.free,
+            }
+        return {
+            "active_dirs": active,
+            "reserved_bytes": reserved,
+            "request_quota_bytes": self.request_quota,
+            "total_quota_bytes": self.total_quota,
+            "tmpfs_max_bytes": self.tmpfs_max_bytes if self.tmpfs_root else 0,
+            "usage": usage,
+        }
+
+
+# 响应序列化与压缩：可选依赖缺失时退回标准库 json / gzip
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "4096"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_ZSTD_LEVEL = int(os.environ.get("RESPONSE_ZSTD_LEVEL", "3"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "5"))
+
+_COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0),
+}
+if zstandard is not None:
+    # ZstdCompressor 实例不是线程安全的，每次压缩单独创建
+    _COMPRESSORS["zstd"] = lambda body: zstandard.ZstdCompressor(level=RESPONSE_ZSTD_LEVEL).compress(body)
+if brotli is not None:
+    _COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+
+# 客户端权重相同时的服务端偏好顺序
+_ENCODING_PREFERENCE = ("zstd", "br", "gzip")
+_MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """根据 Accept-Encoding 选择压缩算法，返回 None 表示不压缩"""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+
+    candidates = []
+    for rank, encoding in enumerate(_ENCODING_PREFERENCE):
+        if encoding not in _COMPRESSORS:
+            continue
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > 0:
+            candidates.append((-weight, rank, encoding))
+    return min(candidates)[2] if candidates else None
+
+
+def serialize(content: object, use_msgpack: bool) -> Tuple[bytes, str]:
+    if use_msgpack:
+        return msgpack.packb(content, use_bin_type=True), "application/msgpack"
+    if orjson is not None:
+        return orjson.dumps(content), "application/json"
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, "application/json"
+
+
+def encoding_capabilities() -> Dict[str, object]:
+    """可用的压缩算法与序列化格式（取决于安装了哪些可选依赖）"""
+    return {
+        "compression": sorted(_COMPRESSORS),
+        "fast_json": orjson is not None,
+        "msgpack": msgpack is not None,
+    }
+
+
+def encoded_response(request: Request, content: object, status_code: int = 200) -> Response:
+    """
+    序列化响应体并按 Accept / Accept-Encoding 协商格式与压缩
+
+    - Accept 包含 application/msgpack 且安装了 msgpack 时返回 msgpack
+    - 否则使用 orjson（未安装时退回标准库 json）
+    - 响应体超过 RESPONSE_COMPRESSION_MIN_BYTES 时按 zstd / br / gzip 压缩
+    """
+    accept = request.headers.get("accept", "").lower()
+    use_msgpack = msgpack is not None and any(t in accept for t in _MSGPACK_MEDIA_TYPES)
+
+    serialize_start = time.perf_counter()
+    body, media_type = serialize(content, use_msgpack)
+    metric_observe("response_serialize_ms", (time.perf_counter() - serialize_start) * 1000)
+    metric_observe("response_raw_bytes", len(body))
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if len(body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+        encoding = _negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding:
+            compress_start = time.perf_counter()
+            body = _COMPRESSORS[encoding](body)
+            metric_observe(f"response_compress_{encoding}_ms", (time.perf_counter() - compress_start) * 1000)
+            metric_observe("response_compressed_bytes", len(body))
+            headers["Content-Encoding"] = encoding
+
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+class ResultStore:
+    """
+    异步任务结果存储（每个任务一个 JSON 文件）
+
+    回调模式下结果不随 HTTP 响应返回，调用方收到回调后按 taskId 读取；超过 TTL 的结果会被清理。
+    """
+
+    def __init__(self, root: str, ttl: int) -> None:
+        self.root = root
+        self.ttl = ttl
+
+    def _path(self, task_id: str) -> str:
+        if not re.fullmatch(r"[\w-]+", task_id):
+            raise ValueError(f"非法的 taskId: {task_id}")
+        return os.path.join(self.root, f"{task_id}.json")
+
+    def put(self, task_id: str, record: Dict[str, object]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(task_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get(self, task_id: str) -> Optional[Dict[str, object]]:
+        try:
+            with open(self._path(task_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def sweep(self) -> None:
+        if not os.path.isdir(self.root):
+            return
+        now = time.time()
+        for entry in os.scandir(self.root):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+class WebhookDispatcher:
+    """
+    任务完成回调投递
+
+    每个待投递的回调以 JSON 文件持久化在队列目录中，服务重启后继续投递。
+    失败时按指数退避重试，超过最大次数后移入 dead/ 子目录。
+    多个进程共享队列目录时每条记录投递前先加 flock 认领，同一回调只由一个进程投递和改写。
+    请求体使用 HMAC-SHA256 签名：X-Webhook-Signature = sha256=hex(hmac(secret, "{timestamp}.{body}"))。
+    """
+
+    def __init__(
+        self,
+        service_name: str,
+        queue_dir: str,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        timeout: float,
+        stores: Optional[List["ResultStore"]] = None,
+    ) -> None:
+        self.service_name = service_name
+        self.queue_dir = queue_dir
+        self.dead_dir = os.path.join(queue_dir, "dead")
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        # 投递线程顺带定期清理这些存储中过期的记录
+        self.stores = stores or []
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, url: str, secret: Optional[str], manifest: Dict[str, object]) -> None:
+        os.makedirs(self.queue_dir, exist_ok=True)
+        delivery_id = uuid.uuid4().hex
+        record = {
+            "id": delivery_id,
+            "url": url,
+            "secret": secret,
+            "body": manifest,
+            "attempts": 0,
+            "created_at": time.time(),
+            "next_attempt_at": 0,
+        }
+        self._write(record)
+        metric_inc("webhook_enqueued_total")
+        self._wakeup.set()
+
+    def _write(self, record: Dict[str, Any], directory: Optional[str] = None) -> None:
+        path = os.path.join(directory or self.queue_dir, f"{record['id']}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _post(self, record: Dict[str, Any]) -> None:
+        body = json.dumps(record["body"], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": f"{self.service_name}-webhook/1.0",
+            "X-Webhook-Id": record["id"],
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Attempt": str(record["attempts"] + 1),
+        }
+        if record.get("secret"):
+            signature = hmac.new(
+                record["secret"].encode("utf-8"),
+                timestamp.encode("ascii") + b"." + body,
+                hashlib.sha256,
+            ).hexdigest()
+            headers["X-Webhook-Signature"] = f"sha256={signature}"
+
+        req = urllib.request.Request(record["url"], data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            if not 200 <= resp.status < 300:
+                raise RuntimeError(f"HTTP {resp.status}")
+
+    def _claim(self, path: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        对回调记录加 flock 认领，返回 (fd, record)；记录已被其他进程认领或已处理完时返回 None
+
+        多个 worker（或共享队列目录的多个实例）同时扫描队列，只有持有锁的进程投递并改写该记录；
+        加锁成功后还要确认路径仍指向同一文件：期间记录可能已被删除或被重试改写为新文件。
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+            with os.fdopen(os.dup(fd), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            os.close(fd)
+            return None
+        return fd, record
+
+    @staticmethod
+    def _discard(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _attempt(self, path: str, record: Dict[str, Any]) -> Optional[float]:
+        """投递一条已认领的回调，失败时改写重试时间或移入 dead/，返回下一次到期时间"""
+        try:
+            self._post(record)
+        except Exception as e:
+            record["attempts"] += 1
+            record["last_error"] = str(e)
+            metric_inc("webhook_attempt_failures_total")
+            if record["attempts"] >= self.max_attempts:
+                logger.error(f"Webhook {record['id']} to {record['url']} gave up after {record['attempts']} attempts: {e}")
+                os.makedirs(self.dead_dir, exist_ok=True)
+                self._write(record, self.dead_dir)
+                self._discard(path)
+                metric_inc("webhook_dead_total")
+                return None
+            delay = min(self.backoff_base * (2 ** (record["attempts"] - 1)), self.backoff_max)
+            delay *= 0.8 + random.random() * 0.4
+            record["next_attempt_at"] = time.time() + delay
+            self._write(record)
+            logger.warning(f"Webhook {record['id']} attempt {record['attempts']} failed, retrying in {delay:.1f}s: {e}")
+            return record["next_attempt_at"]
+
+        self._discard(path)
+        latency = time.time() - record["created_at"]
+        metric_inc("webhook_delivered_total")
+        metric_observe("webhook_delivery_latency_seconds", latency)
+        logger.info(f"Webhook {record['id']} delivered to {record['url']} ({latency:.2f}s after completion)")
+        return None
+
+    def _deliver_due(self) -> Optional[float]:
+        """投递所有到期的回调，返回下一次到期时间（没有待投递时返回 None）"""
+        if not os.path.isdir(self.queue_dir):
+            return None
+        next_due: Optional[float] = None
+        for entry in os.scandir(self.queue_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    due_at = json.load(f)["next_attempt_at"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if due_at > time.time():
+                next_due = min(next_due or due_at, due_at)
+                continue
+
+            claimed = self._claim(entry.path)
+            if claimed is None:
+                continue
+            fd, record = claimed
+            try:
+                # 认领前读到的可能是旧内容，以加锁后读到的记录为准
+                if record["next_attempt_at"] > time.time():
+                    due_at = record["next_attempt_at"]
+                else:
+                    due_at = self._attempt(entry.path, record)
+            except Exception as e:
+                logger.error(f"Webhook {record.get('id')} delivery failed: {e}")
+                due_at = None
+            finally:
+                os.close(fd)
+            if due_at is not None:
+                next_due = min(next_due or due_at, due_at)
+        return next_due
+
+    def _loop(self) -> None:
+        last_sweep = 0.0
+        while True:
+            try:
+                next_due = self._deliver_due()
+            except Exception as e:
+                logger.error(f"Webhook dispatcher error: {e}")
+                next_due = None
+            if time.time() - last_sweep > 600:
+                for store in self.stores:
+                    store.sweep()
+                last_sweep = time.time()
+            wait = 30.0 if next_due is None else max(0.1, min(next_due - time.time(), 30.0))
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="webhook-dispatcher", daemon=True)
+        self._thread.start()
+
+    def pending(self) -> int:
+        if not os.path.isdir(self.queue_dir):
+            return 0
+        return sum(1 for entry in os.scandir(self.queue_dir) if entry.name.endswith(".json"))
+
+
+def validate_callback_url(url: str) -> Optional[str]:
+    """校验回调地址，返回错误信息（合法时返回 None）"""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in {"http", "https"} or not parsed.hostname:
+        return "callback_url 必须是 http(s) 地址"
+    allowed = {h.strip().lower() for h in os.environ.get("WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()}
+    if allowed and parsed.hostname.lower() not in allowed:
+        return f"callback_url 主机 {parsed.hostname} 不在 WEBHOOK_ALLOWED_HOSTS 中"
+    return None
+
+
+def new_task_id() -> str:
+    return f"task_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+
+
+class DrainState:
+    """
+    优雅下线状态
+
+    收到 SIGTERM 后进入排空：/ready 返回 503，新的处理请求返回 503，
+    已受理的请求和正在运行的异步任务在宽限期内继续完成。
+    """
+
+    def __init__(self, camel_case: bool = False) -> None:
+        # MinerU 的响应字段使用 camelCase，MarkItDown 使用 snake_case
+        self.camel_case = camel_case
+        self._cond = threading.Condition()
+        self.draining = False
+        self.started_at: Optional[float] = None
+        self.requests = 0
+        self.jobs = 0
+
+    def begin(self) -> bool:
+        """进入排空状态，首次调用返回 True"""
+        with self._cond:
+            if self.draining:
+                return False
+            self.draining = True
+            self.started_at = time.time()
+        logger.info(f"Draining: {self.requests} request(s) and {self.jobs} async job(s) in flight")
+        return True
+
+    @contextmanager
+    def track(self, kind: str) -> Iterator[None]:
+        """统计进行中的请求（requests）或异步任务（jobs）"""
+        with self._cond:
+            setattr(self, kind, getattr(self, kind) + 1)
+        try:
+            yield
+        finally:
+            with self._cond:
+                setattr(self, kind, getattr(self, kind) - 1)
+                self._cond.notify_all()
+
+    def wait_jobs(self, timeout: float) -> bool:
+        """等待正在运行的异步任务结束，超时返回 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.jobs == 0, timeout=max(0.0, timeout))
+
+    def stats(self) -> Dict[str, object]:
+        stats = {
+            "draining": self.draining,
+            "draining_seconds": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            "in_flight_requests": self.requests,
+            "running_jobs": self.jobs,
+        }
+        if self.camel_case:
+            return {re.sub(r"_(\w)", lambda m: m.group(1).upper(), key): value for key, value in stats.items()}
+        return stats
+
+
+class JobJournal:
+    """
+    异步任务日志：受理时把任务参数和上传内容写入磁盘，任务结束后删除
+
+    进程被终止（滚动发布、缩容、崩溃）时未完成的任务留在磁盘上，重启后重新入队。
+    处理中的任务对其日志文件持有 flock，多个 worker 共享目录时同一任务只会被一个进程恢复；
+    进程退出时锁自动释放。
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._fds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, task_id: str) -> Tuple[str, str]:
+        if not re.fullmatch(r"[\w-]+", task_id):
+            raise ValueError(f"非法的 taskId: {task_id}")
+        base = os.path.join(self.root, task_id)
+        return f"{base}.json", f"{base}.bin"
+
+    def _hold(self, task_id: str, fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        with self._lock:
+            self._fds[task_id] = fd
+        return True
+
+    def add(self, task_id: str, params: Dict[str, Any], data: bytes) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        record_path, data_path = self._paths(task_id)
+        with open(data_path, "wb") as f:
+            f.write(data)
+        # 先加锁再发布，避免其他进程在启动恢复时抢到刚受理的任务
+        tmp_path = f"{record_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"taskId": task_id, "params": params, "acceptedAt": time.time()}, f, ensure_ascii=False)
+        self._hold(task_id, os.open(tmp_path, os.O_RDONLY))
+        os.replace(tmp_path, record_path)
+
+    def remove(self, task_id: str) -> None:
+        # 先删除上传内容：中途退出时留下的日志记录会在下次认领时因读取失败被清理
+        for path in reversed(self._paths(task_id)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            fd = self._fds.pop(task_id, None)
+        if fd is not None:
+            os.close(fd)
+
+    def claim_pending(self) -> List[Tuple[str, Dict[str, Any], bytes]]:
+        """认领上一次运行遗留的任务，按受理时间排序"""
+        if not os.path.isdir(self.root):
+            return []
+        claimed: List[Tuple[float, str, Dict[str, Any], bytes]] = []
+        for entry in os.scandir(self.root):
+            if not entry.name.endswith(".json"):
+                continue
+            task_id = entry.name[: -len(".json")]
+            with self._lock:
+                if task_id in self._fds:
+                    continue
+            try:
+                fd = os.open(entry.path, os.O_RDONLY)
+            except OSError:
+                continue
+            if not self._hold(task_id, fd):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    record = json.load(f)
+                with open(self._paths(task_id)[1], "rb") as f:
+                    data = f.read()
+            except (OSError, ValueError) as e:
+                logger.error(f"Dropping unreadable journaled job {task_id}: {e}")
+                self.remove(task_id)
+                continue
+            claimed.append((record.get("acceptedAt", 0), task_id, record["params"], data))
+        claimed.sort(key=lambda item: item[0])
+        return [(task_id, params, data) for _, task_id, params, data in claimed]
+
+    def pending(self) -> int:
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(1 for entry in os.scandir(self.root) if entry.name.endswith(".json"))
+
+
+def install_drain_handler(drain: DrainState, delay: float) -> None:
+    """
+    在 uvicorn 的 SIGTERM / SIGINT 处理之前插入排空逻辑（在 lifespan 启动阶段调用，
+    此时 uvicorn 已注册自己的信号处理，多 worker 模式下每个 worker 进程各自注册）
+
+    首个信号只进入排空状态，delay 秒后再交给 uvicorn 停止监听、等待进行中的请求；
+    再次收到信号时立即交给 uvicorn。
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum: int, frame: Any, previous: Callable[..., Any] = previous) -> None:
+            if drain.begin() and delay > 0:
+                timer = threading.Timer(delay, previous, args=(signum, frame))
+                timer.daemon = True
+                timer.start()
+                return
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
@@ -4,23 +4,104 @@ MarkItDown HTTP API Server（基于 FastAPI）
 提供简单的 HTTP 接口用于文档转换
 """
 
+import asyncio
+import base64
+import csv
+import gc
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
 import logging
+import mimetypes
+import multiprocessing
+import multiprocessing.connection
 import os
+import posixpath
+import queue
 import re
+import select
 import shutil
+import signal
+import socket
+import sys
 import tempfile
+import threading
 import time
+import urllib.parse
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 from urllib.parse import quote
 
+import requests  # type: ignore
 import uvicorn  # type: ignore
-from fastapi import FastAPI, File, Form, UploadFile, status  # type: ignore
-from fastapi.responses import JSONResponse  # type: ignore
-from markitdown import MarkItDown
+from fastapi import FastAPI, File, Form, Request, UploadFile, status  # type: ignore
+from fastapi.responses import JSONResponse, Response, StreamingResponse  # type: ignore
 from minio import Minio  # type: ignore
 from minio.error import S3Error  # type: ignore
 
+# 两个服务共用的基础组件：镜像中与本文件位于同一目录；在仓库中直接运行时需设置 PYTHONPATH=docker/common
+from server_common import (
+    DrainState,
+    JobJournal,
+    ResultStore,
+    ScratchQuotaExceeded,
+    ScratchSpace,
+    SingleFlight,
+    WebhookDispatcher,
+    encoded_response,
+    flight_key,
+    install_drain_handler,
+    metric_inc,
+    metric_observe,
+    metrics_snapshot,
+    new_task_id,
+    serialize,
+    validate_callback_url,
+)
+
+
+# 少用的转换器依赖（音频转写等）延迟到首次使用时再执行模块代码：
+# markitdown 导入时会加载全部内置转换器及其依赖，这里预先登记为惰性模块，
+# 减少冷启动时间和每个进程的常驻内存，可通过 LAZY_IMPORTS 调整（留空关闭）
+LAZY_IMPORTS = [
+    name.strip()
+    for name in os.environ.get("LAZY_IMPORTS", "speech_recognition,pydub,olefile").split(",")
+    if name.strip()
+]
+
+
+def _install_lazy_imports(names: List[str]) -> List[str]:
+    """将尚未导入的模块登记为 importlib 惰性模块，返回实际登记的模块名"""
+    installed: List[str] = []
+    for name in names:
+        if name in sys.modules:
+            continue
+        try:
+            spec = importlib.util.find_spec(name)
+        except (ImportError, ValueError):
+            spec = None
+        if spec is None or spec.loader is None:
+            continue
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        installed.append(name)
+    return installed
+
+
+_LAZY_MODULES = _install_lazy_imports(LAZY_IMPORTS)
+
+from markitdown import MarkItDown, StreamInfo  # noqa: E402
+
 APP_ENV = os.environ.get("APP_ENV", "production").lower()
 MAX_FILE_SIZE = 200 * 1024 * 1024  # 200MB
 
@@ -55,19 +136,264 @@ ALLOWED_EXTENSIONS = {
     "m4a",
     "zip",
     "epub",
+    "tsv",
 }
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时清理崩溃进程遗留的临时目录，并启动后台清理线程
+    SCRATCH.start_sweeper(SCRATCH_SWEEP_INTERVAL)
+    WEBHOOKS.start()
+    install_drain_handler(_DRAIN, DRAIN_DELAY_SECONDS)
+    _start_convert_pool()
+    _resume_journaled_jobs()
+    _mark_ready()
+    yield
+    # uvicorn 已停止监听并等待进行中的请求，这里再等待运行中的异步任务
+    await asyncio.to_thread(_drain_async_jobs)
+    _stop_convert_pool()
+
+
 app = FastAPI(
     title="MarkItDown API Server",
     description="MarkItDown HTTP API Server for document conversion",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 md_converter = MarkItDown()
 
+# 临时空间配置：SCRATCH_TMPFS_ROOT 指向内存盘（如 /dev/shm/markitdown-scratch）时，
+# 预计占用不超过 SCRATCH_TMPFS_MAX_BYTES 的请求使用内存盘，其余落盘
+SCRATCH = ScratchSpace(
+    name="scratch",
+    root=os.environ.get("SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), "markitdown-scratch")),
+    tmpfs_root=os.environ.get("SCRATCH_TMPFS_ROOT"),
+    tmpfs_max_bytes=int(os.environ.get("SCRATCH_TMPFS_MAX_BYTES", str(32 * 1024 * 1024))),
+    request_quota=int(os.environ.get("SCRATCH_REQUEST_QUOTA_BYTES", str(1024 * 1024 * 1024))),
+    total_quota=int(os.environ.get("SCRATCH_TOTAL_QUOTA_BYTES", str(8 * 1024 * 1024 * 1024))),
+    orphan_ttl=int(os.environ.get("SCRATCH_ORPHAN_TTL_SECONDS", str(24 * 3600))),
+)
+# 转换过程中（解压、提取图片等）相对上传文件的预计膨胀倍数
+SCRATCH_EXPANSION_FACTOR = float(os.environ.get("SCRATCH_EXPANSION_FACTOR", "2"))
+SCRATCH_SWEEP_INTERVAL = int(os.environ.get("SCRATCH_SWEEP_INTERVAL_SECONDS", "600"))
+
+
+# 回调任务：结果与待投递回调持久化在 DATA_DIR 下（建议挂载数据卷）
+SERVICE_NAME = "markitdown"
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.getcwd(), "data"))
+RESULT_STORE = ResultStore(
+    os.environ.get("RESULT_STORE_DIR", os.path.join(DATA_DIR, "results")),
+    ttl=int(os.environ.get("RESULT_TTL_SECONDS", str(24 * 3600))),
+)
+WEBHOOKS = WebhookDispatcher(
+    service_name=SERVICE_NAME,
+    queue_dir=os.environ.get("WEBHOOK_QUEUE_DIR", os.path.join(DATA_DIR, "webhooks")),
+    max_attempts=int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8")),
+    backoff_base=float(os.environ.get("WEBHOOK_BACKOFF_BASE_SECONDS", "2")),
+    backoff_max=float(os.environ.get("WEBHOOK_BACKOFF_MAX_SECONDS", "600")),
+    timeout=float(os.environ.get("WEBHOOK_TIMEOUT_SECONDS", "10")),
+    stores=[RESULT_STORE],
+)
+_ASYNC_JOBS = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASYNC_JOB_WORKERS", "4")),
+    thread_name_prefix="async-job",
+)
+
+# 优雅下线：排空宽限期内等待进行中的请求和异步任务，未完成的异步任务由重启后的实例继续处理
+DRAIN_GRACE_SECONDS = float(os.environ.get("DRAIN_GRACE_SECONDS", "120"))
+# 收到 SIGTERM 后继续监听的时间（/ready 返回 503），留给负载均衡摘除本实例
+DRAIN_DELAY_SECONDS = float(os.environ.get("DRAIN_DELAY_SECONDS", "5"))
+_DRAIN = DrainState()
+JOB_JOURNAL = JobJournal(os.environ.get("JOB_JOURNAL_DIR", os.path.join(DATA_DIR, "jobs")))
+
+
+def _run_journaled_job(task_id: str, params: Dict[str, Any], data: bytes) -> None:
+    if _DRAIN.draining:
+        # 排空期间不再开始新任务，保留在日志中由重启后的实例处理
+        logger.info(f"Leaving async task {task_id} journaled for the next instance")
+        return
+    with _DRAIN.track("jobs"):
+        _run_async_convert(task_id, data=data, **params)
+        JOB_JOURNAL.remove(task_id)
+
+
+def _submit_async_job(task_id: str, params: Dict[str, Any], data: bytes) -> None:
+    """记录任务日志后提交到后台线程池"""
+    JOB_JOURNAL.add(task_id, params, data)
+    _ASYNC_JOBS.submit(_run_journaled_job, task_id, params, data)
+
+
+def _resume_journaled_jobs() -> None:
+    """重新提交上一次运行未完成的异步任务"""
+    for task_id, params, data in JOB_JOURNAL.claim_pending():
+        metric_inc("async_jobs_resumed_total")
+        logger.info(f"Resuming journaled async task {task_id} ({params.get('filename')})")
+        _ASYNC_JOBS.submit(_run_journaled_job, task_id, params, data)
+
+
+def _drain_async_jobs() -> None:
+    """关闭阶段：取消尚未开始的异步任务（保留在日志中），在剩余宽限期内等待运行中的任务"""
+    _DRAIN.begin()
+    _ASYNC_JOBS.shutdown(wait=False, cancel_futures=True)
+    remaining = DRAIN_GRACE_SECONDS - (time.time() - (_DRAIN.started_at or time.time()))
+    if not _DRAIN.wait_jobs(remaining):
+        logger.warning(f"Grace period expired with {_DRAIN.jobs} async job(s) still running; they will be resumed after restart")
+    logger.info(f"Drain complete, {JOB_JOURNAL.pending()} async job(s) left in journal")
+
+
+
+# ---------------------------------------------------------------------------
+# 进程内存与冷启动时间
+#
+# 内存取自 /proc/<pid>/smaps_rollup：pss 按共享页的进程数分摊，uss 为进程独占部分，
+# 预加载多进程模式下 worker 的 rss - uss 即为与主进程写时复制共享的部分。
+# ---------------------------------------------------------------------------
+
+_READY_AT: Optional[float] = None
+
+
+def _process_memory(pid: int) -> Dict[str, int]:
+    """读取进程的 rss / pss / uss（字节），非 Linux 或进程不存在时返回空字典"""
+    fields: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        return {}
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_bytes": fields.get("Rss", 0),
+        "pss_bytes": fields.get("Pss", 0),
+        "uss_bytes": uss,
+        "shared_bytes": max(fields.get("Rss", 0) - uss, 0),
+    }
+
+
+def _process_started_at(pid: int) -> Optional[float]:
+    """进程启动时间（epoch 秒，精度为一个时钟节拍），取自 /proc/<pid>/stat 与 /proc/stat 的 btime"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            btime = next(int(line.split()[1]) for line in f if line.startswith("btime "))
+        return btime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+def _cold_start_seconds() -> Optional[float]:
+    """进程启动（预加载模式下为 fork）到 lifespan 启动完成的时间"""
+    if _READY_AT is None:
+        return None
+    started_at = None
+    if _PREFORK_MASTER is not None and _PREFORK_SLOT is not None:
+        started_at = _PREFORK_MASTER.forked_at(_PREFORK_SLOT)
+    started_at = started_at or _process_started_at(os.getpid())
+    return round(_READY_AT - started_at, 3) if started_at else None
+
+
+def _mark_ready() -> None:
+    """lifespan 启动完成时记录就绪时间（预加载模式下同时写入主进程的共享槽位表）"""
+    global _READY_AT
+
+    _READY_AT = time.time()
+    if _PREFORK_MASTER is not None and _PREFORK_SLOT is not None:
+        _PREFORK_MASTER.mark_ready(_PREFORK_SLOT, _READY_AT)
+    memory = _process_memory(os.getpid())
+    logger.info(
+        f"Worker pid={os.getpid()} ready in {_cold_start_seconds()}s"
+        + (f" (rss={memory['rss_bytes'] >> 20}MB, pss={memory['pss_bytes'] >> 20}MB)" if memory else "")
+    )
+
+
+def _process_tree(root_pid: int) -> List[int]:
+    """root_pid 及其全部子孙进程的 pid（读取 /proc/<pid>/stat 的父进程号）"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return [root_pid]
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, []))
+    return sorted(pids)
+
+
+def _service_memory() -> Dict[str, object]:
+    """
+    服务全部进程（主进程 / uvicorn 监管进程、worker、fork 服务器、转换进程）的内存合计
+
+    pss 合计即服务实际占用的物理内存；同样的 UVICORN_WORKERS / CONVERT_POOL_SIZE 下
+    分别以 UVICORN_PREFORK=1 和 0 启动，比较 /metrics 中的 process.service_memory 即可看出写时复制共享的效果。
+    """
+    if _PREFORK_MASTER is not None:
+        root_pid = _PREFORK_MASTER.pid
+    elif int(os.environ.get("UVICORN_WORKERS", "1")) > 1:
+        # uvicorn 自带的多进程模式下 worker 是监管进程的子进程
+        root_pid = os.getppid()
+    else:
+        root_pid = os.getpid()
+    pids = _process_tree(root_pid)
+    totals = {"rss_bytes": 0, "pss_bytes": 0, "uss_bytes": 0}
+    for pid in pids:
+        memory = _process_memory(pid)
+        for key in totals:
+            totals[key] += memory.get(key, 0)
+    return {"root_pid": root_pid, "processes": len(pids), **totals}
+
+
+def _is_lazy_pending(name: str) -> bool:
+    """惰性模块是否仍未执行（不能用 isinstance，访问 __class__ 会触发加载）"""
+    return type(sys.modules.get(name)) is importlib.util._LazyModule  # type: ignore[attr-defined]
+
+
+def _process_stats() -> Dict[str, object]:
+    """当前进程（预加载模式下还包括主进程和全部 worker）的内存与冷启动时间"""
+    stats: Dict[str, object] = {
+        "mode": "prefork" if _PREFORK_MASTER is not None else "uvicorn",
+        "pid": os.getpid(),
+        "cold_start_seconds": _cold_start_seconds(),
+        "memory": _process_memory(os.getpid()),
+        "service_memory": _service_memory(),
+        "lazy_modules_pending": [name for name in _LAZY_MODULES if _is_lazy_pending(name)],
+    }
+    if _PREFORK_MASTER is not None:
+        stats["slot"] = _PREFORK_SLOT
+        stats.update(_PREFORK_MASTER.stats())
+    return stats
+
+
+_MINIO_CLIENT: Optional[Minio] = None
+_MINIO_CLIENT_LOCK = threading.Lock()
+_KNOWN_BUCKETS: set = set()
+
 
 def _get_minio_client() -> Optional[Minio]:
-    """获取 MinIO 客户端"""
+    """获取 MinIO 客户端（进程内共享，复用连接池）"""
+    global _MINIO_CLIENT
+
+    with _MINIO_CLIENT_LOCK:
+        if _MINIO_CLIENT is None:
+            _MINIO_CLIENT = _create_minio_client()
+        return _MINIO_CLIENT
+
+
+def _create_minio_client() -> Optional[Minio]:
     endpoint = os.environ.get("MINIO_ENDPOINT", "minio:9000")
     
     # 确保 endpoint 包含端口号
@@ -91,6 +417,44 @@ def _get_minio_client() -> Optional[Minio]:
         return None
 
 
+def _ensure_bucket(client: Minio, bucket_name: str) -> None:
+    """确保存储桶存在（每个进程每个桶只检查一次）"""
+    if bucket_name in _KNOWN_BUCKETS:
+        return
+    if not client.bucket_exists(bucket_name):
+        client.make_bucket(bucket_name)
+    _KNOWN_BUCKETS.add(bucket_name)
+
+
+def _upload_image_bytes(
+    client: Minio,
+    bucket_name: str,
+    blob: bytes,
+    document_id: str,
+    image_filename: str,
+    content_type: str,
+) -> Optional[str]:
+    """上传内存中的图片到 MinIO 并返回 URL（对象路径与 _upload_image_to_minio 相同）"""
+    try:
+        _ensure_bucket(client, bucket_name)
+        object_name = f"documents/{document_id}/images/{image_filename}"
+        client.put_object(
+            bucket_name,
+            object_name,
+            io.BytesIO(blob),
+            length=len(blob),
+            content_type=content_type,
+        )
+        minio_public_url = os.environ.get("MINIO_PUBLIC_URL", "http://localhost:9000")
+        return f"{minio_public_url}/{bucket_name}/{object_name}"
+    except S3Error as e:
+        logger.error(f"MinIO S3 error uploading image {image_filename}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Error uploading image {image_filename}: {e}")
+        return None
+
+
 def _upload_image_to_minio(
     client: Minio,
     bucket_name: str,
@@ -100,9 +464,7 @@ def _upload_image_to_minio(
 ) -> Optional[str]:
     """上传图片到 MinIO 并返回 URL"""
     try:
-        # 确保存储桶存在
-        if not client.bucket_exists(bucket_name):
-            client.make_bucket(bucket_name)
+        _ensure_bucket(client, bucket_name)
         
         # 构建对象路径：documents/{documentId}/images/{filename}
         object_name = f"documents/{document_id}/images/{image_filename}"
@@ -161,13 +523,10 @@ def _extract_and_upload_images(
     
     bucket_name = os.environ.get("MINIO_BUCKET_NAME", "deepmed")
     
-    # 查找临时目录中的所有图片文件
+    # 查找临时目录中的所有图片文件（一次遍历）
     image_extensions = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
-    image_files = []
-    
     temp_path = Path(temp_dir)
-    for ext in image_extensions:
-        image_files.extend(temp_path.glob(f"**/*{ext}"))
+    image_files = [p for p in temp_path.rglob("*") if p.suffix.lower() in image_extensions and p.is_file()]
     
     logger.info(f"Found {len(image_files)} images in temp directory")
     
@@ -216,10 +575,197 @@ def _extract_and_upload_images(
     return updated_markdown
 
 
+# 图片链接：![alt](src "title")
+_IMAGE_LINK_RE = re.compile(r'!\[([^\]]*)\]\(([^)\s]+)((?:\s+"[^"]*")?)\)')
+_DATA_URI_RE = re.compile(r"^data:(image/[\w.+-]+);base64,(.*)$", re.DOTALL)
+_IMAGE_CONTENT_TYPES = {
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+    ".emf": "image/emf",
+    ".wmf": "image/wmf",
+}
+IMAGE_UPLOAD_CONCURRENCY = int(os.environ.get("IMAGE_UPLOAD_CONCURRENCY", "8"))
+
+
+_REFERENCING_PART_SUFFIXES = (".xhtml", ".html", ".htm", ".xml", ".rels")
+
+
+class _MediaIndex:
+    """
+    OOXML / EPUB 容器中的图片成员索引
+
+    相对链接按引用它的部件（XHTML 章节、.rels 关系文件）所在目录解析为归档内路径；
+    找不到引用部件或解析结果不唯一时，仅当文件名在容器中唯一才按文件名回退。
+    """
+
+    def __init__(self, container: Optional[zipfile.ZipFile], extension: str):
+        media_dirs = {"docx": ("word/media/",), "pptx": ("ppt/media/",)}.get(extension)
+        self._container = container
+        self.members: Set[str] = set()
+        self._by_basename: Dict[str, List[str]] = {}
+        self._parts: List[str] = []
+        self._texts: Dict[str, str] = {}
+        for name in container.namelist() if container is not None else []:
+            suffix = Path(name).suffix.lower()
+            if suffix in _REFERENCING_PART_SUFFIXES:
+                self._parts.append(name)
+            if media_dirs and not name.startswith(media_dirs):
+                continue
+            if suffix in _IMAGE_CONTENT_TYPES:
+                self.members.add(name)
+                self._by_basename.setdefault(posixpath.basename(name), []).append(name)
+
+    def _part_text(self, part: str) -> str:
+        text = self._texts.get(part)
+        if text is None:
+            text = self._container.read(part).decode("utf-8", errors="ignore")  # type: ignore[union-attr]
+            self._texts[part] = text
+        return text
+
+    @staticmethod
+    def _base_dir(part: str) -> str:
+        # .rels 中的 Target 相对于源部件目录，而非 _rels 目录本身
+        base = posixpath.dirname(part)
+        if part.endswith(".rels") and posixpath.basename(base) == "_rels":
+            base = posixpath.dirname(base)
+        return base
+
+    def resolve(self, src: str) -> Optional[str]:
+        """把链接地址解析为容器内的图片成员路径"""
+        path = urllib.parse.unquote(src.split("#", 1)[0].split("?", 1)[0])
+        if not path:
+            return None
+        if path.startswith("/"):
+            member = posixpath.normpath(path.lstrip("/"))
+            if member in self.members:
+                return member
+        else:
+            resolved = set()
+            for part in self._parts:
+                text = self._part_text(part)
+                if src not in text and path not in text:
+                    continue
+                member = posixpath.normpath(posixpath.join(self._base_dir(part), path))
+                if member in self.members:
+                    resolved.add(member)
+            if len(resolved) == 1:
+                return resolved.pop()
+        candidates = self._by_basename.get(posixpath.basename(path), [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    def object_name(self, member: str) -> str:
+        """上传用的对象文件名；同名图片位于不同目录时加路径摘要避免互相覆盖"""
+        basename = posixpath.basename(member)
+        if len(self._by_basename.get(basename, [])) <= 1:
+            return basename
+        return f"{hashlib.sha1(member.encode('utf-8')).hexdigest()[:8]}_{basename}"
+
+
+def _upload_embedded_images(markdown_content: str, data: bytes, extension: str, document_id: str) -> str:
+    """
+    上传 DOCX / PPTX / EPUB 的内嵌图片并替换 Markdown 中的链接
+
+    转换时保留了 data URI（keep_data_uris），图片内容直接从 data URI 解码；
+    按路径引用的图片（EPUB）相对引用它的部件在 ZIP 容器中解析。图片不落盘，并发上传。
+    未能上传的 data URI 缩短为 "data:image/png;base64..."，与 MarkItDown 默认输出一致。
+    """
+    links = _IMAGE_LINK_RE.findall(markdown_content)
+    if not links:
+        return markdown_content
+
+    # 收集待上传的图片：链接地址 -> (对象文件名, 内容, content type)
+    pending: Dict[str, Tuple[str, Any, str]] = {}
+    media: Optional[_MediaIndex] = None
+    container: Optional[zipfile.ZipFile] = None
+    try:
+        for _, src, _ in links:
+            if src in pending:
+                continue
+            match = _DATA_URI_RE.match(src)
+            if match:
+                content_type = match.group(1)
+                try:
+                    blob = base64.b64decode(match.group(2))
+                except ValueError:
+                    continue
+                suffix = mimetypes.guess_extension(content_type) or ".png"
+                name = f"{hashlib.sha1(blob).hexdigest()[:16]}{suffix}"
+                pending[src] = (name, blob, content_type)
+                continue
+            if src.startswith(("http://", "https://")):
+                continue
+            if media is None:
+                try:
+                    container = zipfile.ZipFile(io.BytesIO(data))
+                except zipfile.BadZipFile:
+                    container = None
+                media = _MediaIndex(container, extension)
+            member = media.resolve(src)
+            if member and container is not None:
+                suffix = Path(member).suffix.lower()
+                pending[src] = (media.object_name(member), container.read(member), _IMAGE_CONTENT_TYPES[suffix])
+    finally:
+        if container is not None:
+            container.close()
+
+    uploaded: Dict[str, str] = {}
+    minio_client = _get_minio_client() if pending else None
+    if pending and minio_client is None:
+        logger.warning("MinIO client not available, skipping image upload")
+    elif pending:
+        bucket_name = os.environ.get("MINIO_BUCKET_NAME", "deepmed")
+        # 同一图片可能被多处引用，按对象文件名去重后并发上传
+        by_name = {name: (blob, content_type) for name, blob, content_type in pending.values()}
+        with ThreadPoolExecutor(max_workers=IMAGE_UPLOAD_CONCURRENCY, thread_name_prefix="image-upload") as executor:
+            futures = {
+                name: executor.submit(
+                    _upload_image_bytes, minio_client, bucket_name, blob, document_id, name, content_type
+                )
+                for name, (blob, content_type) in by_name.items()
+            }
+            urls = {name: future.result() for name, future in futures.items()}
+        for src, (name, _, _) in pending.items():
+            if urls.get(name):
+                uploaded[src] = urls[name]  # type: ignore[assignment]
+        logger.info(f"Uploaded {sum(1 for url in urls.values() if url)}/{len(urls)} embedded images for {document_id}")
+        metric_inc("embedded_images_uploaded_total", sum(1 for url in urls.values() if url))
+
+    def replace_image_link(match: "re.Match[str]") -> str:
+        alt_text, src, title = match.group(1), match.group(2), match.group(3)
+        if src in uploaded:
+            return f"![{alt_text}]({uploaded[src]}{title})"
+        if src.startswith("data:"):
+            return f"![{alt_text}]({src.split(',', 1)[0]}...{title})"
+        return match.group(0)
+
+    return _IMAGE_LINK_RE.sub(replace_image_link, markdown_content)
+
+
 def _allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+@app.middleware("http")
+async def drain_guard(request: Request, call_next: Callable[..., Any]) -> Response:
+    """排空期间拒绝新的转换请求（查询类 GET 请求不受影响）"""
+    if request.method == "POST" and _DRAIN.draining:
+        metric_inc("drain_rejected_total")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"success": False, "error": "服务正在下线，请重试其他实例"},
+            headers={"Retry-After": str(int(DRAIN_DELAY_SECONDS) or 1)},
+        )
+    with _DRAIN.track("requests"):
+        return await call_next(request)
+
+
 @app.get("/health")
 def health_check() -> Dict[str, object]:
     """健康检查端点"""
@@ -231,160 +777,1900 @@ def health_check() -> Dict[str, object]:
     }
 
 
-@app.post("/convert")
-def convert_document(
-    file: UploadFile = File(...),
-    document_id: Optional[str] = Form(None),
-    language: Optional[str] = Form(None)
-) -> JSONResponse:
+@app.get("/ready")
+def readiness_check() -> JSONResponse:
+    """就绪检查：排空期间返回 503（供负载均衡摘除实例）"""
+    state = "draining" if _DRAIN.draining else "ready"
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if state == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": state, **_DRAIN.stats(), "journaled_jobs": JOB_JOURNAL.pending()},
+    )
+
+
+# ---------------------------------------------------------------------------
+# 转换进程池（CONVERT_POOL_SIZE > 0 时启用）
+#
+# 每个工作进程预先创建好 MarkItDown 实例，一次只处理一个文件；
+# 转换超过该格式的超时时间时杀掉工作进程并补充新的进程，避免异常文件长期占用线程。
+# 预加载多进程模式下工作进程由主进程 fork 出的 fork 服务器创建，与主进程共享已导入的模块；
+# 其他模式下以 spawn 方式启动（重新导入本模块）。
+# ---------------------------------------------------------------------------
+
+CONVERT_POOL_SIZE = int(os.environ.get("CONVERT_POOL_SIZE", "2"))
+CONVERT_TIMEOUT_SECONDS = float(os.environ.get("CONVERT_TIMEOUT_SECONDS", "120"))
+CONVERT_WORKER_START_TIMEOUT = float(os.environ.get("CONVERT_WORKER_START_TIMEOUT_SECONDS", "120"))
+
+# 各格式的默认超时（秒），可通过 CONVERT_TIMEOUTS="xlsx=600,pptx=300" 覆盖
+_DEFAULT_CONVERT_TIMEOUTS: Dict[str, float] = {
+    "pdf": 300,
+    "xlsx": 300,
+    "xls": 300,
+    "pptx": 180,
+    "ppt": 180,
+    "epub": 180,
+    "zip": 300,
+    "mp3": 600,
+    "wav": 600,
+    "m4a": 600,
+}
+
+
+def _parse_convert_timeouts(spec: str) -> Dict[str, float]:
+    timeouts = dict(_DEFAULT_CONVERT_TIMEOUTS)
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        extension, seconds = item.split("=", 1)
+        try:
+            timeouts[extension.strip().lower().lstrip(".")] = float(seconds)
+        except ValueError:
+            logger.warning(f"Ignoring invalid CONVERT_TIMEOUTS entry: {item!r}")
+    return timeouts
+
+
+CONVERT_TIMEOUTS = _parse_convert_timeouts(os.environ.get("CONVERT_TIMEOUTS", ""))
+
+
+def _convert_timeout(extension: str) -> float:
+    return CONVERT_TIMEOUTS.get(extension, CONVERT_TIMEOUT_SECONDS)
+
+
+class ConvertTimeout(RuntimeError):
+    """转换超过该格式允许的最长时间"""
+
+
+def _run_conversion(
+    converter: MarkItDown,
+    source: "str | bytes",
+    extension: str,
+    filename: str,
+    keep_data_uris: bool = False,
+) -> str:
     """
-    转换文档为 Markdown
+    source 为文件路径时按文件转换，为 bytes 时直接走 MarkItDown 的流式接口（不落盘）
 
-    请求方式: 上传文件
-    POST /convert
-    Content-Type: multipart/form-data
-    Body: 
-        - file: 文件二进制数据
-        - document_id: (可选) 文档 ID，用于图片上传到 MinIO
-        - language: (可选) 文档语言代码（ISO 639-1），如 'zh', 'en', 'ja', 'ko', 'fr', 'ar'
+    keep_data_uris 为 True 时内嵌图片以 data URI 形式保留在 Markdown 中，供后续上传
+    """
+    if isinstance(source, bytes):
+        stream_info = StreamInfo(extension=f".{extension}", filename=filename)
+        return converter.convert_stream(
+            io.BytesIO(source), stream_info=stream_info, keep_data_uris=keep_data_uris
+        ).text_content
+    return converter.convert(source, keep_data_uris=keep_data_uris).text_content
 
-    响应:
-    {
-        "success": true,
-        "content": "markdown content...",
-        "processing_time": 1234,
-        "metadata": {...}
-    }
+
+def _convert_worker_main(index: int, conn: Any) -> None:
     """
-    start_time = time.time()
-    temp_dir = None
+    工作进程入口：复用模块导入时创建的转换器，循环处理 (source, extension, filename, keep_data_uris) 任务
 
-    try:
-        if file.filename is None or file.filename.strip() == "":
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "error": "未选择文件",
-                },
-            )
+    上报的启动时间从进程创建算起（spawn 方式包含模块导入）
+    """
+    started_at = _process_started_at(os.getpid())
+    converter = md_converter
+    conn.send(("ready", round(time.time() - started_at, 3) if started_at else None))
 
-        if not _allowed_file(file.filename):
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "error": f'不支持的文件格式。支持的格式: {", ".join(sorted(ALLOWED_EXTENSIONS))}',
-                },
-            )
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            conn.send(("done", _run_conversion(converter, *job)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
 
-        # 读取文件内容
-        file_bytes = file.file
-        file_bytes.seek(0, os.SEEK_END)
-        size = file_bytes.tell()
-        file_bytes.seek(0)
 
-        if size > MAX_FILE_SIZE:
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "error": f"文件大小超过限制（最大 {MAX_FILE_SIZE // (1024 * 1024)}MB）",
-                },
-            )
+class _ConvertWorker:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.process: Any = None
+        self.conn: Any = None
+        self.pid: Optional[int] = None
+        self.ready = False
+        self.startup_seconds: Optional[float] = None
+        self.busy_since: Optional[float] = None
+        self.extension: Optional[str] = None
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
 
-        # 创建临时目录用于保存文件和可能提取的图片
-        temp_dir = tempfile.mkdtemp()
-        filename = file.filename
-        temp_path = os.path.join(temp_dir, filename)
-        
-        with open(temp_path, "wb") as f:
-            f.write(file_bytes.read())
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class _ConvertPool:
+    """
+    预初始化的转换进程池
+
+    空闲进程放在队列中，请求取出一个进程独占使用；
+    超时或进程异常退出时杀掉该进程并在同一槽位启动新的进程。
+    """
+
+    def __init__(self, size: int) -> None:
+        # 补充进程时所在的 worker 已有多个线程，不能直接 fork；没有 fork 服务器时使用 spawn
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers = [_ConvertWorker(i) for i in range(size)]
+        self._idle: "queue.Queue[_ConvertWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+
+    def start(self) -> None:
+        self._started_at = time.time()
+        for worker in self._workers:
+            self._spawn(worker)
+            self._idle.put(worker)
+
+    def _start_process(self, worker: _ConvertWorker) -> Tuple[Any, Any]:
+        """启动工作进程，返回 (进程, 父进程一端的连接)"""
+        if _CONVERT_FORK_SERVER is not None:
+            try:
+                return _CONVERT_FORK_SERVER.launch(worker.index)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Convert fork server unavailable ({e}), spawning worker {worker.index}")
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_convert_worker_main,
+            args=(worker.index, child_conn),
+            name=f"markitdown-worker-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _spawn(self, worker: _ConvertWorker) -> None:
+        process, parent_conn = self._start_process(worker)
+        with self._lock:
+            worker.process = process
+            worker.conn = parent_conn
+            worker.pid = process.pid
+            worker.ready = False
+            worker.startup_seconds = None
+        logger.info(f"Started convert worker {worker.index} (pid={process.pid})")
+
+    def _replace(self, worker: _ConvertWorker) -> None:
+        """
+        杀掉工作进程并在同一槽位启动新进程
+
+        只在摘下旧进程时持有 self._lock，回收（最长 5 秒）和启动新进程都在锁外进行，
+        不阻塞其他请求取用空闲进程和 stats()
+        """
+        with self._lock:
+            process, conn = worker.process, worker.conn
+            worker.process = None
+            worker.conn = None
+            worker.ready = False
+            worker.restarts += 1
+        metric_inc("convert_worker_restarts_total")
+        if process is not None and process.is_alive():
+            process.kill()
+        if process is not None:
+            process.join(5)
+        if conn is not None:
+            conn.close()
+        self._spawn(worker)
+
+    def _replace_and_release(self, worker: _ConvertWorker) -> None:
+        """后台线程：补充好进程后把槽位放回空闲队列（启动失败时由下一次取用时重试）"""
+        try:
+            self._replace(worker)
+        except Exception as e:
+            logger.error(f"Failed to restart convert worker {worker.index}: {e}")
+        finally:
+            self._idle.put(worker)
+
+    def _await_ready(self, worker: _ConvertWorker) -> None:
+        """等待新启动的工作进程完成初始化（不计入转换超时）"""
+        if worker.ready:
+            return
+        if worker.conn.poll(CONVERT_WORKER_START_TIMEOUT):
+            kind, payload = worker.conn.recv()
+            if kind == "ready":
+                worker.ready = True
+                worker.startup_seconds = payload
+                return
+        raise RuntimeError(f"转换进程 {worker.index} 启动失败")
+
+    def convert(self, source: "str | bytes", extension: str, filename: str, keep_data_uris: bool = False) -> str:
+        """在工作进程中转换文件路径或内存中的文件内容，返回 Markdown 文本"""
+        wait_started = time.time()
+        worker = self._idle.get()
+        metric_observe("convert_pool_wait_seconds", time.time() - wait_started)
 
+        timeout = _convert_timeout(extension)
+        started = time.time()
+        replace = False
         try:
-            # 转换文档
-            result = md_converter.convert(temp_path)
-            markdown_content = result.text_content
-            
-            # 处理图片：上传到 MinIO 并更新链接
-            if document_id:
-                logger.info(f"Processing images for document_id: {document_id}")
-                markdown_content = _extract_and_upload_images(
-                    markdown_content,
-                    temp_dir,
-                    document_id
+            # 空闲期间退出的进程先补上，不让本次请求失败
+            if not worker.alive():
+                logger.warning(f"Convert worker {worker.index} exited while idle, restarting")
+                self._replace(worker)
+            try:
+                self._await_ready(worker)
+            except (EOFError, OSError, RuntimeError):
+                replace = True
+                raise RuntimeError(f"转换进程 {worker.index} 启动失败")
+
+            started = time.time()
+            with self._lock:
+                worker.busy_since = started
+                worker.extension = extension
+            try:
+                worker.conn.send((source, extension, filename, keep_data_uris))
+                message = worker.conn.recv() if worker.conn.poll(timeout) else None
+            except (EOFError, OSError):
+                replace = True
+                worker.failed += 1
+                exitcode = worker.process.exitcode if worker.process is not None else None
+                raise RuntimeError(f"转换进程 {worker.index} 异常退出（exit code {exitcode}）")
+
+            if message is None:
+                replace = True
+                worker.timeouts += 1
+                metric_inc("convert_timeouts_total")
+                metric_inc(f"convert_timeouts_total_{extension}")
+                logger.warning(
+                    f"Conversion of {filename} exceeded {timeout:g}s, "
+                    f"killing worker {worker.index} (pid={worker.pid})"
                 )
-            
-            processing_time = int((time.time() - start_time) * 1000)
+                raise ConvertTimeout(f"转换超时（{extension} 格式最长 {timeout:g} 秒）")
 
-            return JSONResponse(
-                content={
-                    "success": True,
-                    "content": markdown_content,
-                    "processing_time": processing_time,
-                    "metadata": {
-                        "filename": filename,
-                        "size": os.path.getsize(temp_path),
-                        "document_id": document_id,
-                        "language": language,  # 记录语言参数（即使 MarkItDown 库可能不使用）
-                    },
-                }
-            )
+            kind, payload = message
+            if kind == "error":
+                worker.failed += 1
+                raise RuntimeError(payload)
+            worker.completed += 1
+            return payload
         finally:
-            # 清理临时目录
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            with self._lock:
+                worker.busy_seconds += time.time() - started
+                worker.busy_since = None
+                worker.extension = None
+            if replace:
+                threading.Thread(
+                    target=self._replace_and_release,
+                    args=(worker,),
+                    name=f"convert-worker-{worker.index}-restart",
+                    daemon=True,
+                ).start()
+            else:
+                self._idle.put(worker)
 
-    except Exception as e:
-        processing_time = int((time.time() - start_time) * 1000)
-        
-        # 清理临时目录
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
-        
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={
-                "success": False,
-                "error": str(e),
-                "processing_time": processing_time,
-            },
-        )
+    def stop(self, timeout: float = 5.0) -> None:
+        for worker in self._workers:
+            if worker.alive():
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
 
+    def stats(self) -> List[Dict[str, object]]:
+        now = time.time()
+        uptime = max(now - self._started_at, 1e-6)
+        with self._lock:
+            return [
+                {
+                    "index": w.index,
+                    "pid": w.pid,
+                    "alive": w.alive(),
+                    "ready": w.ready,
+                    "startup_seconds": w.startup_seconds,
+                    "memory": _process_memory(w.pid) if w.pid and w.alive() else {},
+                    "busy": w.busy_since is not None,
+                    "current_extension": w.extension,
+                    "current_seconds": round(now - w.busy_since, 3) if w.busy_since else None,
+                    "completed": w.completed,
+                    "failed": w.failed,
+                    "timeouts": w.timeouts,
+                    "restarts": w.restarts,
+                    "busy_seconds": round(w.busy_seconds, 3),
+                    "utilization": round(min(w.busy_seconds / uptime, 1.0), 4),
+                }
+                for w in self._workers
+            ]
 
-@app.get("/formats")
-def supported_formats() -> Dict[str, object]:
-    """返回支持的文件格式列表"""
-    return {
-        "formats": sorted(list(ALLOWED_EXTENSIONS)),
-        "max_file_size": MAX_FILE_SIZE,
-        "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024),
-    }
 
+# 在 lifespan 启动阶段创建（工作进程 import 本模块时不会启动新的进程池）
+CONVERT_POOL: Optional[_ConvertPool] = None
 
-def _resolve_reload(app_env: str) -> bool:
-    """根据环境变量决定是否启用 reload"""
-    default_reload = app_env != "production"
-    reload_env = os.environ.get("UVICORN_RELOAD", "").lower()
-    if reload_env:
-        return reload_env in {"1", "true", "yes", "on"}
-    return default_reload
 
+def _start_convert_pool() -> None:
+    global CONVERT_POOL
 
-if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5000))
-    host = os.environ.get("HOST", "0.0.0.0")
-    workers = int(os.environ.get("UVICORN_WORKERS", "1"))
-    reload_enabled = _resolve_reload(APP_ENV)
-    log_level = os.environ.get("UVICORN_LOG_LEVEL", "info")
+    if CONVERT_POOL_SIZE <= 0 or CONVERT_POOL is not None:
+        return
+    CONVERT_POOL = _ConvertPool(CONVERT_POOL_SIZE)
+    CONVERT_POOL.start()
+    logger.info(f"Convert pool enabled with {CONVERT_POOL_SIZE} worker processes")
 
-    if reload_enabled:
-        workers = 1  # Uvicorn reload 模式仅支持单进程
 
-    logger.info(f"Starting MarkItDown API Server on port {port}...")
-    logger.info(f"Environment: {APP_ENV}")
-    logger.info(f"Uvicorn workers: {workers}")
-    logger.info(f"Reload enabled: {reload_enabled}")
+def _stop_convert_pool() -> None:
+    global CONVERT_POOL
+
+    if CONVERT_POOL is not None:
+        CONVERT_POOL.stop()
+        CONVERT_POOL = None
+
+
+def _convert_file(source: "str | bytes", extension: str, filename: str, keep_data_uris: bool = False) -> str:
+    """转换文件为 Markdown：启用进程池时交给工作进程，否则在当前线程中转换"""
+    started = time.time()
+    try:
+        if CONVERT_POOL is not None:
+            return CONVERT_POOL.convert(source, extension, filename, keep_data_uris)
+        return _run_conversion(md_converter, source, extension, filename, keep_data_uris)
+    finally:
+        metric_observe(f"convert_seconds_{extension}", time.time() - started)
+
+
+@dataclass
+class _ConvertOutcome:
+    """一次文档转换的产物（可被合并的请求共享）"""
+    work_dir: Optional[str]  # 内存转换路径没有临时目录
+    file_path: Optional[str]
+    markdown: str
+    size: int
+    conversion_path: str  # "stream"（内存流）或 "file"（临时文件）
+
+
+def _cleanup_convert_outcome(outcome: _ConvertOutcome) -> None:
+    if outcome.work_dir:
+        SCRATCH.release(outcome.work_dir)
+
+
+# 小于该大小且不需要提取图片的上传直接在内存中转换，不写临时文件
+STREAM_CONVERT_MAX_BYTES = int(os.environ.get("STREAM_CONVERT_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# 带 document_id 时仍走临时文件路径、在临时目录中查找图片的格式
+_IMAGE_BEARING_EXTENSIONS = {
+    "pdf", "doc", "ppt", "xlsx", "xls", "zip",
+    "jpg", "jpeg", "png", "gif", "bmp",
+}
+# 内嵌图片直接从 ZIP 容器（OOXML / EPUB）中读取并上传的格式
+_EMBEDDED_IMAGE_EXTENSIONS = {"docx", "pptx", "epub"}
+
+
+def _conversion_path(extension: str, size: int, document_id: Optional[str]) -> str:
+    """选择转换路径：没有 document_id（不上传图片）或格式不含图片时走内存流"""
+    if size > STREAM_CONVERT_MAX_BYTES:
+        return "file"
+    if document_id and extension in _IMAGE_BEARING_EXTENSIONS:
+        return "file"
+    return "stream"
+
+
+def _convert_in_memory(filename: str, data: bytes, keep_data_uris: bool = False) -> _ConvertOutcome:
+    """直接把上传内容交给 MarkItDown 的流式接口转换；失败时退回临时文件路径"""
+    extension = filename.rsplit(".", 1)[1].lower()
+    try:
+        markdown = _convert_file(data, extension, filename, keep_data_uris)
+    except ConvertTimeout:
+        raise
+    except Exception as e:
+        # 部分转换器依赖文件路径或扩展名推断，流式转换失败时按原方式再试一次
+        logger.warning(f"Stream conversion of {filename} failed ({e}), falling back to temp file")
+        metric_inc("convert_stream_fallback_total")
+        return _convert_upload(filename, data, keep_data_uris)
+    return _ConvertOutcome(
+        work_dir=None,
+        file_path=None,
+        markdown=markdown,
+        size=len(data),
+        conversion_path="stream",
+    )
+
+
+# 相同内容 + 相同参数的并发转换请求合并为一次
+_CONVERT_FLIGHTS = SingleFlight("convert", cleanup=_cleanup_convert_outcome)
+
+
+# ---------------------------------------------------------------------------
+# 大文件快速转换（csv / tsv / json / txt / xlsx）
+#
+# 逐行读取并增量生成 Markdown，不把整个表格载入内存；支持行数 / 工作表数限制和分块输出。
+# ---------------------------------------------------------------------------
+
+# 不小于该大小的表格 / 文本文件走快速转换（小文件仍由 MarkItDown 转换，输出保持一致）
+FAST_CONVERT_MIN_BYTES = int(os.environ.get("FAST_CONVERT_MIN_BYTES", str(4 * 1024 * 1024)))
+FAST_CONVERT_CHUNK_BYTES = int(os.environ.get("FAST_CONVERT_CHUNK_BYTES", str(64 * 1024)))
+_FAST_EXTENSIONS = {"csv", "tsv", "json", "txt", "xlsx"}
+# 每处理这么多行检查一次超时
+_FAST_DEADLINE_CHECK_ROWS = 5000
+
+
+@dataclass
+class _FastConvertStats:
+    """快速转换过程中的统计信息（生成器结束后可读）"""
+    rows: int = 0
+    sheets: int = 0
+    truncated: bool = False
+
+
+def _use_fast_path(extension: str, size: int, max_rows: Optional[int], max_sheets: Optional[int]) -> bool:
+    if extension not in _FAST_EXTENSIONS:
+        return False
+    # MarkItDown 没有 tsv 转换器，tsv 总是按表格处理
+    return extension == "tsv" or size >= FAST_CONVERT_MIN_BYTES or bool(max_rows) or bool(max_sheets)
+
+
+def _detect_encoding(stream: Any) -> str:
+    """根据文件开头的内容判断文本编码（非 UTF-8 时使用 charset_normalizer 检测）"""
+    sample = stream.read(64 * 1024)
+    stream.seek(0)
+    try:
+        sample.decode("utf-8")
+        return "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # 采样末尾截断的多字节字符不算错误
+        if e.start >= len(sample) - 3 and e.reason == "unexpected end of data":
+            return "utf-8-sig"
+    try:
+        from charset_normalizer import from_bytes  # type: ignore
+        detected = from_bytes(sample).best()
+        if detected is not None:
+            return detected.encoding
+    except ImportError:
+        pass
+    return "utf-8"
+
+
+def _check_deadline(stats: _FastConvertStats, deadline: float) -> None:
+    if stats.rows % _FAST_DEADLINE_CHECK_ROWS == 0 and time.time() > deadline:
+        raise ConvertTimeout(f"转换超时（已处理 {stats.rows} 行）")
+
+
+def _escape_cell(value: object) -> str:
+    if value is None:
+        return ""
+    text = str(value)
+    return text.replace("|", "\\|").replace("\r\n", " ").replace("\n", " ").replace("\r", " ")
+
+
+def _markdown_table(
+    rows: Iterator[List[object]],
+    stats: _FastConvertStats,
+    max_rows: Optional[int],
+    deadline: float,
+) -> Iterator[str]:
+    """将行迭代器转换为 Markdown 表格行，首个非空行作为表头，较短的行补齐到表头宽度"""
+    width = 0
+    emitted = 0
+    for row in rows:
+        if width == 0:
+            if not any(cell not in (None, "") for cell in row):
+                continue
+            width = len(row)
+            yield "| " + " | ".join(_escape_cell(cell) for cell in row) + " |\n"
+            yield "| " + " | ".join(["---"] * width) + " |\n"
+            continue
+        if not row:
+            continue
+        if max_rows and emitted >= max_rows:
+            stats.truncated = True
+            return
+        cells = [_escape_cell(cell) for cell in row]
+        if len(cells) < width:
+            cells.extend([""] * (width - len(cells)))
+        yield "| " + " | ".join(cells) + " |\n"
+        emitted += 1
+        stats.rows += 1
+        _check_deadline(stats, deadline)
+
+
+def _fast_delimited(stream: Any, delimiter: str, stats: _FastConvertStats, max_rows: Optional[int], deadline: float) -> Iterator[str]:
+    text = io.TextIOWrapper(stream, encoding=_detect_encoding(stream), errors="replace", newline="")
+    try:
+        yield from _markdown_table(csv.reader(text, delimiter=delimiter), stats, max_rows, deadline)
+    finally:
+        text.detach()
+
+
+def _fast_text(stream: Any, stats: _FastConvertStats, max_rows: Optional[int], deadline: float) -> Iterator[str]:
+    """纯文本 / JSON 原样输出（与 MarkItDown 一致），txt 支持按行数截断"""
+    text = io.TextIOWrapper(stream, encoding=_detect_encoding(stream), errors="replace", newline="")
+    try:
+        for line in text:
+            if max_rows and stats.rows >= max_rows:
+                stats.truncated = True
+                return
+            yield line
+            stats.rows += 1
+            _check_deadline(stats, deadline)
+    finally:
+        text.detach()
+
+
+def _fast_xlsx(
+    stream: Any,
+    stats: _FastConvertStats,
+    max_rows: Optional[int],
+    max_sheets: Optional[int],
+    deadline: float,
+) -> Iterator[str]:
+    """read_only 模式逐行读取工作表，每个工作表输出 "## 表名" 和一个表格"""
+    from openpyxl import load_workbook  # type: ignore
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            if max_sheets and stats.sheets >= max_sheets:
+                stats.truncated = True
+                return
+            stats.sheets += 1
+            yield f"## {sheet.title}\n"
+            sheet_stats = _FastConvertStats()
+            yield from _markdown_table(
+                (list(row) for row in sheet.iter_rows(values_only=True)), sheet_stats, max_rows, deadline
+            )
+            stats.rows += sheet_stats.rows
+            stats.truncated = stats.truncated or sheet_stats.truncated
+            yield "\n"
+    finally:
+        workbook.close()
+
+
+def _fast_convert(
+    stream: Any,
+    extension: str,
+    stats: _FastConvertStats,
+    max_rows: Optional[int] = None,
+    max_sheets: Optional[int] = None,
+) -> Iterator[str]:
+    """快速转换入口，按 FAST_CONVERT_CHUNK_BYTES 分块产出 Markdown"""
+    deadline = time.time() + _convert_timeout(extension)
+    if extension == "xlsx":
+        pieces = _fast_xlsx(stream, stats, max_rows, max_sheets, deadline)
+    elif extension in ("csv", "tsv"):
+        pieces = _fast_delimited(stream, "\t" if extension == "tsv" else ",", stats, max_rows, deadline)
+    else:
+        pieces = _fast_text(stream, stats, max_rows if extension == "txt" else None, deadline)
+
+    started = time.time()
+    buffer: List[str] = []
+    buffered = 0
+    try:
+        for piece in pieces:
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= FAST_CONVERT_CHUNK_BYTES:
+                yield "".join(buffer)
+                buffer, buffered = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        metric_observe(f"convert_seconds_{extension}", time.time() - started)
+        metric_inc("convert_path_fast_total")
+
+
+# ---------------------------------------------------------------------------
+# PDF 路由：MarkItDown（文本层提取）或 MinerU（版面分析 / OCR）
+#
+# pdf_backend=auto 时先用 pdfminer 抽样解析少量页面（不做版面分析），根据文本密度、
+# 图片覆盖率、表格线和公式字符判断：文本层完整的简单 PDF 留在 MarkItDown，
+# 扫描件和版面复杂的 PDF 交给 MinerU。
+# ---------------------------------------------------------------------------
+
+# PDF 默认使用的解析服务：markitdown、mineru 或 auto（mineru / auto 需要配置 MINERU_URL）
+PDF_BACKEND = os.environ.get("PDF_BACKEND", "markitdown").lower()
+MINERU_URL = os.environ.get("MINERU_URL", "").rstrip("/")
+# 等待 MinerU 返回的超时（秒）：MinerU 按页数自适应的超时上限 MINERU_TIMEOUT_MAX_SECONDS 默认 7200，
+# 再留出排队和图片上传的余量；不能用 MarkItDown 自身的 PDF 转换超时，否则大文档在 MinerU 完成前就被放弃
+MINERU_TIMEOUT = float(os.environ.get("MINERU_TIMEOUT", "7500"))
+MINERU_CONNECT_TIMEOUT = float(os.environ.get("MINERU_CONNECT_TIMEOUT", "10"))
+_PDF_BACKENDS = ("markitdown", "mineru", "auto")
+
+TRIAGE_SAMPLE_PAGES = int(os.environ.get("TRIAGE_SAMPLE_PAGES", "6"))
+# 平均每页字符数低于该值视为扫描件（没有可用文本层）
+TRIAGE_MIN_CHARS_PER_PAGE = float(os.environ.get("TRIAGE_MIN_CHARS_PER_PAGE", "200"))
+TRIAGE_MAX_IMAGE_COVERAGE = float(os.environ.get("TRIAGE_MAX_IMAGE_COVERAGE", "0.5"))
+TRIAGE_MAX_GARBLED_RATIO = float(os.environ.get("TRIAGE_MAX_GARBLED_RATIO", "0.05"))
+TRIAGE_MAX_MATH_RATIO = float(os.environ.get("TRIAGE_MAX_MATH_RATIO", "0.02"))
+TRIAGE_MAX_RULES_PER_PAGE = float(os.environ.get("TRIAGE_MAX_RULES_PER_PAGE", "40"))
+# 页数超过该值的 PDF 不因表格 / 公式送往 MinerU（MinerU 的耗时随页数线性增长，0 表示不限制）
+TRIAGE_MINERU_MAX_PAGES = int(os.environ.get("TRIAGE_MINERU_MAX_PAGES", "0"))
+
+# 与前端 src/constants/language.ts 中的 MINERU_LANGUAGE_MAPPING 保持一致
+_MINERU_LANGUAGE_MAPPING = {
+    "zh": "ch",
+    "en": "en",
+    "ja": "japan",
+    "ko": "korean",
+    "fr": "en",
+    "ar": "en",
+}
+
+_MATH_FONT_RE = re.compile(r"CMMI|CMSY|CMEX|MSAM|MSBM|Math|Symbol|STIX|Euclid|MTExtra", re.IGNORECASE)
+
+
+def _is_math_char(char: str) -> bool:
+    """数学运算符和数学符号区块中的字符；希腊字母不计入（希腊语正文），数学字体中的希腊字母由字体名判断"""
+    code = ord(char[0]) if char else 0
+    return (
+        0x2200 <= code <= 0x22FF  # 数学运算符
+        or 0x27C0 <= code <= 0x27EF
+        or 0x2980 <= code <= 0x2AFF
+        or 0x1D400 <= code <= 0x1D7FF  # 数学字母数字符号
+    )
+
+
+def _pdf_page_count(document: Any) -> int:
+    """从页面树根节点的 /Count 读取页数；缺失时逐页计数（不保留页面对象）"""
+    from pdfminer.pdfpage import PDFPage  # type: ignore
+    from pdfminer.pdftypes import resolve1  # type: ignore
+
+    try:
+        count = resolve1(resolve1(document.catalog["Pages"]).get("Count"))
+        if isinstance(count, int) and count >= 0:
+            return count
+    except Exception:
+        pass
+    return sum(1 for _ in PDFPage.create_pages(document))
+
+
+def _sample_pages(page_count: int, samples: int) -> List[int]:
+    """在整个文档中均匀抽取页码（包含首页和末页）"""
+    if page_count <= samples:
+        return list(range(page_count))
+    if samples <= 1:
+        return [0]
+    return sorted({round(i * (page_count - 1) / (samples - 1)) for i in range(samples)})
+
+
+def _triage_pdf(data: bytes) -> Dict[str, object]:
+    """分析 PDF 并给出解析服务建议：{"backend", "reason", "features"}"""
+    from pdfminer.converter import PDFPageAggregator  # type: ignore
+    from pdfminer.layout import LTChar, LTContainer, LTCurve, LTImage  # type: ignore
+    from pdfminer.pdfdocument import PDFDocument  # type: ignore
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager  # type: ignore
+    from pdfminer.pdfpage import PDFPage  # type: ignore
+    from pdfminer.pdfparser import PDFParser  # type: ignore
+
+    started = time.time()
+    try:
+        document = PDFDocument(PDFParser(io.BytesIO(data)))
+        page_count = _pdf_page_count(document)
+    except Exception as e:
+        # pdfminer 无法解析时交给 MinerU（基于 pdfium，容错更好）
+        return {
+            "backend": "mineru",
+            "reason": "unparseable",
+            "features": {"error": f"{type(e).__name__}: {e}"},
+            "triage_ms": int((time.time() - started) * 1000),
+        }
+
+    resources = PDFResourceManager(caching=True)
+    # laparams=None：只收集字符和图形对象，跳过耗时的版面分析
+    device = PDFPageAggregator(resources, laparams=None)
+    interpreter = PDFPageInterpreter(resources, device)
+
+    sampled = _sample_pages(page_count, TRIAGE_SAMPLE_PAGES)
+    wanted = set(sampled)
+    # 逐页遍历页面树，只解析抽样页，读到最后一个抽样页即停止
+    pages = enumerate(itertools.islice(PDFPage.create_pages(document), sampled[-1] + 1 if sampled else 0))
+    chars = garbled = math = rules = 0
+    coverage = 0.0
+    while True:
+        try:
+            index, page = next(pages)
+        except StopIteration:
+            break
+        except Exception as e:
+            logger.warning(f"Triage failed to walk the page tree: {e}")
+            break
+        if index not in wanted:
+            continue
+        try:
+            interpreter.process_page(page)
+        except Exception as e:
+            logger.warning(f"Triage failed to read page {index + 1}: {e}")
+            continue
+        layout = device.get_result()
+        page_area = max(layout.width * layout.height, 1.0)
+        image_area = 0.0
+        stack = list(layout)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, LTChar):
+                text = item.get_text()
+                chars += 1
+                if text.startswith("(cid:") or text == "�":
+                    garbled += 1
+                elif _is_math_char(text) or (text.isalnum() and _MATH_FONT_RE.search(item.fontname)):
+                    # 数学字体中的标点（如目录的引导点）不计入
+                    math += 1
+            elif isinstance(item, LTImage):
+                image_area += max(item.width, 0) * max(item.height, 0)
+            elif isinstance(item, LTCurve):  # LTLine / LTRect 都是 LTCurve 的子类
+                rules += 1
+            if isinstance(item, LTContainer):
+                stack.extend(item)
+        coverage += min(image_area / page_area, 1.0)
+
+    sampled_count = max(len(sampled), 1)
+    features: Dict[str, object] = {
+        "page_count": page_count,
+        "sampled_pages": len(sampled),
+        "chars_per_page": round(chars / sampled_count, 1),
+        "image_coverage": round(coverage / sampled_count, 3),
+        "garbled_ratio": round(garbled / chars, 4) if chars else 0.0,
+        "math_ratio": round(math / chars, 4) if chars else 0.0,
+        "rules_per_page": round(rules / sampled_count, 1),
+    }
+
+    if features["chars_per_page"] < TRIAGE_MIN_CHARS_PER_PAGE:  # type: ignore[operator]
+        backend, reason = "mineru", "scanned"
+    elif features["garbled_ratio"] > TRIAGE_MAX_GARBLED_RATIO:  # type: ignore[operator]
+        backend, reason = "mineru", "garbled_text_layer"
+    elif features["image_coverage"] > TRIAGE_MAX_IMAGE_COVERAGE:  # type: ignore[operator]
+        backend, reason = "mineru", "image_heavy"
+    elif features["math_ratio"] > TRIAGE_MAX_MATH_RATIO:  # type: ignore[operator]
+        backend, reason = "mineru", "formulas"
+    elif features["rules_per_page"] > TRIAGE_MAX_RULES_PER_PAGE:  # type: ignore[operator]
+        backend, reason = "mineru", "tables"
+    else:
+        backend, reason = "markitdown", "born_digital"
+
+    if (
+        backend == "mineru"
+        and reason in ("formulas", "tables")
+        and TRIAGE_MINERU_MAX_PAGES
+        and page_count > TRIAGE_MINERU_MAX_PAGES
+    ):
+        backend, reason = "markitdown", f"{reason}_but_too_many_pages"
+
+    elapsed = time.time() - started
+    metric_observe("triage_seconds", elapsed)
+    metric_inc(f"triage_routed_{backend}_total")
+    return {"backend": backend, "reason": reason, "features": features, "triage_ms": int(elapsed * 1000)}
+
+
+def _resolve_pdf_backend(data: bytes, pdf_backend: str) -> Tuple[str, Optional[Dict[str, object]]]:
+    """返回 (实际使用的解析服务, 分诊结果)；非 auto 模式不做分诊"""
+    if pdf_backend != "auto":
+        return pdf_backend, None
+    triage = _triage_pdf(data)
+    return str(triage["backend"]), triage
+
+
+def _convert_pdf_with_mineru(
+    name: str, data: bytes, language: Optional[str], document_id: Optional[str] = None
+) -> str:
+    """调用 MinerU 服务解析 PDF，返回 Markdown（图片由 MinerU 上传到 document_id 下）"""
+    form: Dict[str, str] = {}
+    if language:
+        form["lang"] = _MINERU_LANGUAGE_MAPPING.get(language.lower().split("-")[0], "en")
+    if document_id:
+        form["document_id"] = document_id
+    try:
+        response = requests.post(
+            f"{MINERU_URL}/v4/extract/task",
+            files={"file": (os.path.basename(name), data, "application/pdf")},
+            data=form,
+            timeout=(MINERU_CONNECT_TIMEOUT, MINERU_TIMEOUT),
+        )
+    except requests.RequestException as e:
+        raise RuntimeError(f"MinerU 解析失败: {e}") from e
+    # 网关错误、超时页等响应不一定是 JSON，先看状态码再解析
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        body = {}
+    if response.status_code != 200 or body.get("code") != "success":
+        message = body.get("message") or body.get("error") or response.text[:200] or response.reason
+        raise RuntimeError(f"MinerU 解析失败（HTTP {response.status_code}）: {message}")
+    extracted = (body.get("data") or {}).get("extracted")
+    if not isinstance(extracted, str):
+        raise RuntimeError("MinerU 解析失败: 响应中缺少 data.extracted")
+    return extracted
+
+
+# ---------------------------------------------------------------------------
+# ZIP 压缩包逐成员转换
+#
+# 先按压缩炸弹限制（成员数、解压总大小、压缩比）检查整个压缩包，
+# 再并发转换各成员（经由转换进程池），PDF 成员按 pdf_backend 交给 MarkItDown 或 MinerU 解析。
+# ---------------------------------------------------------------------------
+
+ZIP_MAX_MEMBERS = int(os.environ.get("ZIP_MAX_MEMBERS", "1000"))
+ZIP_MAX_TOTAL_BYTES = int(os.environ.get("ZIP_MAX_TOTAL_BYTES", str(1024 * 1024 * 1024)))
+ZIP_MAX_MEMBER_BYTES = int(os.environ.get("ZIP_MAX_MEMBER_BYTES", str(MAX_FILE_SIZE)))
+ZIP_MAX_COMPRESSION_RATIO = float(os.environ.get("ZIP_MAX_COMPRESSION_RATIO", "100"))
+ZIP_CONCURRENCY = int(os.environ.get("ZIP_CONCURRENCY", str(max(CONVERT_POOL_SIZE, 4))))
+
+
+class ZipRejected(ValueError):
+    """压缩包超出安全限制（疑似压缩炸弹）或无法读取"""
+
+
+@dataclass
+class _ZipPlan:
+    archive: zipfile.ZipFile
+    members: List[Tuple[zipfile.ZipInfo, str]]  # (成员, 解码后的文件名)
+    skipped: List[Dict[str, object]]
+
+
+def _zip_member_name(info: zipfile.ZipInfo) -> str:
+    """未标记 UTF-8 的文件名按 cp437 解码，中文 Windows 打包的文件名实际是 GBK"""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("gbk")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def _open_zip(stream: Any) -> _ZipPlan:
+    """打开压缩包并检查安全限制，挑选可转换的成员"""
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as e:
+        raise ZipRejected(f"无法读取 ZIP 文件: {e}")
+
+    infos = [info for info in archive.infolist() if not info.is_dir()]
+    if len(infos) > ZIP_MAX_MEMBERS:
+        raise ZipRejected(f"压缩包成员数 {len(infos)} 超过限制 {ZIP_MAX_MEMBERS}")
+    total = sum(info.file_size for info in infos)
+    if total > ZIP_MAX_TOTAL_BYTES:
+        raise ZipRejected(f"压缩包解压后大小 {total} 字节超过限制 {ZIP_MAX_TOTAL_BYTES}")
+    compressed = sum(info.compress_size for info in infos)
+    if compressed and total > 1024 * 1024 and total / compressed > ZIP_MAX_COMPRESSION_RATIO:
+        raise ZipRejected(f"压缩包压缩比 {total / compressed:.0f} 超过限制 {ZIP_MAX_COMPRESSION_RATIO:g}")
+
+    members: List[Tuple[zipfile.ZipInfo, str]] = []
+    skipped: List[Dict[str, object]] = []
+    for info in infos:
+        name = _zip_member_name(info)
+        basename = os.path.basename(name)
+        if name.startswith("__MACOSX/") or basename.startswith("."):
+            continue
+        reason = None
+        if info.flag_bits & 0x1:
+            reason = "加密的成员"
+        elif not _allowed_file(basename) or basename.rsplit(".", 1)[1].lower() == "zip":
+            reason = "不支持的文件格式"
+        elif info.file_size > ZIP_MAX_MEMBER_BYTES:
+            reason = f"文件大小超过限制（{ZIP_MAX_MEMBER_BYTES} 字节）"
+        elif (
+            info.compress_size
+            and info.file_size > 1024 * 1024
+            and info.file_size / info.compress_size > ZIP_MAX_COMPRESSION_RATIO
+        ):
+            reason = f"压缩比超过限制（{ZIP_MAX_COMPRESSION_RATIO:g}）"
+        if reason:
+            skipped.append({"name": name, "size": info.file_size, "status": "skipped", "error": reason})
+        else:
+            members.append((info, name))
+    return _ZipPlan(archive=archive, members=members, skipped=skipped)
+
+
+def _convert_zip_member(
+    plan: _ZipPlan,
+    info: zipfile.ZipInfo,
+    name: str,
+    pdf_backend: str,
+    language: Optional[str],
+    document_id: Optional[str] = None,
+) -> Dict[str, object]:
+    """转换单个成员，失败不影响其他成员；带 document_id 时成员中的图片与单文件转换一样上传到该文档下"""
+    started = time.time()
+    basename = os.path.basename(name)
+    extension = basename.rsplit(".", 1)[1].lower()
+    result: Dict[str, object] = {"name": name, "size": info.file_size}
+    try:
+        # ZipFile 对共享文件对象的读取有内部锁，可在多个线程中同时读取不同成员
+        data = plan.archive.read(info)
+        backend = pdf_backend
+        if extension == "pdf":
+            backend, triage = _resolve_pdf_backend(data, pdf_backend)
+            result["pdf_backend"] = backend
+            if triage is not None:
+                result["triage"] = triage
+        if extension == "pdf" and backend == "mineru":
+            markdown, path = _convert_pdf_with_mineru(name, data, language, document_id), "mineru"
+        elif _use_fast_path(extension, len(data), None, None):
+            markdown, path = "".join(_fast_convert(io.BytesIO(data), extension, _FastConvertStats())), "fast"
+        elif document_id and extension in _EMBEDDED_IMAGE_EXTENSIONS:
+            markdown = _convert_file(data, extension, basename, keep_data_uris=True)
+            markdown, path = _upload_embedded_images(markdown, data, extension, document_id), "stream"
+        elif document_id and extension in _IMAGE_BEARING_EXTENSIONS:
+            outcome = _convert_upload(basename, data)
+            try:
+                markdown = _extract_and_upload_images(outcome.markdown, outcome.work_dir, document_id)  # type: ignore[arg-type]
+            finally:
+                _cleanup_convert_outcome(outcome)
+            path = "file"
+        else:
+            markdown, path = _convert_file(data, extension, basename), "stream"
+        result.update({"status": "completed", "content": markdown, "conversion_path": path})
+    except Exception as e:
+        logger.warning(f"Failed to convert zip member {name}: {e}")
+        metric_inc("zip_member_failures_total")
+        result.update({"status": "failed", "error": str(e)})
+    elapsed = time.time() - started
+    result["processing_time"] = int(elapsed * 1000)
+    metric_inc("zip_members_total")
+    metric_observe("zip_member_seconds", elapsed)
+    return result
+
+
+def _iter_zip_results(
+    plan: _ZipPlan, pdf_backend: str, language: Optional[str], document_id: Optional[str] = None
+) -> Iterator[Dict[str, object]]:
+    """并发转换所有成员，按完成顺序产出每个成员的结果（跳过的成员最先产出）"""
+    yield from plan.skipped
+    executor = ThreadPoolExecutor(max_workers=ZIP_CONCURRENCY, thread_name_prefix="zip-member")
+    try:
+        futures = [
+            executor.submit(_convert_zip_member, plan, info, name, pdf_backend, language, document_id)
+            for info, name in plan.members
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # 客户端中途断开时取消尚未开始的成员
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _zip_summary(results: List[Dict[str, object]]) -> Dict[str, int]:
+    counts = {"members": len(results), "completed": 0, "failed": 0, "skipped": 0}
+    for result in results:
+        counts[str(result["status"])] += 1
+    return counts
+
+
+def _convert_zip(
+    filename: str,
+    data: bytes,
+    document_id: Optional[str],
+    language: Optional[str],
+    start_time: float,
+    pdf_backend: str,
+) -> Dict[str, object]:
+    """逐成员转换压缩包，content 与 MarkItDown 的 ZIP 输出格式一致，metadata.members 给出每个成员的结果"""
+    plan = _open_zip(io.BytesIO(data))
+    order = {name: index for index, (_, name) in enumerate(plan.members)}
+    results = list(_iter_zip_results(plan, pdf_backend, language, document_id))
+
+    completed = sorted(
+        (r for r in results if r["status"] == "completed"), key=lambda r: order[str(r["name"])]
+    )
+    parts = [f"Content from the zip file `{filename}`:\n\n"]
+    for result in completed:
+        parts.append(f"## File: {result['name']}\n\n{result['content']}\n\n")
+    content = "".join(parts)
+
+    members = [{key: value for key, value in r.items() if key != "content"} for r in results]
+    for member, result in zip(members, results):
+        if "content" in result:
+            member["content_length"] = len(str(result["content"]))
+
+    return {
+        "success": True,
+        "content": content.strip(),
+        "processing_time": int((time.time() - start_time) * 1000),
+        "metadata": {
+            "filename": filename,
+            "size": len(data),
+            "document_id": document_id,
+            "language": language,
+            "coalesced": False,
+            "conversion_path": "zip",
+            "pdf_backend": pdf_backend,
+            "summary": _zip_summary(results),
+            "members": members,
+        },
+    }
+
+
+def _stream_zip_results(
+    plan: _ZipPlan,
+    filename: str,
+    pdf_backend: str,
+    language: Optional[str],
+    start_time: float,
+    document_id: Optional[str] = None,
+) -> Iterator[bytes]:
+    """以 NDJSON 逐行返回每个成员的结果，最后一行为汇总"""
+    results: List[Dict[str, object]] = []
+    for result in _iter_zip_results(plan, pdf_backend, language, document_id):
+        results.append({"status": result["status"]})
+        yield serialize({"type": "member", **result}, False)[0] + b"\n"
+    yield serialize(
+        {
+            "type": "summary",
+            "filename": filename,
+            "pdf_backend": pdf_backend,
+            "processing_time": int((time.time() - start_time) * 1000),
+            **_zip_summary(results),
+        },
+        False,
+    )[0] + b"\n"
+
+
+def _convert_upload(filename: str, data: bytes, keep_data_uris: bool = False) -> _ConvertOutcome:
+    """将上传内容写入临时目录并转换，返回转换产物（失败时清理临时目录）"""
+    # 创建临时目录用于保存文件和可能提取的图片
+    temp_dir = SCRATCH.allocate(int(len(data) * SCRATCH_EXPANSION_FACTOR))
+    try:
+        temp_path = os.path.join(temp_dir, filename)
+
+        with open(temp_path, "wb") as f:
+            f.write(data)
+
+        # 转换文档
+        markdown = _convert_file(temp_path, filename.rsplit(".", 1)[1].lower(), filename, keep_data_uris)
+
+        return _ConvertOutcome(
+            work_dir=temp_dir,
+            file_path=temp_path,
+            markdown=markdown,
+            size=os.path.getsize(temp_path),
+            conversion_path="file",
+        )
+    except BaseException:
+        SCRATCH.release(temp_dir)
+        raise
+
+
+def _convert_document(
+    filename: str,
+    data: bytes,
+    document_id: Optional[str],
+    language: Optional[str],
+    start_time: float,
+    max_rows: Optional[int] = None,
+    max_sheets: Optional[int] = None,
+    pdf_backend: str = PDF_BACKEND,
+) -> Dict[str, object]:
+    """执行转换并构造成功响应体（同步请求与回调任务共用）"""
+    metric_inc("convert_requests_total")
+    extension = filename.rsplit(".", 1)[1].lower()
+
+    if extension == "zip":
+        return _convert_zip(filename, data, document_id, language, start_time, pdf_backend)
+
+    triage: Optional[Dict[str, object]] = None
+    if extension == "pdf" and pdf_backend != "markitdown":
+        backend, triage = _resolve_pdf_backend(data, pdf_backend)
+        if triage is not None:
+            logger.info(f"PDF triage for {filename}: {triage['backend']} ({triage['reason']}) {triage['features']}")
+        if backend == "mineru":
+            try:
+                content = _convert_pdf_with_mineru(filename, data, language, document_id)
+                metric_inc("convert_path_mineru_total")
+                return {
+                    "success": True,
+                    "content": content,
+                    "processing_time": int((time.time() - start_time) * 1000),
+                    "metadata": {
+                        "filename": filename,
+                        "size": len(data),
+                        "document_id": document_id,
+                        "language": language,
+                        "coalesced": False,
+                        "conversion_path": "mineru",
+                        "triage": triage,
+                    },
+                }
+            except Exception as e:
+                if triage is None:
+                    raise
+                # 自动路由时 MinerU 不可用则退回 MarkItDown
+                logger.warning(f"MinerU conversion of {filename} failed ({e}), falling back to MarkItDown")
+                triage["fallback"] = str(e)
+
+    if _use_fast_path(extension, len(data), max_rows, max_sheets):
+        stats = _FastConvertStats()
+        content = "".join(_fast_convert(io.BytesIO(data), extension, stats, max_rows, max_sheets))
+        return {
+            "success": True,
+            "content": content,
+            "processing_time": int((time.time() - start_time) * 1000),
+            "metadata": {
+                "filename": filename,
+                "size": len(data),
+                "document_id": document_id,
+                "language": language,
+                "coalesced": False,
+                "conversion_path": "fast",
+                "rows": stats.rows,
+                "sheets": stats.sheets,
+                "truncated": stats.truncated,
+            },
+        }
+
+    path = _conversion_path(extension, len(data), document_id)
+    embedded_images = bool(document_id) and extension in _EMBEDDED_IMAGE_EXTENSIONS
+    key = flight_key(data, extension=extension, path=path, embedded_images=embedded_images)
+    convert = _convert_in_memory if path == "stream" else _convert_upload
+
+    with _CONVERT_FLIGHTS.join(
+        key, lambda: convert(filename, data, embedded_images)
+    ) as (outcome, coalesced):
+        markdown_content = outcome.markdown
+        metric_inc(f"convert_path_{outcome.conversion_path}_total")
+
+        # 处理图片：上传到 MinIO 并更新链接（合并的请求各自上传到自己的 document_id 下）
+        if embedded_images:
+            markdown_content = _upload_embedded_images(markdown_content, data, extension, document_id)  # type: ignore[arg-type]
+        elif document_id and outcome.work_dir:
+            logger.info(f"Processing images for document_id: {document_id}")
+            markdown_content = _extract_and_upload_images(
+                markdown_content,
+                outcome.work_dir,
+                document_id
+            )
+
+    processing_time = int((time.time() - start_time) * 1000)
+
+    return {
+        "success": True,
+        "content": markdown_content,
+        "processing_time": processing_time,
+        "metadata": {
+            "filename": filename,
+            "size": outcome.size,
+            "document_id": document_id,
+            "language": language,  # 记录语言参数（即使 MarkItDown 库可能不使用）
+            "coalesced": coalesced,
+            "conversion_path": outcome.conversion_path,
+            "triage": triage,
+        },
+    }
+
+
+def _convert_error(exc: Exception) -> Tuple[int, str]:
+    """将转换异常映射为 (HTTP 状态码, 错误信息)"""
+    if isinstance(exc, ScratchQuotaExceeded):
+        logger.warning(f"Scratch quota exceeded: {exc}")
+        return status.HTTP_507_INSUFFICIENT_STORAGE, str(exc)
+    if isinstance(exc, ConvertTimeout):
+        return status.HTTP_504_GATEWAY_TIMEOUT, str(exc)
+    if isinstance(exc, ZipRejected):
+        logger.warning(f"Rejected zip upload: {exc}")
+        return status.HTTP_400_BAD_REQUEST, str(exc)
+    logger.error(f"Conversion failed: {exc}")
+    return status.HTTP_500_INTERNAL_SERVER_ERROR, str(exc)
+
+
+def _result_url(task_id: str) -> str:
+    return f"{os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')}/convert/{task_id}"
+
+
+def _run_async_convert(
+    task_id: str,
+    filename: str,
+    data: bytes,
+    document_id: Optional[str],
+    language: Optional[str],
+    callback_url: str,
+    callback_secret: Optional[str],
+    max_rows: Optional[int] = None,
+    max_sheets: Optional[int] = None,
+    pdf_backend: str = PDF_BACKEND,
+) -> None:
+    """回调模式的后台任务：转换完成后保存结果并投递回调"""
+    start_time = time.time()
+    manifest: Dict[str, object] = {
+        "task_id": task_id,
+        "document_id": document_id,
+        "filename": filename,
+        "result_url": _result_url(task_id),
+    }
+    try:
+        payload = _convert_document(
+            filename, data, document_id, language, start_time, max_rows, max_sheets, pdf_backend
+        )
+        payload["task_id"] = task_id
+        payload["status"] = "completed"
+        RESULT_STORE.put(task_id, payload)
+        manifest.update(
+            {
+                "status": "completed",
+                "content_length": len(payload["content"]),  # type: ignore[arg-type]
+                "processing_time": payload["processing_time"],
+            }
+        )
+    except Exception as exc:
+        _, message = _convert_error(exc)
+        processing_time = int((time.time() - start_time) * 1000)
+        RESULT_STORE.put(
+            task_id,
+            {
+                "success": False,
+                "task_id": task_id,
+                "status": "failed",
+                "error": message,
+                "processing_time": processing_time,
+            },
+        )
+        manifest.update({"status": "failed", "error": message, "processing_time": processing_time})
+
+    manifest["completed_at"] = time.time()
+    WEBHOOKS.enqueue(callback_url, callback_secret, manifest)
+
+
+@app.post("/convert")
+def convert_document(
+    request: Request,
+    file: UploadFile = File(...),
+    document_id: Optional[str] = Form(None),
+    language: Optional[str] = Form(None),
+    callback_url: Optional[str] = Form(None),
+    callback_secret: Optional[str] = Form(None),
+    max_rows: Optional[int] = Form(None),
+    max_sheets: Optional[int] = Form(None),
+    stream: bool = Form(False),
+    pdf_backend: Optional[str] = Form(None),
+) -> Response:
+    """
+    转换文档为 Markdown
+
+    请求方式: 上传文件
+    POST /convert
+    Content-Type: multipart/form-data
+    Body: 
+        - file: 文件二进制数据
+        - document_id: (可选) 文档 ID，用于图片上传到 MinIO
+        - language: (可选) 文档语言代码（ISO 639-1），如 'zh', 'en', 'ja', 'ko', 'fr', 'ar'
+        - callback_url: (可选) 回调地址。传递时立即返回 202 和 task_id，
+          转换完成或失败后向该地址 POST 结果摘要，完整结果通过 GET /convert/{task_id} 获取
+        - callback_secret: (可选) 回调签名密钥（HMAC-SHA256）
+        - max_rows: (可选) csv / tsv / xlsx 每个表格、txt 最多输出的行数
+        - max_sheets: (可选) xlsx 最多输出的工作表数
+        - stream: (可选) 为 true 时以分块的 text/markdown 响应逐步返回（仅 csv / tsv / json / txt / xlsx）；
+          zip 文件以 NDJSON 逐行返回每个成员的结果
+        - pdf_backend: (可选) PDF（包括 zip 中的 PDF 成员）的解析服务：markitdown、mineru，
+          或 auto（按 PDF 特征自动选择，结果见 metadata.triage）；mineru / auto 需配置 MINERU_URL
+
+    内容和格式完全相同的并发请求会合并到同一次转换，共享转换结果；
+    图片仍按各自的 document_id 上传。
+
+    响应:
+    {
+        "success": true,
+        "content": "markdown content...",
+        "processing_time": 1234,
+        "metadata": {...}
+    }
+    """
+    start_time = time.time()
+
+    if file.filename is None or file.filename.strip() == "":
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "success": False,
+                "error": "未选择文件",
+            },
+        )
+
+    if not _allowed_file(file.filename):
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "success": False,
+                "error": f'不支持的文件格式。支持的格式: {", ".join(sorted(ALLOWED_EXTENSIONS))}',
+            },
+        )
+
+    if callback_url:
+        callback_error = validate_callback_url(callback_url)
+        if callback_error:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"success": False, "error": callback_error},
+            )
+
+    extension = file.filename.rsplit(".", 1)[1].lower()
+    if stream and extension not in _FAST_EXTENSIONS | {"zip"}:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "success": False,
+                "error": f'stream 仅支持以下格式: {", ".join(sorted(_FAST_EXTENSIONS | {"zip"}))}',
+            },
+        )
+
+    pdf_backend = (pdf_backend or PDF_BACKEND).lower()
+    if pdf_backend not in _PDF_BACKENDS:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"success": False, "error": f'pdf_backend 仅支持 {", ".join(_PDF_BACKENDS)}'},
+        )
+    if pdf_backend != "markitdown" and not MINERU_URL:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"success": False, "error": "未配置 MINERU_URL，无法使用 mineru 解析 PDF"},
+        )
+
+    # 读取文件内容
+    file_bytes = file.file
+    file_bytes.seek(0, os.SEEK_END)
+    size = file_bytes.tell()
+    file_bytes.seek(0)
+
+    if size > MAX_FILE_SIZE:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={
+                "success": False,
+                "error": f"文件大小超过限制（最大 {MAX_FILE_SIZE // (1024 * 1024)}MB）",
+            },
+        )
+
+    filename = os.path.basename(file.filename)
+
+    if stream and not callback_url and extension == "zip":
+        metric_inc("convert_requests_total")
+        try:
+            plan = _open_zip(file_bytes)
+        except ZipRejected as e:
+            status_code, message = _convert_error(e)
+            return JSONResponse(status_code=status_code, content={"success": False, "error": message})
+        return StreamingResponse(
+            _stream_zip_results(plan, filename, pdf_backend, language, start_time, document_id),
+            media_type="application/x-ndjson",
+            headers={"X-Conversion-Path": "zip"},
+        )
+
+    if stream and not callback_url:
+        # 直接从上传的临时文件逐行读取并分块返回，内存占用与文件大小无关
+        metric_inc("convert_requests_total")
+        metric_inc("convert_streamed_total")
+        return StreamingResponse(
+            _fast_convert(file_bytes, extension, _FastConvertStats(), max_rows, max_sheets),
+            media_type="text/markdown; charset=utf-8",
+            headers={"X-Conversion-Path": "fast"},
+        )
+
+    data = file_bytes.read()
+
+    if callback_url:
+        task_id = new_task_id()
+        RESULT_STORE.put(task_id, {"success": True, "task_id": task_id, "status": "processing"})
+        _submit_async_job(
+            task_id,
+            {
+                "filename": filename,
+                "document_id": document_id,
+                "language": language,
+                "callback_url": callback_url,
+                "callback_secret": callback_secret,
+                "max_rows": max_rows,
+                "max_sheets": max_sheets,
+                "pdf_backend": pdf_backend,
+            },
+            data,
+        )
+        logger.info(f"Accepted async conversion {task_id} for {filename} (callback: {callback_url})")
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                "success": True,
+                "task_id": task_id,
+                "status": "processing",
+                "result_url": _result_url(task_id),
+            },
+        )
+
+    try:
+        return encoded_response(
+            request,
+            _convert_document(
+                filename, data, document_id, language, start_time, max_rows, max_sheets, pdf_backend
+            ),
+        )
+    except Exception as e:
+        status_code, message = _convert_error(e)
+        processing_time = int((time.time() - start_time) * 1000)
+
+        return JSONResponse(
+            status_code=status_code,
+            content={
+                "success": False,
+                "error": message,
+                "processing_time": processing_time,
+            },
+        )
+
+
+@app.post("/triage")
+def triage_pdf(file: UploadFile = File(...)) -> Response:
+    """
+    分析 PDF 的文本层密度、图片覆盖率、页数和表格 / 公式特征，返回建议的解析服务
+
+    响应:
+    {
+        "success": true,
+        "backend": "markitdown" | "mineru",
+        "reason": "born_digital" | "scanned" | "garbled_text_layer" | "image_heavy" | "formulas" | "tables" | ...,
+        "features": {...},
+        "triage_ms": 12
+    }
+    """
+    if not file.filename or not file.filename.lower().endswith(".pdf"):
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"success": False, "error": "仅支持 PDF 文件"},
+        )
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    if size > MAX_FILE_SIZE:
+        return JSONResponse(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            content={
+                "success": False,
+                "error": f"文件大小超过限制（最大 {MAX_FILE_SIZE // (1024 * 1024)}MB）",
+            },
+        )
+    return JSONResponse(content={"success": True, **_triage_pdf(file.file.read())})
+
+
+@app.get("/convert/{task_id}")
+def get_conversion(request: Request, task_id: str) -> Response:
+    """查询回调模式转换任务的状态和结果"""
+    try:
+        record = RESULT_STORE.get(task_id)
+    except ValueError as e:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"success": False, "error": str(e)})
+    if record is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"success": False, "error": f"任务不存在或已过期: {task_id}"},
+        )
+    return encoded_response(request, record)
+
+
+@app.get("/formats")
+def supported_formats() -> Dict[str, object]:
+    """返回支持的文件格式列表"""
+    return {
+        "formats": sorted(list(ALLOWED_EXTENSIONS)),
+        "max_file_size": MAX_FILE_SIZE,
+        "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024),
+    }
+
+
+@app.get("/info")
+def info() -> Dict[str, object]:
+    """返回服务信息"""
+    return {
+        "service": "MarkItDown API Server",
+        "version": app.version,
+        "supported_formats": sorted(ALLOWED_EXTENSIONS),
+        "environment": APP_ENV,
+        "scratch": SCRATCH.stats(),
+        "convert_pool": CONVERT_POOL.stats() if CONVERT_POOL is not None else [],
+        "convert_timeouts": CONVERT_TIMEOUTS,
+        "convert_default_timeout": CONVERT_TIMEOUT_SECONDS,
+        "mineru_timeout": MINERU_TIMEOUT,
+    }
+
+
+@app.get("/metrics")
+def metrics() -> Dict[str, object]:
+    """返回进程内指标"""
+    return {
+        "service": "markitdown",
+        "metrics": metrics_snapshot(),
+        "convert_in_flight": _CONVERT_FLIGHTS.in_flight(),
+        "webhooks_pending": WEBHOOKS.pending(),
+        "async_jobs_journaled": JOB_JOURNAL.pending(),
+        "drain": _DRAIN.stats(),
+        "convert_pool": CONVERT_POOL.stats() if CONVERT_POOL is not None else [],
+        "process": _process_stats(),
+        "timestamp": time.time(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# 预加载多进程模式（UVICORN_PREFORK）
+#
+# uvicorn 自带的多 worker 模式以 spawn 方式启动 worker，每个 worker 重新导入 markitdown[all]
+# 的全部依赖并创建自己的 MarkItDown 实例。预加载模式下主进程导入本模块、初始化转换器并绑定
+# 监听端口后再 fork 出 worker，已导入的模块和转换器以写时复制方式共享；主进程不处理请求，
+# 只负责补充异常退出的 worker，并把 SIGTERM / SIGINT 转发给 worker（由 worker 各自排空）。
+#
+# 转换进程池的工作进程同样需要共享预加载的内容，但 worker 已有多个线程，不能再 fork。
+# 主进程在创建任何线程之前先 fork 出单线程的 fork 服务器，worker 通过 Unix socket 请求它
+# fork 出转换进程，并把与转换进程通信的 socket 一并传过去（SCM_RIGHTS）。
+# ---------------------------------------------------------------------------
+
+PREFORK_RESPAWN_BACKOFF_SECONDS = float(os.environ.get("PREFORK_RESPAWN_BACKOFF_SECONDS", "1"))
+_FORWARDED_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+_STARTUP_FAILURE = 3
+
+# 主进程在 fork 前设置，worker 继承；_PREFORK_SLOT 为 worker 自己的槽位
+_PREFORK_MASTER: Optional["_PreforkMaster"] = None
+_PREFORK_SLOT: Optional[int] = None
+_CONVERT_FORK_SERVER: Optional["_ConvertForkServer"] = None
+
+
+class _ForkedProcess:
+    """
+    fork 服务器创建的转换进程
+
+    不是当前 worker 的子进程，无法 waitpid，也拿不到退出码；用 pidfd 判断存活和等待退出。
+    """
+
+    exitcode: Optional[int] = None
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self._exited = False
+        try:
+            self._pidfd: Optional[int] = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            self._pidfd = None
+
+    def is_alive(self) -> bool:
+        if self._exited:
+            return False
+        if self._pidfd is not None:
+            return not select.select([self._pidfd], [], [], 0)[0]
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def kill(self) -> None:
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._pidfd is not None:
+            select.select([self._pidfd], [], [], timeout)
+        else:
+            deadline = time.time() + (timeout if timeout is not None else float("inf"))
+            while self.is_alive() and time.time() < deadline:
+                time.sleep(0.05)
+        if not self.is_alive():
+            self._exited = True
+            if self._pidfd is not None:
+                os.close(self._pidfd)
+                self._pidfd = None
+
+
+class _ConvertForkServer:
+    """
+    单线程的 fork 服务器：由预加载后的主进程 fork 出，按 worker 的请求 fork 出转换进程
+
+    请求为一个 Unix socket 连接：worker 发送槽位号并附带 socketpair 的一端，
+    服务器 fork 出转换进程后回复其 pid。转换进程退出后由内核自动回收（SIGCHLD 忽略）。
+    """
+
+    def __init__(self) -> None:
+        # socket 放在仅当前用户可访问的临时目录中
+        self._dir = tempfile.mkdtemp(prefix="markitdown-fork-")
+        self.path = os.path.join(self._dir, "fork.sock")
+        self.pid: Optional[int] = None
+
+    def start(self) -> None:
+        """在主进程中调用：监听 socket 后 fork 出服务器进程"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(64)
+        signal.pthread_sigmask(signal.SIG_BLOCK, _FORWARDED_SIGNALS)
+        pid = os.fork()
+        if pid == 0:
+            exitcode = 0
+            try:
+                for sig in _FORWARDED_SIGNALS:
+                    signal.signal(sig, signal.SIG_DFL)
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, _FORWARDED_SIGNALS)
+                self._serve(listener)
+            except BaseException:
+                logger.exception("Convert fork server crashed")
+                exitcode = 1
+            finally:
+                os._exit(exitcode)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, _FORWARDED_SIGNALS)
+        listener.close()
+        self.pid = pid
+        logger.info(f"Convert fork server started (pid={pid})")
+
+    def _serve(self, listener: socket.socket) -> None:
+        master_pid = os.getppid()
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        listener.settimeout(1.0)
+        # 主进程退出后随之退出
+        while os.getppid() == master_pid:
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                conn.settimeout(5.0)
+                try:
+                    message, fds, _, _ = socket.recv_fds(conn, 32, 1)
+                    if len(fds) != 1:
+                        raise ValueError("expected one socket")
+                    index = int(message)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Ignoring malformed fork request: {e}")
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    self._run_convert_worker(listener, conn, index, fds[0])
+                os.close(fds[0])
+                try:
+                    conn.sendall(str(pid).encode("ascii"))
+                except OSError:
+                    os.kill(pid, signal.SIGKILL)
+
+    @staticmethod
+    def _run_convert_worker(listener: socket.socket, conn: socket.socket, index: int, fd: int) -> None:
+        exitcode = 0
+        try:
+            listener.close()
+            conn.close()
+            # 转换过程可能调用子进程（ffmpeg 等），需要恢复 SIGCHLD 才能 wait
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            _convert_worker_main(index, multiprocessing.connection.Connection(fd))
+        except BaseException:
+            exitcode = 1
+        finally:
+            os._exit(exitcode)
+
+    def launch(self, index: int) -> Tuple[_ForkedProcess, Any]:
+        """在 worker 中调用：请求 fork 出槽位 index 的转换进程，返回 (进程, 连接)"""
+        parent_sock, child_sock = socket.socketpair()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(CONVERT_WORKER_START_TIMEOUT)
+                client.connect(self.path)
+                socket.send_fds(client, [str(index).encode("ascii")], [child_sock.fileno()])
+                reply = b"".join(iter(lambda: client.recv(32), b""))
+            pid = int(reply)
+        except BaseException:
+            parent_sock.close()
+            raise
+        finally:
+            child_sock.close()
+        return _ForkedProcess(pid), multiprocessing.connection.Connection(parent_sock.detach())
+
+    def stop(self) -> None:
+        """在主进程中调用：所有 worker 退出后停止服务器"""
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+                os.waitpid(self.pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.pid = None
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def stats(self) -> Dict[str, object]:
+        return {"pid": self.pid, "memory": _process_memory(self.pid) if self.pid else {}}
+
+
+class _PreforkMaster:
+    """预加载后 fork worker 并监管其生命周期"""
+
+    def __init__(self, config: uvicorn.Config, workers: int) -> None:
+        self.config = config
+        self.workers = workers
+        self.pid = os.getpid()
+        self.preload_seconds: Optional[float] = None
+        self.exitcode = 0
+        # 每个槽位 (pid, forked_at, ready_at)，位于共享内存中，worker 写入后所有进程可见
+        self._slots = multiprocessing.RawArray("d", workers * 3)
+        self._children: Dict[int, int] = {}
+        self._stopping = False
+        self._socket: Any = None
+
+    def forked_at(self, slot: int) -> Optional[float]:
+        return self._slots[slot * 3 + 1] or None
+
+    def mark_ready(self, slot: int, ready_at: float) -> None:
+        self._slots[slot * 3 + 2] = ready_at
+
+    def stats(self) -> Dict[str, object]:
+        workers = []
+        for slot in range(self.workers):
+            pid, forked_at, ready_at = self._slots[slot * 3 : slot * 3 + 3]
+            workers.append(
+                {
+                    "slot": slot,
+                    "pid": int(pid) or None,
+                    "cold_start_seconds": round(ready_at - forked_at, 3) if ready_at >= forked_at > 0 else None,
+                    "memory": _process_memory(int(pid)) if pid else {},
+                }
+            )
+        return {
+            "master": {
+                "pid": self.pid,
+                "preload_seconds": self.preload_seconds,
+                "memory": _process_memory(self.pid),
+            },
+            "convert_fork_server": _CONVERT_FORK_SERVER.stats() if _CONVERT_FORK_SERVER is not None else None,
+            "workers": workers,
+        }
+
+    def run(self) -> int:
+        global _PREFORK_MASTER, _CONVERT_FORK_SERVER
+
+        started_at = _process_started_at(self.pid)
+        self.preload_seconds = round(time.time() - started_at, 3) if started_at else None
+        if threading.active_count() > 1:
+            logger.warning(f"{threading.active_count() - 1} thread(s) running before fork; they will not exist in workers")
+        self._socket = self.config.bind_socket()
+        _PREFORK_MASTER = self
+
+        # 导入阶段创建的对象移出 GC 跟踪：worker 中的垃圾回收不再改写这些对象所在的页面，共享得以保持
+        gc.collect()
+        gc.freeze()
+        memory = _process_memory(self.pid)
+        logger.info(
+            f"Preloaded in {self.preload_seconds}s"
+            + (f" (rss={memory['rss_bytes'] >> 20}MB)" if memory else "")
+            + f", forking {self.workers} workers"
+        )
+
+        # fork 服务器必须在主进程仍为单线程、且 worker 尚未启动时创建
+        if CONVERT_POOL_SIZE > 0:
+            _CONVERT_FORK_SERVER = _ConvertForkServer()
+            _CONVERT_FORK_SERVER.start()
+        for sig in _FORWARDED_SIGNALS:
+            signal.signal(sig, self._forward_signal)
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        while self._children:
+            try:
+                pid, wait_status = os.wait()
+            except ChildProcessError:
+                break
+            if _CONVERT_FORK_SERVER is not None and pid == _CONVERT_FORK_SERVER.pid:
+                _CONVERT_FORK_SERVER.pid = None
+                if not self._stopping:
+                    logger.warning(f"Convert fork server (pid={pid}) exited, restarting")
+                    _CONVERT_FORK_SERVER.start()
+                continue
+            slot = self._children.pop(pid, None)
+            if slot is None or self._stopping:
+                continue
+            exitcode = os.waitstatus_to_exitcode(wait_status)
+            if exitcode == _STARTUP_FAILURE:
+                # 启动失败（如 lifespan 异常）重启也会失败，整体退出
+                logger.error(f"Worker {slot} (pid={pid}) failed to start, shutting down")
+                self.exitcode = _STARTUP_FAILURE
+                self._forward_signal(signal.SIGTERM, None)
+                continue
+            logger.warning(f"Worker {slot} (pid={pid}) exited with code {exitcode}, restarting")
+            forked_at = self.forked_at(slot) or 0
+            if time.time() - forked_at < PREFORK_RESPAWN_BACKOFF_SECONDS * 10:
+                time.sleep(PREFORK_RESPAWN_BACKOFF_SECONDS)
+            if not self._stopping:
+                self._spawn(slot)
+
+        self._socket.close()
+        if _CONVERT_FORK_SERVER is not None:
+            _CONVERT_FORK_SERVER.stop()
+        logger.info("All workers exited")
+        return self.exitcode
+
+    def _forward_signal(self, signum: int, frame: Any) -> None:
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self, slot: int) -> None:
+        # fork 期间屏蔽信号，保证转发时新 worker 已登记
+        signal.pthread_sigmask(signal.SIG_BLOCK, _FORWARDED_SIGNALS)
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(slot)
+        self._children[pid] = slot
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, _FORWARDED_SIGNALS)
+
+    def _run_worker(self, slot: int) -> None:
+        global _PREFORK_SLOT
+
+        exitcode = 0
+        try:
+            for sig in _FORWARDED_SIGNALS:
+                signal.signal(sig, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, _FORWARDED_SIGNALS)
+            _PREFORK_SLOT = slot
+            self._slots[slot * 3 : slot * 3 + 3] = [os.getpid(), time.time(), 0.0]
+            server = uvicorn.Server(self.config)
+            server.run(sockets=[self._socket])
+            if not server.started:
+                exitcode = _STARTUP_FAILURE
+        except BaseException:
+            logger.exception(f"Worker {slot} crashed")
+            exitcode = 1
+        finally:
+            os._exit(exitcode)
+
+
+def _resolve_prefork(workers: int, reload_enabled: bool) -> bool:
+    """UVICORN_PREFORK=auto（默认）时多 worker 且未启用 reload 即使用预加载模式"""
+    prefork_env = os.environ.get("UVICORN_PREFORK", "auto").lower()
+    if reload_enabled:
+        return False
+    if prefork_env == "auto":
+        return workers > 1
+    return prefork_env in {"1", "true", "yes", "on"}
+
+
+def _resolve_reload(app_env: str) -> bool:
+    """根据环境变量决定是否启用 reload"""
+    default_reload = app_env != "production"
+    reload_env = os.environ.get("UVICORN_RELOAD", "").lower()
+    if reload_env:
+        return reload_env in {"1", "true", "yes", "on"}
+    return default_reload
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    host = os.environ.get("HOST", "0.0.0.0")
+    workers = int(os.environ.get("UVICORN_WORKERS", "1"))
+    reload_enabled = _resolve_reload(APP_ENV)
+    log_level = os.environ.get("UVICORN_LOG_LEVEL", "info")
+
+    if reload_enabled:
+        workers = 1  # Uvicorn reload 模式仅支持单进程
+
+    logger.info(f"Starting MarkItDown API Server on port {port}...")
+    logger.info(f"Environment: {APP_ENV}")
+    logger.info(f"Uvicorn workers: {workers}")
+    logger.info(f"Reload enabled: {reload_enabled}")
+
+    if _resolve_prefork(workers, reload_enabled):
+        logger.info("Prefork enabled: workers share the preloaded converter copy-on-write")
+        prefork_config = uvicorn.Config(
+            app,
+            host=host,
+            port=port,
+            log_level=log_level,
+            timeout_graceful_shutdown=int(DRAIN_GRACE_SECONDS),
+        )
+        sys.exit(_PreforkMaster(prefork_config, workers).run())
 
     uvicorn.run(
         "api_server:app",
@@ -393,4 +2679,5 @@ if __name__ == "__main__":
         reload=reload_enabled,
         workers=workers,
         log_level=log_level,
+        timeout_graceful_shutdown=int(DRAIN_GRACE_SECONDS),
     )
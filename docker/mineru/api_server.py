@@ -5,34 +5,62 @@ MinerU HTTP API Server（优化版 - 模型常驻内存）
 参考：https://opendatalab.github.io/MinerU/zh/quick_start/docker_deployment/
 """
 
+import asyncio
+import functools
+import hashlib
+import io
+import importlib.metadata
+import importlib.util
 import json
 import logging
+import multiprocessing
 import os
 import re
 import shutil
 import subprocess
 import tempfile
+import threading
 import time
-from contextlib import asynccontextmanager
+import uuid
+
+_MODULE_START = time.time()
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import uvicorn  # type: ignore
-from fastapi import FastAPI, File, Form, UploadFile, status  # type: ignore
-from fastapi.responses import JSONResponse  # type: ignore
+from fastapi import FastAPI, File, Form, Request, UploadFile, status  # type: ignore
+from fastapi.responses import JSONResponse, Response  # type: ignore
 from minio import Minio  # type: ignore
 from minio.error import S3Error  # type: ignore
 
-# 尝试导入 MinerU Python API
-MINERU_API_AVAILABLE = False
-try:
-    from mineru.cli.client import do_parse
-    MINERU_API_AVAILABLE = True
-    logger_init = logging.getLogger(__name__)
-    logger_init.info("✅ MinerU Python API (do_parse) imported successfully")
-except ImportError as e:
-    logger_init = logging.getLogger(__name__)
-    logger_init.warning(f"⚠️  MinerU Python API not available: {e}, will use CLI mode")
+# 两个服务共用的基础组件：镜像中与本文件位于同一目录；在仓库中直接运行时需设置 PYTHONPATH=docker/common
+from server_common import (
+    DrainState,
+    JobJournal,
+    ResultStore,
+    ScratchQuotaExceeded,
+    ScratchSpace,
+    SingleFlight,
+    WebhookDispatcher,
+    encoded_response,
+    encoding_capabilities,
+    flight_key,
+    install_drain_handler,
+    metric_inc,
+    metric_observe,
+    metrics_snapshot,
+    new_task_id,
+    validate_callback_url,
+)
+
+# MinerU Python API 体积很大，这里只检查是否已安装，实际导入放在后台预热线程中，
+# 避免阻塞端口绑定（导入失败时预热线程会切换到 CLI 模式）
+MINERU_API_AVAILABLE = importlib.util.find_spec("mineru") is not None
 
 APP_ENV = os.environ.get("APP_ENV", "development").lower()
 MAX_FILE_SIZE = 200 * 1024 * 1024  # 200MB
@@ -47,6 +75,96 @@ logger = logging.getLogger(__name__)
 
 # 全局变量：模型预热状态
 MODEL_WARMED_UP = False
+_MODEL_READY = threading.Event()
+# 启动各阶段耗时（秒），通过 /info 暴露
+STARTUP_TIMINGS: Dict[str, float] = {}
+MINERU_WARMUP_PARSE = os.environ.get("MINERU_WARMUP_PARSE", "true").lower() in {"1", "true", "yes", "on"}
+MINERU_WARMUP_LANG = os.environ.get("MINERU_WARMUP_LANG", "ch")
+# 预热完成前到达的请求最长等待时间
+MINERU_READY_WAIT_SECONDS = int(os.environ.get("MINERU_READY_WAIT_SECONDS", "600"))
+
+# 临时空间配置：SCRATCH_TMPFS_ROOT 指向内存盘（如 /dev/shm/mineru-scratch）时，
+# 预计占用不超过 SCRATCH_TMPFS_MAX_BYTES 的请求使用内存盘，其余落盘
+SCRATCH = ScratchSpace(
+    name="scratch",
+    root=os.environ.get("SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), "mineru-scratch")),
+    tmpfs_root=os.environ.get("SCRATCH_TMPFS_ROOT"),
+    tmpfs_max_bytes=int(os.environ.get("SCRATCH_TMPFS_MAX_BYTES", str(64 * 1024 * 1024))),
+    request_quota=int(os.environ.get("SCRATCH_REQUEST_QUOTA_BYTES", str(4 * 1024 * 1024 * 1024))),
+    total_quota=int(os.environ.get("SCRATCH_TOTAL_QUOTA_BYTES", str(20 * 1024 * 1024 * 1024))),
+    orphan_ttl=int(os.environ.get("SCRATCH_ORPHAN_TTL_SECONDS", str(24 * 3600))),
+)
+# MinerU 输出（图片、中间结果）相对输入 PDF 的预计膨胀倍数
+SCRATCH_EXPANSION_FACTOR = float(os.environ.get("SCRATCH_EXPANSION_FACTOR", "4"))
+SCRATCH_SWEEP_INTERVAL = int(os.environ.get("SCRATCH_SWEEP_INTERVAL_SECONDS", "600"))
+
+
+# 回调任务：结果与待投递回调持久化在 DATA_DIR 下（建议挂载数据卷）
+SERVICE_NAME = "mineru"
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.getcwd(), "data"))
+RESULT_STORE = ResultStore(
+    os.environ.get("RESULT_STORE_DIR", os.path.join(DATA_DIR, "results")),
+    ttl=int(os.environ.get("RESULT_TTL_SECONDS", str(24 * 3600))),
+)
+# 增量解析：按 document_id 保存上一版本的逐页指纹与解析结果
+VERSION_STORE = ResultStore(
+    os.environ.get("VERSION_STORE_DIR", os.path.join(DATA_DIR, "versions")),
+    ttl=int(os.environ.get("VERSION_TTL_SECONDS", str(30 * 24 * 3600))),
+)
+WEBHOOKS = WebhookDispatcher(
+    service_name=SERVICE_NAME,
+    queue_dir=os.environ.get("WEBHOOK_QUEUE_DIR", os.path.join(DATA_DIR, "webhooks")),
+    max_attempts=int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8")),
+    backoff_base=float(os.environ.get("WEBHOOK_BACKOFF_BASE_SECONDS", "2")),
+    backoff_max=float(os.environ.get("WEBHOOK_BACKOFF_MAX_SECONDS", "600")),
+    timeout=float(os.environ.get("WEBHOOK_TIMEOUT_SECONDS", "10")),
+    stores=[RESULT_STORE, VERSION_STORE],
+)
+_ASYNC_JOBS = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASYNC_JOB_WORKERS", "2")),
+    thread_name_prefix="async-job",
+)
+
+# 优雅下线：排空宽限期内等待进行中的请求和异步任务，未完成的异步任务由重启后的实例继续处理
+DRAIN_GRACE_SECONDS = float(os.environ.get("DRAIN_GRACE_SECONDS", "300"))
+# 收到 SIGTERM 后继续监听的时间（/ready 返回 503），留给负载均衡摘除本实例
+DRAIN_DELAY_SECONDS = float(os.environ.get("DRAIN_DELAY_SECONDS", "5"))
+_DRAIN = DrainState(camel_case=True)
+JOB_JOURNAL = JobJournal(os.environ.get("JOB_JOURNAL_DIR", os.path.join(DATA_DIR, "jobs")))
+
+
+def _run_journaled_job(task_id: str, params: Dict[str, Any], data: bytes) -> None:
+    if _DRAIN.draining:
+        # 排空期间不再开始新任务，保留在日志中由重启后的实例处理
+        logger.info(f"Leaving async task {task_id} journaled for the next instance")
+        return
+    with _DRAIN.track("jobs"):
+        _run_async_extract(task_id, data=data, **params)
+        JOB_JOURNAL.remove(task_id)
+
+
+def _submit_async_job(task_id: str, params: Dict[str, Any], data: bytes) -> None:
+    """记录任务日志后提交到后台线程池"""
+    JOB_JOURNAL.add(task_id, params, data)
+    _ASYNC_JOBS.submit(_run_journaled_job, task_id, params, data)
+
+
+def _resume_journaled_jobs() -> None:
+    """重新提交上一次运行未完成的异步任务"""
+    for task_id, params, data in JOB_JOURNAL.claim_pending():
+        metric_inc("async_jobs_resumed_total")
+        logger.info(f"♻️  Resuming journaled async task {task_id} ({params.get('filename')})")
+        _ASYNC_JOBS.submit(_run_journaled_job, task_id, params, data)
+
+
+def _drain_async_jobs() -> None:
+    """关闭阶段：取消尚未开始的异步任务（保留在日志中），在剩余宽限期内等待运行中的任务"""
+    _DRAIN.begin()
+    _ASYNC_JOBS.shutdown(wait=False, cancel_futures=True)
+    remaining = DRAIN_GRACE_SECONDS - (time.time() - (_DRAIN.started_at or time.time()))
+    if not _DRAIN.wait_jobs(remaining):
+        logger.warning(f"⚠️  Grace period expired with {_DRAIN.jobs} async job(s) still running; they will be resumed after restart")
+    logger.info(f"Drain complete, {JOB_JOURNAL.pending()} async job(s) left in journal")
 
 
 # 使用 lifespan 管理启动和关闭事件（替代已弃用的 @app.on_event）
@@ -56,13 +174,21 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 70)
     logger.info("🚀 MinerU API Server Starting...")
     logger.info("=" * 70)
+    SCRATCH.start_sweeper(SCRATCH_SWEEP_INTERVAL)
+    WEBHOOKS.start()
+    install_drain_handler(_DRAIN, DRAIN_DELAY_SECONDS)
+    _start_replica_pool()
     await warmup_model()
+    _resume_journaled_jobs()
     logger.info("=" * 70)
-    logger.info("✅ MinerU API Server Ready")
+    logger.info("✅ MinerU API Server accepting requests (models warming up in background)")
     logger.info("=" * 70)
     yield
-    # 关闭时执行（如果需要清理资源）
+    # 关闭时执行：uvicorn 已停止监听并等待进行中的请求，这里再等待运行中的异步任务
     logger.info("🛑 MinerU API Server Shutting Down...")
+    await asyncio.to_thread(_drain_async_jobs)
+    if REPLICA_POOL is not None:
+        REPLICA_POOL.stop()
 
 
 app = FastAPI(
@@ -146,24 +272,17 @@ def _upload_image_to_minio(
         return None
 
 
-def _process_images_and_update_markdown(
-    markdown_content: str,
-    output_dir: str,
-    document_id: Optional[str]
-) -> str:
+def _upload_output_images(output_dir: str, document_id: str) -> Dict[str, Dict[str, str]]:
     """
-    扫描 MinerU 输出目录中的图片，上传到 MinIO，并更新 Markdown 中的链接
-    
-    MinerU 会将 PDF 中的图片提取到 images/ 子目录
+    上传 MinerU 输出目录 images/ 下的图片到 MinIO
+
+    Returns:
+        {相对链接 images/xxx.jpg: {"object": 对象路径, "url": 访问 URL}}，MinIO 不可用时为空
     """
-    if not document_id:
-        logger.info("No document_id provided, skipping image upload")
-        return markdown_content
-    
     minio_client = _get_minio_client()
     if not minio_client:
         logger.warning("MinIO client not available, skipping image upload")
-        return markdown_content
+        return {}
     
     bucket_name = os.environ.get("MINIO_BUCKET_NAME", "deepmed")
     
@@ -178,7 +297,7 @@ def _process_images_and_update_markdown(
     logger.info(f"Found {len(image_files)} images in output directory")
     
     # 上传所有图片到 MinIO
-    image_url_map: Dict[str, str] = {}
+    uploaded: Dict[str, Dict[str, str]] = {}
     for image_file in image_files:
         image_filename = image_file.name
         minio_url = _upload_image_to_minio(
@@ -190,12 +309,41 @@ def _process_images_and_update_markdown(
         )
         
         if minio_url:
-            # 记录原始文件名到 MinIO URL 的映射
-            image_url_map[image_filename] = minio_url
-            # 也记录相对路径的映射（MinerU 生成的链接格式为 images/xxx.jpg）
-            image_url_map[f"images/{image_filename}"] = minio_url
+            # MinerU 生成的链接格式为 images/xxx.jpg
+            uploaded[f"images/{image_filename}"] = {
+                "object": f"documents/{document_id}/images/{image_filename}",
+                "url": minio_url,
+            }
             logger.info(f"Uploaded image: {image_filename} -> {minio_url}")
     
+    return uploaded
+
+
+def _process_images_and_update_markdown(
+    markdown_content: str,
+    output_dir: str,
+    document_id: Optional[str]
+) -> str:
+    """
+    扫描 MinerU 输出目录中的图片，上传到 MinIO，并更新 Markdown 中的链接
+    
+    MinerU 会将 PDF 中的图片提取到 images/ 子目录
+    """
+    if not document_id:
+        logger.info("No document_id provided, skipping image upload")
+        return markdown_content
+    
+    return _link_uploaded_images(markdown_content, _upload_output_images(output_dir, document_id))
+
+
+def _link_uploaded_images(markdown_content: str, uploaded: Dict[str, Dict[str, str]]) -> str:
+    """按 _upload_output_images 的结果把 Markdown 中的图片链接替换为 MinIO URL"""
+    image_url_map: Dict[str, str] = {}
+    for link, image in uploaded.items():
+        # 同时记录相对路径和原始文件名的映射
+        image_url_map[link] = image["url"]
+        image_url_map[os.path.basename(link)] = image["url"]
+    
     # 更新 Markdown 中的图片链接
     # 匹配 ![alt](path) 格式
     def replace_image_link(match):
@@ -249,38 +397,145 @@ def _error_response(
     return JSONResponse(status_code=status_code, content=payload)
 
 
-async def warmup_model():
+def _build_warmup_pdf() -> bytes:
+    """生成一页只含少量文字的最小 PDF，用于预热解析流水线"""
+    stream = b"BT /F1 24 Tf 72 720 Td (MinerU warmup 2024) Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+
+def _warmup_in_process() -> Dict[str, float]:
     """
-    服务启动时预热模型
-    通过导入 MinerU 模块来预加载模型到内存
+    在当前进程中导入 MinerU、加载模型并执行一次预热解析，返回各阶段耗时（秒）
+
+    MinerU 未安装时抛出 ImportError。
     """
-    global MODEL_WARMED_UP
-    
-    if not MINERU_API_AVAILABLE:
-        logger.info("⚠️  Python API not available, skipping model warmup")
-        return
-    
+    timings: Dict[str, float] = {}
+
+    phase_start = time.time()
+    from mineru.cli.client import do_parse  # noqa: F401
+    timings["mineru_import"] = time.time() - phase_start
+
+    if os.environ.get("MINERU_BACKEND", "pipeline") == "pipeline":
+        phase_start = time.time()
+        try:
+            from mineru.backend.pipeline.pipeline_analyze import ModelSingleton  # type: ignore
+            ModelSingleton().get_model(
+                lang=MINERU_WARMUP_LANG,
+                formula_enable=True,
+                table_enable=True,
+            )
+            timings["model_load"] = time.time() - phase_start
+        except Exception as e:
+            logger.warning(f"⚠️  Model preload skipped: {e}")
+
+    if MINERU_WARMUP_PARSE:
+        phase_start = time.time()
+        with SCRATCH.workdir(1024 * 1024) as work_dir:
+            pdf_path = os.path.join(work_dir, "warmup.pdf")
+            output_dir = os.path.join(work_dir, "output")
+            with open(pdf_path, "wb") as f:
+                f.write(_build_warmup_pdf())
+            os.makedirs(output_dir, exist_ok=True)
+            _run_do_parse(pdf_path, output_dir, MINERU_WARMUP_LANG)
+        timings["warmup_parse"] = time.time() - phase_start
+
+    return timings
+
+
+def _warmup_worker() -> None:
+    """后台预热线程：完成后设置 _MODEL_READY，等待中的请求随即开始处理"""
+    global MINERU_API_AVAILABLE, MODEL_WARMED_UP
+
+    start_time = time.time()
     try:
-        start_time = time.time()
-        
-        # 创建一个最小的测试 PDF 来预热模型
-        # 这样首次请求就不需要等待模型加载
-        logger.info("Warming up MinerU models (this may take 10-30 seconds)...")
-        logger.info("Models will remain in memory for fast subsequent processing")
-        
-        # 导入 mineru do_parse 会触发模型预加载
-        from mineru.cli.client import do_parse
-        
-        elapsed = time.time() - start_time
+        logger.info("Warming up MinerU models in background (this may take 10-30 seconds)...")
+        timings = _warmup_in_process()
+        for phase, seconds in timings.items():
+            STARTUP_TIMINGS[f"{phase}_seconds"] = round(seconds, 3)
         MODEL_WARMED_UP = True
-        
-        logger.info(f"✅ Model warmup completed in {elapsed:.2f}s")
+
+        logger.info(f"✅ Model warmup completed in {time.time() - start_time:.2f}s")
         logger.info("📊 Models are now resident in memory")
-        logger.info("⚡ Subsequent requests will be much faster!")
-        
+    except ImportError as e:
+        MINERU_API_AVAILABLE = False
+        logger.warning(f"⚠️  MinerU Python API not available: {e}, will use CLI mode")
     except Exception as e:
         logger.error(f"❌ Model warmup failed: {e}")
-        logger.warning("Will fall back to CLI mode")
+        logger.warning("Models will be loaded on the first request")
+    finally:
+        STARTUP_TIMINGS["ready_seconds"] = round(time.time() - _MODULE_START, 3)
+        logger.info(f"⏱️  Startup timings: {STARTUP_TIMINGS}")
+        _MODEL_READY.set()
+        _mineru_version()
+
+
+async def warmup_model():
+    """
+    服务启动时预热模型
+
+    重量级的 MinerU 导入和模型加载放在后台线程中进行，端口立即开始监听；
+    预热完成前到达的解析请求会等待预热结束。副本模式下由各副本进程自行预热。
+    """
+    STARTUP_TIMINGS["app_startup_seconds"] = round(time.time() - _MODULE_START, 3)
+
+    if REPLICA_POOL is not None:
+        logger.info("Models are warmed up inside replica processes")
+        return
+
+    if not MINERU_API_AVAILABLE:
+        logger.info("⚠️  Python API not available, skipping model warmup")
+        _MODEL_READY.set()
+        return
+
+    threading.Thread(target=_warmup_worker, name="model-warmup", daemon=True).start()
+
+
+@app.middleware("http")
+async def drain_guard(request: Request, call_next: Callable[..., Any]) -> Response:
+    """排空期间拒绝新的处理请求（查询类 GET 请求不受影响）"""
+    if request.method == "POST" and _DRAIN.draining:
+        metric_inc("drain_rejected_total")
+        response = _error_response(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            message="服务正在下线，请重试其他实例",
+        )
+        response.headers["Retry-After"] = str(int(DRAIN_DELAY_SECONDS) or 1)
+        return response
+    with _DRAIN.track("requests"):
+        return await call_next(request)
+
+
+@app.get("/ready")
+def readiness_check() -> JSONResponse:
+    """就绪检查：模型预热完成且未在排空时返回 200，否则返回 503（供负载均衡摘除实例）"""
+    if _DRAIN.draining:
+        state = "draining"
+    elif not _MODEL_READY.is_set():
+        state = "warming-up"
+    else:
+        state = "ready"
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if state == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": state, **_DRAIN.stats(), "journaledJobs": JOB_JOURNAL.pending()},
+    )
 
 
 @app.get("/health")
@@ -293,117 +548,488 @@ def health_check() -> Dict[str, object]:
         "api_mode": "python-api" if MINERU_API_AVAILABLE else "cli",
         "model_persistent": MINERU_API_AVAILABLE,
         "model_warmed_up": MODEL_WARMED_UP,
+        "replicas": MINERU_REPLICAS if REPLICA_POOL is not None else 0,
         "timestamp": time.time(),
         "environment": APP_ENV,
     }
 
 
-def _process_pdf_with_python_api(pdf_path: str, output_dir: str, lang: Optional[str] = None) -> str:
+def _run_do_parse_batch(
+    pdf_paths: List[str],
+    output_dir: str,
+    langs: List[Optional[str]],
+) -> List[str]:
     """
-    使用 MinerU Python API (do_parse) 处理 PDF（模型常驻内存，快速）
-    
-    使用 mineru.cli.client.do_parse 函数，该函数在首次调用时加载模型，
-    后续调用会复用已加载的模型，避免重复加载。
-    
+    在当前进程中调用 do_parse 处理一组 PDF（副本进程与单进程模式共用）
+
+    do_parse 原生支持列表输入，一组文档共享一次调用的模型调度开销。
+    同组内文件名（不含扩展名）必须唯一。
+
     Returns:
-        str: Markdown 文件路径
+        List[str]: 与 pdf_paths 一一对应的 Markdown 文件路径
     """
-    if not MINERU_API_AVAILABLE:
-        raise RuntimeError("MinerU Python API not available")
-    
-    try:
-        logger.info(f"📄 Processing with Python API (persistent model): {pdf_path}")
-        start_time = time.time()
-        
-        # 读取 PDF 字节
+    start_time = time.time()
+
+    # 读取 PDF 字节
+    pdf_bytes_list: List[bytes] = []
+    for pdf_path in pdf_paths:
         with open(pdf_path, "rb") as f:
-            pdf_bytes = f.read()
-        
-        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        
-        # 使用 do_parse 处理 PDF
-        # 参数说明：
-        # - output_dir: 输出目录
-        # - pdf_file_names: PDF 文件名列表
-        # - pdf_bytes_list: PDF 字节内容列表
-        # - p_lang_list: 语言列表
-        # - backend: 后端模式 ('pipeline' 或 'magic-pdf')
-        # - parse_method: 解析方法 ('auto', 'txt', 'ocr')
-        from mineru.cli.client import do_parse
-        
-        logger.info("Calling do_parse with Python API (model will be reused)...")
-        # MinerU 支持的语言代码：ch (简体中文), ch_server, ch_lite, chinese_cht (繁体中文), en, korean, japan 等
-        # 使用 'ch' 而不是 'zh' 来指定中文
-        # 如果调用方没有传递语言参数，默认使用 'ch'（简体中文）
-        lang_list = [lang] if lang else ['ch']
-        logger.info(f"Using language: {lang_list}")
-        
-        # 从环境变量读取 backend，默认使用 'pipeline'（推荐/稳定）
-        # 支持的值：'pipeline'（推荐）, 'vlm-vllm-engine', 'vlm-transformers' 等
-        # 注意：vlm-vllm-engine 在某些情况下可能出现兼容性问题（IndexError: list index out of range）
-        backend = os.environ.get('MINERU_BACKEND', 'pipeline')
-        logger.info(f"Using backend: {backend}")
-        
-        try:
+            pdf_bytes_list.append(f.read())
+
+    base_names = [os.path.splitext(os.path.basename(pdf_path))[0] for pdf_path in pdf_paths]
+
+    # 使用 do_parse 处理 PDF
+    # 参数说明：
+    # - output_dir: 输出目录
+    # - pdf_file_names: PDF 文件名列表
+    # - pdf_bytes_list: PDF 字节内容列表
+    # - p_lang_list: 语言列表
+    # - backend: 后端模式 ('pipeline' 或 'magic-pdf')
+    # - parse_method: 解析方法 ('auto', 'txt', 'ocr')
+    from mineru.cli.client import do_parse as _do_parse
+
+    def do_parse(**kwargs: Any) -> None:
+        # MinerU 内部用 PDFium 读取和渲染页面，与本进程中其他 pypdfium2 调用共用一把锁
+        with _PDFIUM_LOCK:
+            _do_parse(**kwargs)
+
+    logger.info(f"Calling do_parse with Python API for {len(pdf_paths)} document(s) (model will be reused)...")
+    # MinerU 支持的语言代码：ch (简体中文), ch_server, ch_lite, chinese_cht (繁体中文), en, korean, japan 等
+    # 使用 'ch' 而不是 'zh' 来指定中文
+    # 调用方一般已解析出具体语言（见 _resolve_lang）；没有时使用 LANG_DETECT_FALLBACK
+    lang_list = [lang if lang and lang != 'auto' else LANG_DETECT_FALLBACK for lang in langs]
+    logger.info(f"Using language: {lang_list}")
+
+    # 从环境变量读取 backend，默认使用 'pipeline'（推荐/稳定）
+    # 支持的值：'pipeline'（推荐）, 'vlm-vllm-engine', 'vlm-transformers' 等
+    # 注意：vlm-vllm-engine 在某些情况下可能出现兼容性问题（IndexError: list index out of range）
+    backend = os.environ.get('MINERU_BACKEND', 'pipeline')
+    logger.info(f"Using backend: {backend}")
+
+    try:
+        do_parse(
+            output_dir=output_dir,
+            pdf_file_names=base_names,
+            pdf_bytes_list=pdf_bytes_list,
+            p_lang_list=lang_list,  # 调用方指定或自动检测的语言
+            backend=backend,  # 从环境变量 MINERU_BACKEND 读取，默认 'pipeline'
+            parse_method='auto',  # 自动检测
+            formula_enable=True,  # 启用公式识别
+            table_enable=True,   # 启用表格识别
+            f_dump_md=True,      # 输出 Markdown
+            f_dump_content_list=True,  # 输出 content_list.json
+        )
+    except Exception as parse_error:
+        # 如果使用 vlm-vllm-engine 失败（通常是 IndexError 或其他兼容性问题），自动降级到 pipeline
+        if backend == 'vlm-vllm-engine':
+            error_msg = str(parse_error)
+            logger.warning(f"❌ vlm-vllm-engine backend failed: {error_msg}")
+            logger.info("🔄 Automatically retrying with pipeline backend (fallback)...")
             do_parse(
                 output_dir=output_dir,
-                pdf_file_names=[base_name],
-                pdf_bytes_list=[pdf_bytes],
-                p_lang_list=lang_list,  # 从调用方传递的语言参数，默认 'ch'
-                backend=backend,  # 从环境变量 MINERU_BACKEND 读取，默认 'pipeline'
-                parse_method='auto',  # 自动检测
-                formula_enable=True,  # 启用公式识别
-                table_enable=True,   # 启用表格识别
-                f_dump_md=True,      # 输出 Markdown
-                f_dump_content_list=True,  # 输出 content_list.json
+                pdf_file_names=base_names,
+                pdf_bytes_list=pdf_bytes_list,
+                p_lang_list=lang_list,
+                backend='pipeline',  # 降级到稳定的 pipeline
+                parse_method='auto',
+                formula_enable=True,
+                table_enable=True,
+                f_dump_md=True,
+                f_dump_content_list=True,
             )
-        except Exception as parse_error:
-            # 如果使用 vlm-vllm-engine 失败（通常是 IndexError 或其他兼容性问题），自动降级到 pipeline
-            if backend == 'vlm-vllm-engine':
-                error_msg = str(parse_error)
-                logger.warning(f"❌ vlm-vllm-engine backend failed: {error_msg}")
-                logger.info("🔄 Automatically retrying with pipeline backend (fallback)...")
-                do_parse(
-                    output_dir=output_dir,
-                    pdf_file_names=[base_name],
-                    pdf_bytes_list=[pdf_bytes],
-                    p_lang_list=lang_list,
-                    backend='pipeline',  # 降级到稳定的 pipeline
-                    parse_method='auto',
-                    formula_enable=True,
-                    table_enable=True,
-                    f_dump_md=True,
-                    f_dump_content_list=True,
-                )
-                logger.info("✅ Fallback to pipeline backend succeeded")
-            else:
-                # 其他 backend 失败，直接抛出异常
-                raise
-        
-        # do_parse 会在 output_dir 下创建如下结构：
-        # output_dir/
-        #   {base_name}/
-        #     auto/
-        #       {base_name}.md
-        #       content_list.json
-        #       images/
-        
+            logger.info("✅ Fallback to pipeline backend succeeded")
+        else:
+            # 其他 backend 失败，直接抛出异常
+            raise
+
+    # do_parse 会在 output_dir 下为每个文档创建如下结构：
+    # output_dir/
+    #   {base_name}/
+    #     auto/
+    #       {base_name}.md
+    #       content_list.json
+    #       images/
+
+    md_paths: List[str] = []
+    for base_name in base_names:
         md_path = os.path.join(output_dir, base_name, "auto", f"{base_name}.md")
-        
+
         if not os.path.exists(md_path):
             raise FileNotFoundError(f"Markdown file not found: {md_path}")
-        
+
         # 检查并记录图片提取情况
         images_dir = os.path.join(output_dir, base_name, "auto", "images")
         if os.path.exists(images_dir):
             image_count = len([f for f in os.listdir(images_dir) if f.endswith(('.jpg', '.png', '.jpeg'))])
-            logger.info(f"📷 Extracted {image_count} images")
-        
-        elapsed = time.time() - start_time
-        logger.info(f"✅ Python API processing completed in {elapsed:.2f}s (model reused)")
-        logger.info(f"💾 Output saved to: {md_path}")
-        
-        return md_path
+            logger.info(f"📷 Extracted {image_count} images from {base_name}")
+
+        md_paths.append(md_path)
+
+    elapsed = time.time() - start_time
+    logger.info(f"✅ Python API processing completed in {elapsed:.2f}s (model reused)")
+    logger.info(f"💾 Output saved to: {output_dir}")
+
+    return md_paths
+
+
+def _run_do_parse(pdf_path: str, output_dir: str, lang: Optional[str] = None) -> str:
+    """在当前进程中调用 do_parse 处理单个 PDF，返回 Markdown 文件路径"""
+    return _run_do_parse_batch([pdf_path], output_dir, [lang])[0]
+
+
+# ---------------------------------------------------------------------------
+# 模型副本进程（MINERU_REPLICAS > 0 时启用）
+#
+# 前端进程（uvicorn）只负责 HTTP 和调度，N 个副本进程各自加载一份模型，
+# 使用固定的线程数和 CPU 亲和性，避免多个进程的 torch/OpenMP 线程互相抢占。
+# ---------------------------------------------------------------------------
+
+MINERU_REPLICAS = int(os.environ.get("MINERU_REPLICAS", "0"))
+
+# 副本进程启动前设置的线程数环境变量
+_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+_SPAWN_ENV_LOCK = threading.Lock()
+
+
+def _parse_cpu_list(spec: str) -> List[int]:
+    """解析 '0-3,8' 形式的 CPU 列表"""
+    cpus: List[int] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            low, high = part.split("-", 1)
+            cpus.extend(range(int(low), int(high) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _plan_replica_cpusets(replicas: int) -> List[List[int]]:
+    """
+    为每个副本分配 CPU 集合
+
+    MINERU_REPLICA_CPUSETS 可显式指定（如 '0-3;4-7'），否则把当前进程可用的 CPU 平均切分。
+    """
+    spec = os.environ.get("MINERU_REPLICA_CPUSETS", "").strip()
+    if spec:
+        cpusets = [_parse_cpu_list(item) for item in spec.split(";") if item.strip()]
+        if len(cpusets) != replicas:
+            raise ValueError(
+                f"MINERU_REPLICA_CPUSETS 定义了 {len(cpusets)} 组 CPU，与 MINERU_REPLICAS={replicas} 不一致"
+            )
+        return cpusets
+
+    try:
+        available = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        available = list(range(os.cpu_count() or 1))
+
+    if len(available) < replicas:
+        # CPU 少于副本数时不做绑定，各副本共享全部 CPU
+        return [available for _ in range(replicas)]
+
+    size = len(available) // replicas
+    return [available[i * size:(i + 1) * size] for i in range(replicas)]
+
+
+def _replica_main(index: int, threads: int, cpus: List[int], jobs: Any, results: Any) -> None:
+    """副本进程入口：绑定 CPU、限制线程数，然后循环处理任务"""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    timings: Dict[str, float] = {}
+    try:
+        timings = {phase: round(seconds, 3) for phase, seconds in _warmup_in_process().items()}
+    except Exception as e:
+        logger.error(f"❌ Replica {index} warmup failed: {e}")
+    logger.info(f"🧩 Replica {index} ready (pid={os.getpid()}, threads={threads}, cpus={cpus}, startup={timings})")
+    results.put(("ready", index, None, (os.getpid(), timings), 0.0))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, pdf_paths, output_dir, langs = job
+        started = time.time()
+        try:
+            md_paths = _run_do_parse_batch(pdf_paths, output_dir, langs)
+            results.put(("done", index, job_id, md_paths, time.time() - started))
+        except Exception as e:
+            logger.exception(e)
+            results.put(("error", index, job_id, f"{type(e).__name__}: {e}", time.time() - started))
+
+
+class _Replica:
+    def __init__(self, index: int, threads: int, cpus: List[int]) -> None:
+        self.index = index
+        self.threads = threads
+        self.cpus = cpus
+        self.process: Any = None
+        self.jobs: Any = None
+        self.pid: Optional[int] = None
+        self.ready = False
+        self.outstanding: Dict[str, Future] = {}
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.restarts = 0
+        self.startup: Dict[str, float] = {}
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class _ReplicaPool:
+    """
+    模型副本进程池
+
+    任务分发给未完成任务最少的副本（相同时选择累计繁忙时间最短的），
+    副本进程异常退出时，其未完成任务以错误结束并自动重启该副本。
+    """
+
+    def __init__(self, replicas: int, threads: Optional[int] = None) -> None:
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._started_at = time.time()
+        cpusets = _plan_replica_cpusets(replicas)
+        self._replicas = [
+            _Replica(i, threads or max(1, len(cpusets[i])), cpusets[i])
+            for i in range(replicas)
+        ]
+
+    def start(self) -> None:
+        self._started_at = time.time()
+        for replica in self._replicas:
+            self._spawn(replica)
+        threading.Thread(target=self._collect, name="replica-collector", daemon=True).start()
+        threading.Thread(target=self._monitor, name="replica-monitor", daemon=True).start()
+
+    def _spawn(self, replica: _Replica) -> None:
+        replica.jobs = self._ctx.Queue()
+        replica.ready = False
+        process = self._ctx.Process(
+            target=_replica_main,
+            args=(replica.index, replica.threads, replica.cpus, replica.jobs, self._results),
+            name=f"mineru-replica-{replica.index}",
+        )
+        # spawn 的子进程继承启动时的环境变量，线程数需在子进程导入 torch 之前生效
+        with _SPAWN_ENV_LOCK:
+            saved = {name: os.environ.get(name) for name in _THREAD_ENV_VARS}
+            try:
+                for name in _THREAD_ENV_VARS:
+                    os.environ[name] = str(replica.threads)
+                process.start()
+            finally:
+                for name, value in saved.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+        replica.process = process
+        replica.pid = process.pid
+        logger.info(
+            f"🧩 Started replica {replica.index} (pid={process.pid}, threads={replica.threads}, cpus={replica.cpus})"
+        )
+
+    def submit(self, pdf_paths: List[str], output_dir: str, langs: List[Optional[str]]) -> Future:
+        """提交一组 PDF，Future 的结果为对应的 Markdown 路径列表"""
+        future: Future = Future()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            candidates = [r for r in self._replicas if r.alive()]
+            if not candidates:
+                raise RuntimeError("没有可用的 MinerU 模型副本进程")
+            replica = min(candidates, key=lambda r: (len(r.outstanding), r.busy_seconds))
+            replica.outstanding[job_id] = future
+            replica.jobs.put((job_id, pdf_paths, output_dir, langs))
+        return future
+
+    def _collect(self) -> None:
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            kind, index, job_id, payload, busy = message
+            replica = self._replicas[index]
+            if kind == "ready":
+                pid, timings = payload
+                with self._lock:
+                    if replica.pid == pid:
+                        replica.ready = True
+                        replica.startup = timings
+                _mark_replica_ready()
+                continue
+
+            with self._lock:
+                future = replica.outstanding.pop(job_id, None)
+                replica.busy_seconds += busy
+                if kind == "done":
+                    replica.completed += 1
+                else:
+                    replica.failed += 1
+            metric_observe(f"replica_{index}_job_seconds", busy)
+
+            if future is None:
+                continue
+            if kind == "done":
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _monitor(self) -> None:
+        while not self._stopping:
+            time.sleep(2)
+            for replica in self._replicas:
+                if self._stopping or replica.process is None or replica.alive():
+                    continue
+                exitcode = replica.process.exitcode
+                logger.error(f"❌ Replica {replica.index} exited unexpectedly (exit code {exitcode}), restarting")
+                with self._lock:
+                    lost = list(replica.outstanding.values())
+                    replica.outstanding.clear()
+                    replica.restarts += 1
+                for future in lost:
+                    if future.done():
+                        continue
+                    future.set_exception(
+                        RuntimeError(f"MinerU 模型副本 {replica.index} 异常退出（exit code {exitcode}）")
+                    )
+                metric_inc("replica_restarts_total")
+                self._spawn(replica)
+
+    def abort(self, future: Future) -> None:
+        """终止正在处理该任务的副本进程（任务超时），监控线程会自动重启该副本"""
+        with self._lock:
+            for replica in self._replicas:
+                for job_id, candidate in list(replica.outstanding.items()):
+                    if candidate is not future:
+                        continue
+                    replica.outstanding.pop(job_id)
+                    if replica.alive():
+                        logger.warning(f"⏱️  Killing replica {replica.index} (pid={replica.pid}) after job timeout")
+                        replica.process.kill()
+                    return
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping = True
+        for replica in self._replicas:
+            if replica.alive():
+                replica.jobs.put(None)
+        for replica in self._replicas:
+            if replica.process is None:
+                continue
+            replica.process.join(timeout)
+            if replica.process.is_alive():
+                replica.process.terminate()
+        self._results.put(None)
+
+    def stats(self) -> List[Dict[str, object]]:
+        uptime = max(time.time() - self._started_at, 1e-6)
+        with self._lock:
+            return [
+                {
+                    "index": r.index,
+                    "pid": r.pid,
+                    "alive": r.alive(),
+                    "ready": r.ready,
+                    "threads": r.threads,
+                    "cpus": r.cpus,
+                    "outstanding": len(r.outstanding),
+                    "completed": r.completed,
+                    "failed": r.failed,
+                    "busy_seconds": round(r.busy_seconds, 3),
+                    "utilization": round(min(r.busy_seconds / uptime, 1.0), 4),
+                    "restarts": r.restarts,
+                    "startup": r.startup,
+                }
+                for r in self._replicas
+            ]
+
+
+# 在 lifespan 启动阶段创建（副本进程 import 本模块时不会启动新的进程池）
+REPLICA_POOL: Optional[_ReplicaPool] = None
+
+
+def _mark_replica_ready() -> None:
+    """首个副本就绪后，服务即视为模型已预热"""
+    global MODEL_WARMED_UP
+
+    if not _MODEL_READY.is_set():
+        MODEL_WARMED_UP = True
+        STARTUP_TIMINGS["ready_seconds"] = round(time.time() - _MODULE_START, 3)
+        logger.info(f"⏱️  First replica ready, startup timings: {STARTUP_TIMINGS}")
+        _MODEL_READY.set()
+
+
+def _start_replica_pool() -> None:
+    global REPLICA_POOL
+
+    if MINERU_REPLICAS <= 0 or REPLICA_POOL is not None:
+        return
+    if not MINERU_API_AVAILABLE:
+        logger.warning("⚠️  MINERU_REPLICAS is set but Python API is not available, replicas disabled")
+        return
+
+    threads_env = os.environ.get("MINERU_REPLICA_THREADS")
+    REPLICA_POOL = _ReplicaPool(MINERU_REPLICAS, int(threads_env) if threads_env else None)
+    REPLICA_POOL.start()
+    logger.info(f"🧩 Replica scheduler enabled with {MINERU_REPLICAS} model replicas")
+
+
+def _process_pdfs_with_python_api(
+    pdf_paths: List[str],
+    output_dir: str,
+    langs: List[Optional[str]],
+    timeout: Optional[float] = None,
+) -> List[str]:
+    """
+    使用 MinerU Python API (do_parse) 处理一组 PDF（模型常驻内存，快速）
+    
+    使用 mineru.cli.client.do_parse 函数，该函数在首次调用时加载模型，
+    后续调用会复用已加载的模型，避免重复加载。
+    启用副本模式（MINERU_REPLICAS > 0）时，任务交给负载最低的模型副本进程处理，
+    超过 timeout 时终止该副本并抛出 subprocess.TimeoutExpired；进程内模式无法中断 do_parse，timeout 不生效。
+    
+    Returns:
+        List[str]: Markdown 文件路径列表
+    """
+    if not MINERU_API_AVAILABLE:
+        raise RuntimeError("MinerU Python API not available")
+    
+    try:
+        if REPLICA_POOL is not None:
+            logger.info(f"📄 Dispatching {len(pdf_paths)} document(s) to model replica")
+            future = REPLICA_POOL.submit(pdf_paths, output_dir, langs)
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                REPLICA_POOL.abort(future)
+                raise subprocess.TimeoutExpired("mineru-replica", timeout or 0)
+
+        if not _MODEL_READY.is_set():
+            logger.info("⏳ Waiting for model warmup to finish...")
+        if not _MODEL_READY.wait(MINERU_READY_WAIT_SECONDS):
+            raise RuntimeError("MinerU 模型预热超时")
+        if not MINERU_API_AVAILABLE:
+            raise RuntimeError("MinerU Python API not available")
+
+        logger.info(f"📄 Processing {len(pdf_paths)} document(s) with Python API (persistent model)")
+        return _run_do_parse_batch(pdf_paths, output_dir, langs)
         
     except Exception as e:
         logger.error(f"❌ Python API processing failed: {e}")
@@ -411,9 +1037,21 @@ def _process_pdf_with_python_api(pdf_path: str, output_dir: str, lang: Optional[
         raise
 
 
-def _process_pdf_with_cli(pdf_path: str, output_dir: str) -> str:
+def _process_pdf_with_python_api(
+    pdf_path: str,
+    output_dir: str,
+    lang: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """使用 MinerU Python API 处理单个 PDF，返回 Markdown 文件路径"""
+    return _process_pdfs_with_python_api([pdf_path], output_dir, [lang], timeout)[0]
+
+
+def _process_pdf_with_cli(pdf_path: str, output_dir: str, timeout: Optional[float] = None) -> str:
     """
     使用 MinerU CLI 处理 PDF（降级方案）
+
+    timeout 为按文档预估耗时计算的超时时间，未提供时使用 MINERU_TIMEOUT_SECONDS。
     
     Returns:
         str: Markdown 文件路径
@@ -430,7 +1068,7 @@ def _process_pdf_with_cli(pdf_path: str, output_dir: str) -> str:
         cmd,
         capture_output=True,
         text=True,
-        timeout=int(os.environ.get("MINERU_TIMEOUT_SECONDS", "300")),
+        timeout=timeout or MINERU_TIMEOUT_SECONDS,
         env={
             **os.environ,
             "MINERU_MODEL_SOURCE": os.environ.get("MINERU_MODEL_SOURCE", "local"),
@@ -470,20 +1108,1060 @@ def _process_pdf_with_cli(pdf_path: str, output_dir: str) -> str:
     return md_path
 
 
-@app.post("/v4/extract/task")
-def create_task(
-    file: UploadFile = File(...),
-    document_id: Optional[str] = Form(None),
-    lang: Optional[str] = Form(None)
-) -> JSONResponse:
+@dataclass
+class _ParseOutcome:
+    """一次 PDF 解析的产物（可被合并的请求共享）"""
+    work_dir: str
+    output_dir: str
+    filename: str
+    markdown: str
+    backend: str
+    schedule: Optional[Dict[str, object]] = None
+
+
+def _cleanup_parse_outcome(outcome: _ParseOutcome) -> None:
+    SCRATCH.release(outcome.work_dir)
+
+
+# 相同内容 + 相同参数的并发解析请求合并为一次
+_PARSE_FLIGHTS = SingleFlight("parse", cleanup=_cleanup_parse_outcome)
+
+
+def _parse_pdf_file(
+    pdf_path: str,
+    output_dir: str,
+    lang: Optional[str],
+    timeout: Optional[float] = None,
+) -> Tuple[str, str]:
     """
-    创建文档提取任务（优化版 - 优先使用 Python API）
-    
-    参数:
-        - file: PDF 文件
+    解析单个 PDF，返回 (Markdown 路径, 实际使用的后端)
+
+    优先使用 Python API（模型常驻），否则降级到 CLI。超时不降级，直接抛出。
+    """
+    try:
+        if MINERU_API_AVAILABLE:
+            return _process_pdf_with_python_api(pdf_path, output_dir, lang, timeout), "python-api-persistent"
+        return _process_pdf_with_cli(pdf_path, output_dir, timeout), "cli-fallback"
+    except subprocess.TimeoutExpired:
+        raise
+    except Exception as api_error:
+        logger.warning(f"Python API failed, falling back to CLI: {api_error}")
+        return _process_pdf_with_cli(pdf_path, output_dir, timeout), "cli-fallback"
+
+
+def _split_pages(markdown_content: str) -> List[Dict[str, object]]:
+    """按段落切分 Markdown，生成 pages 列表"""
+    paragraphs = [p.strip() for p in markdown_content.split("\n\n") if p.strip()]
+    pages: List[Dict[str, object]] = []
+    for idx, paragraph in enumerate(paragraphs, start=1):
+        pages.append(
+            {
+                "pageNum": idx,
+                "content": paragraph,
+                "tokens": len(paragraph.split()),
+            }
+        )
+    return pages
+
+
+# PDFium 不是线程安全的：本文件中所有 pypdfium2 调用（页数预扫描、语言检测、页面指纹、抽取页面）
+# 以及本进程内的 do_parse（含预热）都在这把锁内进行，并发请求不会同时进入 PDFium；
+# OCR 等不涉及 PDFium 的计算在锁外进行。副本模式下 do_parse 在副本进程中执行，不占用这把锁
+_PDFIUM_LOCK = threading.Lock()
+
+
+# 语言自动检测（lang=auto 或 MINERU_DEFAULT_LANG=auto 时启用）：按文本层（或少量页的低分辨率 OCR）
+# 判断文字体系，选择对应的 OCR 模型。未指定 lang 时默认仍使用 ch，不做额外的 PDFium 预读
+MINERU_DEFAULT_LANG = os.environ.get("MINERU_DEFAULT_LANG", "ch").strip() or "ch"
+LANG_DETECT_FALLBACK = os.environ.get("LANG_DETECT_FALLBACK", "ch")
+LANG_DETECT_SAMPLE_PAGES = int(os.environ.get("LANG_DETECT_SAMPLE_PAGES", "5"))
+LANG_DETECT_MIN_CHARS = int(os.environ.get("LANG_DETECT_MIN_CHARS", "200"))
+LANG_DETECT_OCR_PROBE = os.environ.get("LANG_DETECT_OCR_PROBE", "true").lower() in {"1", "true", "yes", "on"}
+LANG_DETECT_OCR_PAGES = int(os.environ.get("LANG_DETECT_OCR_PAGES", "2"))
+LANG_DETECT_OCR_SCALE = float(os.environ.get("LANG_DETECT_OCR_SCALE", "1.0"))
+
+# (起始码位, 结束码位, 文字体系)
+_SCRIPT_RANGES: Tuple[Tuple[int, int, str], ...] = (
+    (0x0041, 0x005A, "latin"),
+    (0x0061, 0x007A, "latin"),
+    (0x00C0, 0x024F, "latin"),
+    (0x0370, 0x03FF, "greek"),
+    (0x0400, 0x04FF, "cyrillic"),
+    (0x0600, 0x06FF, "arabic"),
+    (0x0750, 0x077F, "arabic"),
+    (0x0900, 0x097F, "devanagari"),
+    (0x0B80, 0x0BFF, "tamil"),
+    (0x0C00, 0x0C7F, "telugu"),
+    (0x0C80, 0x0CFF, "kannada"),
+    (0x0E00, 0x0E7F, "thai"),
+    (0x1100, 0x11FF, "hangul"),
+    (0x3040, 0x30FF, "kana"),
+    (0x3130, 0x318F, "hangul"),
+    (0x3400, 0x4DBF, "han"),
+    (0x4E00, 0x9FFF, "han"),
+    (0xAC00, 0xD7AF, "hangul"),
+    (0xF900, 0xFAFF, "han"),
+    (0xFF66, 0xFF9F, "kana"),
+)
+
+# 非 CJK 文字体系 -> MinerU 语言代码
+_SCRIPT_TO_MINERU_LANG = {
+    "cyrillic": "cyrillic",
+    "arabic": "arabic",
+    "devanagari": "devanagari",
+    "thai": "th",
+    "greek": "el",
+    "tamil": "ta",
+    "telugu": "te",
+    "kannada": "ka",
+}
+
+# 繁简字形不同的常用字，用于区分 chinese_cht 与 ch
+_TRADITIONAL_MARKERS = frozenset("們這個說對時會來國學過還後開見實點題體關與為裡發經現")
+_SIMPLIFIED_MARKERS = frozenset("们这个说对时会来国学过还后开见实点题体关与为里发经现")
+
+# 拉丁字母文档：英文使用 en 模型，其余西欧语言使用 latin 模型
+_ENGLISH_STOPWORDS = frozenset(
+    "the and of to in is that for with are was this by on from be as were which".split()
+)
+_OTHER_LATIN_STOPWORDS = frozenset(
+    "le la les des du et est une dans pour der die das und ist nicht mit den el los las del que por con "
+    "il di che della gli não uma para com".split()
+)
+
+
+def _classify_script(text: str) -> Tuple[str, float, Dict[str, int]]:
+    """
+    按 Unicode 文字体系统计字符并映射到 MinerU 语言代码
+
+    Returns:
+        (语言代码, 置信度 0-1, 各文字体系的字符数)
+    """
+    counts: Dict[str, int] = {}
+    for char in text:
+        code = ord(char)
+        if code < 0x41:
+            continue
+        for start, end, script in _SCRIPT_RANGES:
+            if start <= code <= end:
+                counts[script] = counts.get(script, 0) + 1
+                break
+
+    total = sum(counts.values())
+    if total == 0:
+        return LANG_DETECT_FALLBACK, 0.0, counts
+
+    han = counts.get("han", 0)
+    kana = counts.get("kana", 0)
+    hangul = counts.get("hangul", 0)
+    cjk = han + kana + hangul
+    # 中日韩文献中常夹杂大量英文术语，只要 CJK 字符占比达到 10% 就按 CJK 处理
+    if cjk / total >= 0.1:
+        if kana >= max(10, cjk * 0.05):
+            return "japan", round(min(1.0, (han + kana) / total + 0.2), 3), counts
+        if hangul >= max(10, cjk * 0.3):
+            return "korean", round(min(1.0, (hangul + han) / total + 0.2), 3), counts
+        traditional = sum(1 for char in text if char in _TRADITIONAL_MARKERS)
+        simplified = sum(1 for char in text if char in _SIMPLIFIED_MARKERS)
+        lang = "chinese_cht" if traditional > simplified else "ch"
+        return lang, round(min(1.0, cjk / total + 0.2), 3), counts
+
+    script, dominant = max(counts.items(), key=lambda pair: pair[1])
+    confidence = round(dominant / total, 3)
+    if script != "latin":
+        return _SCRIPT_TO_MINERU_LANG.get(script, LANG_DETECT_FALLBACK), confidence, counts
+
+    words = re.findall(r"[^\W\d_]+", text.lower())
+    english = sum(1 for word in words if word in _ENGLISH_STOPWORDS)
+    other = sum(1 for word in words if word in _OTHER_LATIN_STOPWORDS)
+    if other > english:
+        return "latin", round(confidence * other / (english + other), 3), counts
+    return "en", confidence, counts
+
+
+def _sample_page_indices(page_count: int, limit: int) -> List[int]:
+    """均匀抽取页码（总是包含首页），避免只看封面"""
+    if page_count <= limit:
+        return list(range(page_count))
+    step = page_count / limit
+    return sorted({int(i * step) for i in range(limit)})
+
+
+def _collect_ocr_text(value: object, out: List[str]) -> None:
+    """从 OCR 结果中递归提取识别文本（兼容不同版本的返回结构）"""
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, (list, tuple)):
+        for element in value:
+            _collect_ocr_text(element, out)
+
+
+def _ocr_probe_enabled() -> bool:
+    """OCR 探测复用 MinerU 已加载的 OCR 模型；模型未就绪或运行在副本模式（前端进程没有模型）时跳过"""
+    return LANG_DETECT_OCR_PROBE and MINERU_API_AVAILABLE and REPLICA_POOL is None and _MODEL_READY.is_set()
+
+
+def _render_probe_pages(pdf: Any, page_indices: List[int]) -> List[Any]:
+    """把少量页渲染为低分辨率图像（调用方持有 _PDFIUM_LOCK）"""
+    images: List[Any] = []
+    for index in page_indices[:LANG_DETECT_OCR_PAGES]:
+        page = pdf[index]
+        try:
+            images.append(page.render(scale=LANG_DETECT_OCR_SCALE).to_numpy())
+        finally:
+            page.close()
+    return images
+
+
+def _ocr_probe_text(images: List[Any]) -> Optional[str]:
+    """对渲染好的页面图像做 OCR，返回识别出的文本"""
+    try:
+        from mineru.backend.pipeline.model_init import AtomModelSingleton  # type: ignore
+        from mineru.backend.pipeline.model_list import AtomicModel  # type: ignore
+
+        ocr_model = AtomModelSingleton().get_atom_model(
+            atom_model_name=AtomicModel.OCR,
+            det_db_box_thresh=0.3,
+            lang="ch",
+        )
+        texts: List[str] = []
+        for image in images:
+            _collect_ocr_text(ocr_model.ocr(image), texts)
+        return " ".join(texts)
+    except Exception as e:
+        logger.warning(f"⚠️ OCR language probe failed: {e}")
+        return None
+
+
+def _detect_language(source: Union[str, bytes]) -> Dict[str, object]:
+    """
+    检测 PDF 的主要语言（source 为文件路径或 PDF 字节）
+
+    先读取抽样页的文本层；文本过少（扫描件）时对少量页做低分辨率 OCR。
+    检测失败时回退到 LANG_DETECT_FALLBACK。
+    """
+    start = time.time()
+    detection: Dict[str, object] = {"lang": LANG_DETECT_FALLBACK, "confidence": 0.0, "source": "default"}
+    try:
+        import pypdfium2 as pdfium  # type: ignore
+
+        probe_images: List[Any] = []
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(source)
+            try:
+                page_indices = _sample_page_indices(len(pdf), max(1, LANG_DETECT_SAMPLE_PAGES))
+                parts: List[str] = []
+                for index in page_indices:
+                    page = pdf[index]
+                    try:
+                        textpage = page.get_textpage()
+                        parts.append(textpage.get_text_range())
+                        textpage.close()
+                    finally:
+                        page.close()
+                text = "\n".join(parts)
+                if len(text.strip()) < LANG_DETECT_MIN_CHARS and _ocr_probe_enabled():
+                    probe_images = _render_probe_pages(pdf, page_indices)
+            finally:
+                pdf.close()
+
+        text_source = "text-layer"
+        if probe_images:
+            ocr_text = _ocr_probe_text(probe_images)
+            if ocr_text:
+                text, text_source = ocr_text, "ocr-probe"
+
+        lang, confidence, counts = _classify_script(text)
+        if sum(counts.values()) > 0:
+            detection = {
+                "lang": lang,
+                "confidence": confidence,
+                "source": text_source,
+                "sampledPages": len(page_indices),
+                "scripts": counts,
+            }
+    except Exception as e:
+        logger.warning(f"⚠️ Language detection failed, using {LANG_DETECT_FALLBACK}: {e}")
+
+    elapsed = time.time() - start
+    detection["detectionMs"] = int(elapsed * 1000)
+    metric_inc("lang_detect_total")
+    metric_inc(f"lang_detect_{detection['lang']}_total")
+    metric_observe("lang_detect_seconds", elapsed)
+    return detection
+
+
+def _resolve_lang(source: Union[str, bytes], lang: Optional[str]) -> Tuple[str, Optional[Dict[str, object]]]:
+    """
+    确定实际使用的语言：显式指定的语言原样使用；未指定时使用 MINERU_DEFAULT_LANG，
+    其值为 'auto' 时自动检测。
+
+    Returns:
+        (语言代码, 检测结果；未检测时为 None)
+    """
+    requested = (lang or MINERU_DEFAULT_LANG).strip()
+    if requested.lower() != "auto":
+        return requested, None
+    detection = _detect_language(source)
+    logger.info(
+        f"🌐 Detected language {detection['lang']} "
+        f"(confidence {detection['confidence']}, {detection['source']}, {detection['detectionMs']}ms)"
+    )
+    return str(detection["lang"]), detection
+
+
+# 解析调度：受理时预扫描页数估算耗时，按策略决定等待中的解析任务的执行顺序
+# - fifo: 按到达顺序
+# - sjf:  预估耗时短的优先；等待时间按 MINERU_SCHED_AGING_RATE 抵扣预估耗时，避免大文档饿死
+# - fair: 按租户（X-Tenant-Id）公平排队，已获得服务时间（按预估耗时计）最少的租户优先，租户内按到达顺序
+MINERU_SCHED_POLICY = os.environ.get("MINERU_SCHED_POLICY", "sjf").lower()
+MINERU_SCHED_AGING_RATE = float(os.environ.get("MINERU_SCHED_AGING_RATE", "1.0"))
+# 进程内模式同时执行的解析数（副本模式下等于副本数）
+MINERU_PARSE_CONCURRENCY = int(os.environ.get("MINERU_PARSE_CONCURRENCY", "1"))
+# 耗时模型初值：固定开销 + 每页耗时（每页耗时随实际运行结果滑动更新）
+MINERU_SCHED_BASE_SECONDS = float(os.environ.get("MINERU_SCHED_BASE_SECONDS", "5"))
+MINERU_SCHED_SECONDS_PER_PAGE = float(os.environ.get("MINERU_SCHED_SECONDS_PER_PAGE", "2"))
+# 页数预扫描等待 PDFium 锁的最长时间（秒），超过后按文件大小估算
+MINERU_SCHED_PRESCAN_WAIT_SECONDS = float(os.environ.get("MINERU_SCHED_PRESCAN_WAIT_SECONDS", "2"))
+# 超时 = MINERU_TIMEOUT_MIN_SECONDS + MINERU_TIMEOUT_FACTOR × 预估耗时，不超过 MINERU_TIMEOUT_MAX_SECONDS；
+# 无法预估页数时使用 MINERU_TIMEOUT_SECONDS
+MINERU_TIMEOUT_SECONDS = float(os.environ.get("MINERU_TIMEOUT_SECONDS", "300"))
+MINERU_TIMEOUT_MIN_SECONDS = float(os.environ.get("MINERU_TIMEOUT_MIN_SECONDS", "60"))
+MINERU_TIMEOUT_FACTOR = float(os.environ.get("MINERU_TIMEOUT_FACTOR", "3"))
+MINERU_TIMEOUT_MAX_SECONDS = float(os.environ.get("MINERU_TIMEOUT_MAX_SECONDS", "7200"))
+_SCHED_POLICIES = ("fifo", "sjf", "fair")
+
+
+@dataclass
+class _CostEstimate:
+    """受理时的预扫描结果"""
+    pages: Optional[int]
+    size: int
+    seconds: float
+    timeout: float
+
+    def combine(self, other: "_CostEstimate") -> "_CostEstimate":
+        """合并为一组文档的估算（批量接口一组调用一次 do_parse）"""
+        pages = None if self.pages is None or other.pages is None else self.pages + other.pages
+        seconds = self.seconds + other.seconds
+        return _CostEstimate(pages, self.size + other.size, seconds, _timeout_for(seconds, pages))
+
+
+@dataclass
+class _Ticket:
+    """等待或正在执行的解析任务"""
+    seq: int
+    tenant: str
+    estimate: _CostEstimate
+    enqueued_at: float
+    started_at: Optional[float] = None
+    finish_tag: float = 0.0
+
+
+def _timeout_for(seconds: float, pages: Optional[int]) -> float:
+    if pages is None:
+        return MINERU_TIMEOUT_SECONDS
+    return min(MINERU_TIMEOUT_MAX_SECONDS, MINERU_TIMEOUT_MIN_SECONDS + MINERU_TIMEOUT_FACTOR * seconds)
+
+
+class _ParseScheduler:
+    """
+    解析准入调度器
+
+    同时执行的解析数不超过 slots，其余任务排队；空出执行位时按策略选出下一个任务。
+    每次执行结束后用实际耗时更新每页耗时（EWMA），并记录预估与实际耗时。
+    """
+
+    def __init__(self, policy: str, aging_rate: float) -> None:
+        if policy not in _SCHED_POLICIES:
+            logger.warning(f"⚠️  Unknown MINERU_SCHED_POLICY={policy}, using sjf")
+            policy = "sjf"
+        self.policy = policy
+        self.aging_rate = aging_rate
+        self.seconds_per_page = MINERU_SCHED_SECONDS_PER_PAGE
+        self._cond = threading.Condition()
+        self._waiting: List[_Ticket] = []
+        self._running: List[_Ticket] = []
+        self._seq = 0
+        # fair 策略：每个租户的虚拟完成时间（累计预估耗时），新活跃的租户从当前虚拟时间开始
+        self._tenant_tags: Dict[str, float] = {}
+        self._virtual_time = 0.0
+
+    @property
+    def slots(self) -> int:
+        if REPLICA_POOL is not None:
+            return max(1, MINERU_REPLICAS)
+        return max(1, MINERU_PARSE_CONCURRENCY)
+
+    def estimate(self, source: Union[str, bytes], size: int) -> _CostEstimate:
+        """预扫描页数（只读取 PDF 交叉引用表，不解析页面内容）并估算耗时"""
+        pages: Optional[int] = None
+        try:
+            import pypdfium2 as pdfium  # type: ignore
+
+            # 进程内解析占用 PDFium 时不等待，按文件大小估算，避免受理排队被阻塞
+            if _PDFIUM_LOCK.acquire(timeout=MINERU_SCHED_PRESCAN_WAIT_SECONDS):
+                try:
+                    pdf = pdfium.PdfDocument(source)
+                    try:
+                        pages = len(pdf)
+                    finally:
+                        pdf.close()
+                finally:
+                    _PDFIUM_LOCK.release()
+            else:
+                metric_inc("sched_prescan_skipped_total")
+        except Exception as e:
+            logger.warning(f"⚠️  Page-count pre-scan failed: {e}")
+        if pages is None:
+            # 无法读取页数时按文件大小粗略估算（约 100KB 一页）
+            seconds = MINERU_SCHED_BASE_SECONDS + self.seconds_per_page * max(1, size // (100 * 1024))
+        else:
+            seconds = MINERU_SCHED_BASE_SECONDS + self.seconds_per_page * pages
+        return _CostEstimate(pages, size, round(seconds, 2), round(_timeout_for(seconds, pages), 1))
+
+    def _sort_key(self, ticket: _Ticket) -> Tuple[float, ...]:
+        if self.policy == "fifo":
+            return (ticket.seq,)
+        # 所有等待任务的老化速度相同，按到达时间折算后排序结果不随时间变化
+        sjf = ticket.estimate.seconds + self.aging_rate * ticket.enqueued_at
+        if self.policy == "fair":
+            return (ticket.finish_tag, sjf, ticket.seq)
+        return (sjf, ticket.seq)
+
+    def _admit(self, tenant: str, estimate: _CostEstimate) -> _Ticket:
+        self._seq += 1
+        ticket = _Ticket(self._seq, tenant, estimate, time.time())
+        if self.policy == "fair":
+            start = self._tenant_tags.get(tenant, 0.0)
+            if not any(t.tenant == tenant for t in self._waiting + self._running):
+                # 重新活跃的租户不能用空闲期间“攒下”的份额插队
+                start = max(start, self._virtual_time)
+            ticket.finish_tag = start + estimate.seconds
+            self._tenant_tags[tenant] = ticket.finish_tag
+        return ticket
+
+    @contextmanager
+    def slot(self, tenant: str, estimate: _CostEstimate) -> Iterator[_Ticket]:
+        """排队等待执行位，退出时释放执行位并记录实际耗时"""
+        with self._cond:
+            ticket = self._admit(tenant, estimate)
+            self._waiting.append(ticket)
+            self._cond.notify_all()
+            while not (
+                len(self._running) < self.slots
+                and min(self._waiting, key=self._sort_key) is ticket
+            ):
+                self._cond.wait()
+            self._waiting.remove(ticket)
+            self._running.append(ticket)
+            ticket.started_at = time.time()
+            if self.policy == "fair":
+                self._virtual_time = max(self._virtual_time, ticket.finish_tag - estimate.seconds)
+            waiting = len(self._waiting)
+
+        wait = ticket.started_at - ticket.enqueued_at
+        metric_observe("sched_queue_wait_seconds", wait)
+        if wait > 1:
+            logger.info(
+                f"🗓️  Parse started after {wait:.1f}s in queue "
+                f"(tenant={tenant}, pages={estimate.pages}, estimated={estimate.seconds}s, {waiting} still waiting)"
+            )
+        succeeded = False
+        try:
+            yield ticket
+            succeeded = True
+        finally:
+            actual = time.time() - ticket.started_at
+            with self._cond:
+                self._running.remove(ticket)
+                if succeeded:
+                    self._observe(ticket, actual)
+                self._cond.notify_all()
+
+    def _observe(self, ticket: _Ticket, actual: float) -> None:
+        """记录预估 / 实际耗时，并更新每页耗时（调用方持有锁）"""
+        predicted = ticket.estimate.seconds
+        metric_observe("sched_predicted_seconds", predicted)
+        metric_observe("sched_actual_seconds", actual)
+        metric_observe("sched_actual_to_predicted_ratio", actual / max(predicted, 1e-3))
+        pages = ticket.estimate.pages
+        if pages:
+            per_page = max(0.0, actual - MINERU_SCHED_BASE_SECONDS) / pages
+            self.seconds_per_page = round(0.8 * self.seconds_per_page + 0.2 * per_page, 4)
+
+    def stats(self) -> Dict[str, object]:
+        now = time.time()
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "slots": self.slots,
+                "secondsPerPage": self.seconds_per_page,
+                "running": [
+                    {
+                        "tenant": t.tenant,
+                        "pages": t.estimate.pages,
+                        "estimatedSeconds": t.estimate.seconds,
+                        "runningSeconds": round(now - (t.started_at or now), 1),
+                    }
+                    for t in self._running
+                ],
+                "waiting": [
+                    {
+                        "tenant": t.tenant,
+                        "pages": t.estimate.pages,
+                        "estimatedSeconds": t.estimate.seconds,
+                        "waitingSeconds": round(now - t.enqueued_at, 1),
+                    }
+                    for t in sorted(self._waiting, key=self._sort_key)
+                ],
+            }
+
+
+SCHEDULER = _ParseScheduler(MINERU_SCHED_POLICY, MINERU_SCHED_AGING_RATE)
+
+
+def _schedule_metadata(ticket: _Ticket, finished_at: float) -> Dict[str, object]:
+    """响应中返回的调度信息（预估与实际耗时）"""
+    started_at = ticket.started_at or finished_at
+    return {
+        "policy": SCHEDULER.policy,
+        "tenant": ticket.tenant,
+        "pages": ticket.estimate.pages,
+        "estimatedSeconds": ticket.estimate.seconds,
+        "actualSeconds": round(finished_at - started_at, 2),
+        "queueWaitMs": int((started_at - ticket.enqueued_at) * 1000),
+        "timeoutSeconds": ticket.estimate.timeout,
+    }
+
+
+def _parse_upload(
+    filename: str,
+    data: bytes,
+    lang: Optional[str],
+    tenant: str,
+    estimate: _CostEstimate,
+) -> _ParseOutcome:
+    """将上传内容写入临时目录，排队等待执行位后解析，返回解析产物（失败时清理临时目录）"""
+    temp_dir = SCRATCH.allocate(int(len(data) * SCRATCH_EXPANSION_FACTOR))
+    try:
+        pdf_path = os.path.join(temp_dir, filename)
+        output_dir = os.path.join(temp_dir, "output")
+
+        with open(pdf_path, "wb") as f:
+            f.write(data)
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        with SCHEDULER.slot(tenant, estimate) as ticket:
+            logger.info(f"Processing {filename} ({estimate.pages} pages, estimated {estimate.seconds}s)...")
+            md_path, backend_used = _parse_pdf_file(pdf_path, output_dir, lang, estimate.timeout)
+        schedule = _schedule_metadata(ticket, time.time())
+
+        logger.info(f"Found markdown file: {md_path}")
+
+        with open(md_path, "r", encoding="utf-8") as f:
+            markdown_content = f.read()
+
+        return _ParseOutcome(
+            work_dir=temp_dir,
+            output_dir=output_dir,
+            filename=filename,
+            markdown=markdown_content,
+            backend=backend_used,
+            schedule=schedule,
+        )
+    except BaseException:
+        SCRATCH.release(temp_dir)
+        raise
+
+
+# 增量解析（默认关闭）：同一 document_id 上传新版本时，只重新解析内容发生变化的页面
+INCREMENTAL_PARSE = os.environ.get("INCREMENTAL_PARSE", "false").lower() in {"1", "true", "yes", "on"}
+# 变化页超过该比例时整份重新解析（跨页表格、标题层级等上下文更完整）
+INCREMENTAL_MAX_CHANGED_RATIO = float(os.environ.get("INCREMENTAL_MAX_CHANGED_RATIO", "0.5"))
+# 指纹中包含低分辨率渲染图（宽度像素），用于发现文本层之外的变化（图片、扫描页）；0 表示只比较文本
+PAGE_FINGERPRINT_RENDER_WIDTH = int(os.environ.get("PAGE_FINGERPRINT_RENDER_WIDTH", "64"))
+
+# MinerU 生成 Markdown 时丢弃的块类型
+_DISCARDED_BLOCK_TYPES = frozenset({"header", "footer", "page_number", "aside_text", "page_footnote"})
+# 渲染图灰度量化到 16 级，忽略抗锯齿等细微差异
+_GRAY_QUANTIZE = bytes((value >> 4) << 4 for value in range(256))
+
+
+def _page_fingerprints(data: bytes) -> Optional[List[str]]:
+    """计算每页的内容指纹（页面尺寸 + 文本层 + 低分辨率灰度渲染图），失败时返回 None"""
+    with _PDFIUM_LOCK:
+        try:
+            import pypdfium2 as pdfium  # type: ignore
+
+            pdf = pdfium.PdfDocument(data)
+        except Exception as e:
+            logger.warning(f"⚠️  Page fingerprinting failed: {e}")
+            return None
+        fingerprints: List[str] = []
+        try:
+            for index in range(len(pdf)):
+                page = pdf[index]
+                try:
+                    width, height = page.get_size()
+                    digest = hashlib.blake2b(f"{width:.1f}x{height:.1f}".encode("ascii"), digest_size=16)
+                    textpage = page.get_textpage()
+                    digest.update(" ".join(textpage.get_text_range().split()).encode("utf-8"))
+                    textpage.close()
+                    if PAGE_FINGERPRINT_RENDER_WIDTH > 0:
+                        bitmap = page.render(scale=PAGE_FINGERPRINT_RENDER_WIDTH / max(width, 1.0), grayscale=True)
+                        digest.update(bytes(bitmap.buffer).translate(_GRAY_QUANTIZE))
+                        bitmap.close()
+                    fingerprints.append(digest.hexdigest())
+                finally:
+                    page.close()
+        except Exception as e:
+            logger.warning(f"⚠️  Page fingerprinting failed: {e}")
+            return None
+        finally:
+            pdf.close()
+    return fingerprints
+
+
+def _pdf_subset(data: bytes, page_indices: List[int]) -> bytes:
+    """抽取指定页面组成新的 PDF"""
+    import pypdfium2 as pdfium  # type: ignore
+
+    with _PDFIUM_LOCK:
+        source = pdfium.PdfDocument(data)
+        subset = pdfium.PdfDocument.new()
+        try:
+            subset.import_pages(source, page_indices)
+            buffer = io.BytesIO()
+            subset.save(buffer)
+            return buffer.getvalue()
+        finally:
+            subset.close()
+            source.close()
+
+
+def _load_content_pages(output_dir: str, page_count: int) -> Optional[List[List[Dict[str, Any]]]]:
+    """读取 MinerU 输出的 content_list.json，按 page_idx 拆分为逐页的块列表"""
+    paths = sorted(Path(output_dir).glob("**/*_content_list.json"))
+    if not paths:
+        return None
+    with open(paths[0], "r", encoding="utf-8") as f:
+        blocks = json.load(f)
+    pages: List[List[Dict[str, Any]]] = [[] for _ in range(page_count)]
+    for block in blocks:
+        page_idx = block.get("page_idx")
+        if isinstance(page_idx, int) and 0 <= page_idx < page_count:
+            pages[page_idx].append({k: v for k, v in block.items() if k != "page_idx"})
+    return pages
+
+
+def _render_content_blocks(blocks: List[Dict[str, Any]]) -> str:
+    """按 MinerU 生成 Markdown 的规则把一页的 content_list 块渲染为 Markdown"""
+    parts: List[str] = []
+    for block in blocks:
+        kind = block.get("type")
+        if kind in _DISCARDED_BLOCK_TYPES:
+            continue
+        if kind == "text":
+            text = (block.get("text") or "").strip()
+            level = block.get("text_level")
+            if text:
+                parts.append(f"{'#' * int(level)} {text}" if level else text)
+        elif kind == "image":
+            lines = [f"![]({block['img_path']})"] if block.get("img_path") else []
+            lines += block.get("image_caption") or []
+            lines += block.get("image_footnote") or []
+            if lines:
+                parts.append("\n".join(lines))
+        elif kind == "table":
+            lines = list(block.get("table_caption") or [])
+            if block.get("table_body"):
+                lines.append(block["table_body"])
+            elif block.get("img_path"):
+                lines.append(f"![]({block['img_path']})")
+            lines += block.get("table_footnote") or []
+            if lines:
+                parts.append("\n".join(lines))
+        elif kind == "list":
+            items = [item for item in block.get("list_items") or [] if item]
+            if items:
+                parts.append("\n".join(items))
+        else:
+            text = (block.get("text") or block.get("code_body") or "").strip()
+            if text:
+                parts.append(text)
+    return "\n\n".join(parts)
+
+
+def _version_key(document_id: str) -> str:
+    return hashlib.sha256(document_id.encode("utf-8")).hexdigest()[:32]
+
+
+def _save_version(
+    document_id: str,
+    lang: str,
+    fingerprints: List[str],
+    pages: List[Dict[str, Any]],
+    previous: Optional[Dict[str, Any]],
+) -> int:
+    """保存本次上传的逐页指纹与解析结果（供下一个版本复用），返回版本号"""
+    version = int(previous.get("version", 0)) + 1 if previous else 1
+    VERSION_STORE.put(
+        _version_key(document_id),
+        {
+            "documentId": document_id,
+            "version": version,
+            "lang": lang,
+            "backend": os.environ.get("MINERU_BACKEND", "pipeline"),
+            "updatedAt": time.time(),
+            "pages": [dict(page, fingerprint=fp) for page, fp in zip(pages, fingerprints)],
+        },
+    )
+    return version
+
+
+# 逐页 Markdown 中 MinerU 输出的相对图片链接
+_RELATIVE_IMAGE_RE = re.compile(r"!\[([^\]]*)\]\((images/[^)\s]+)\)")
+
+
+def _render_page(blocks: List[Dict[str, Any]], uploaded: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+    """渲染一页并记录该页引用的图片已上传的对象（未上传的图片不记录；原始块不保存）"""
+    markdown = _render_content_blocks(blocks)
+    links = {m.group(2) for m in _RELATIVE_IMAGE_RE.finditer(markdown)}
+    return {
+        "markdown": markdown,
+        "images": {link: uploaded[link] for link in sorted(links) if link in uploaded},
+    }
+
+
+def _link_page(page: Dict[str, Any]) -> str:
+    """把一页 Markdown 中的相对图片链接替换为该页记录的对象 URL"""
+    images = page.get("images") or {}
+    return _RELATIVE_IMAGE_RE.sub(
+        lambda m: f"![{m.group(1)}]({images[m.group(2)]['url']})" if m.group(2) in images else m.group(0),
+        page.get("markdown") or "",
+    )
+
+
+def _join_pages(pages: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(markdown for markdown in (_link_page(page) for page in pages) if markdown)
+
+
+def _stored_images_available(pages: List[Dict[str, Any]]) -> bool:
+    """
+    复用页面引用的图片是否都已记录且仍在 MinIO 中
+
+    图片记录缺失（上一版本上传失败或由旧版本写入）或对象已被删除时返回 False，由调用方整份解析。
+    """
+    objects: Dict[str, str] = {}
+    for page in pages:
+        images = page.get("images") or {}
+        for link in {m.group(2) for m in _RELATIVE_IMAGE_RE.finditer(page.get("markdown") or "")}:
+            if link not in images:
+                return False
+            objects[images[link]["object"]] = link
+    if not objects:
+        return True
+    minio_client = _get_minio_client()
+    if minio_client is None:
+        return False
+    bucket_name = os.environ.get("MINIO_BUCKET_NAME", "deepmed")
+    for object_name in objects:
+        try:
+            minio_client.stat_object(bucket_name, object_name)
+        except S3Error as e:
+            logger.info(f"♻️  Stored image {object_name} is unavailable ({e.code}), parsing the whole document")
+            return False
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to check stored image {object_name}: {e}")
+            return False
+    return True
+
+
+def _save_full_parse(
+    document_id: str,
+    lang: str,
+    fingerprints: List[str],
+    output_dir: str,
+    uploaded: Dict[str, Dict[str, str]],
+) -> Optional[int]:
+    """
+    整份解析后记录逐页结果（供下一个版本复用），返回版本号
+
+    响应仍使用 MinerU 生成的 Markdown；这里按页渲染的 Markdown 只在之后的增量版本中拼接复用页面。
+    解析产物中没有 content_list 时不记录。
+    """
+    try:
+        content_pages = _load_content_pages(output_dir, len(fingerprints))
+        if content_pages is None:
+            return None
+        pages = [_render_page(blocks, uploaded) for blocks in content_pages]
+        return _save_version(document_id, lang, fingerprints, pages, VERSION_STORE.get(_version_key(document_id)))
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to record page versions for {document_id}: {e}")
+        return None
+
+
+def _parse_incremental(
+    filename: str,
+    data: bytes,
+    document_id: str,
+    lang: str,
+    tenant: str,
+    fingerprints: List[str],
+) -> Optional[Tuple[str, str, Optional[Dict[str, object]], Dict[str, object]]]:
+    """
+    与上一版本逐页比对指纹，只解析变化的页面并拼接到已有结果中
+
+    页面按指纹匹配（不要求页码对应），插入或删除页面时其余页面仍可复用。
+    复用页面的图片链接使用上一版本记录的对象 URL。没有可用的上一版本、变化页过多
+    或复用页面的图片缺失时返回 None，由调用方整份解析。
+
+    Returns:
+        (Markdown, 后端, 调度信息, 增量统计)
+    """
+    previous = VERSION_STORE.get(_version_key(document_id))
+    if (
+        previous is None
+        or previous.get("documentId") != document_id
+        or previous.get("lang") != lang
+        or previous.get("backend") != os.environ.get("MINERU_BACKEND", "pipeline")
+    ):
+        return None
+    known = {page["fingerprint"]: page for page in previous.get("pages", [])}
+    changed = [index for index, fp in enumerate(fingerprints) if fp not in known]
+    if len(changed) > INCREMENTAL_MAX_CHANGED_RATIO * len(fingerprints):
+        logger.info(f"♻️  {len(changed)}/{len(fingerprints)} pages changed, parsing the whole document")
+        return None
+    if not _stored_images_available([known[fp] for fp in set(fingerprints) if fp in known]):
+        return None
+
+    pages: List[Dict[str, Any]] = [known.get(fp, {}) for fp in fingerprints]
+    backend = "incremental-reuse"
+    schedule: Optional[Dict[str, object]] = None
+    if changed:
+        logger.info(f"♻️  Re-parsing {len(changed)}/{len(fingerprints)} changed pages of {document_id}")
+        subset = _pdf_subset(data, changed)
+        stem = os.path.splitext(filename)[0]
+        outcome = _parse_upload(
+            f"{stem}_pages.pdf", subset, lang, tenant, SCHEDULER.estimate(subset, len(subset))
+        )
+        try:
+            content_pages = _load_content_pages(outcome.output_dir, len(changed))
+            if content_pages is None:
+                logger.warning("⚠️  Parser output has no content_list, parsing the whole document")
+                return None
+            # 上传新解析页面中的图片
+            uploaded = _upload_output_images(outcome.output_dir, document_id)
+            for index, blocks in zip(changed, content_pages):
+                pages[index] = _render_page(blocks, uploaded)
+            backend, schedule = outcome.backend, outcome.schedule
+        finally:
+            SCRATCH.release(outcome.work_dir)
+
+    markdown_content = _join_pages(pages)
+    version = _save_version(document_id, lang, fingerprints, pages, previous)
+    metric_inc("incremental_pages_reused_total", len(fingerprints) - len(changed))
+    metric_inc("incremental_pages_reparsed_total", len(changed))
+    return markdown_content, backend, schedule, {
+        "mode": "incremental",
+        # 增量版本的全部页面由 content_list 逐页渲染拼接，与整份解析时 MinerU 生成的 Markdown 可能略有差异
+        "renderer": "content_list",
+        "version": version,
+        "pagesTotal": len(fingerprints),
+        "pagesReused": len(fingerprints) - len(changed),
+        "pagesReparsed": len(changed),
+        "reparsedPages": [index + 1 for index in changed],
+    }
+
+
+def _extract_document(
+    filename: str,
+    data: bytes,
+    document_id: Optional[str],
+    lang: Optional[str],
+    start_time: float,
+    task_id: str,
+    tenant: str = "default",
+) -> Dict[str, object]:
+    """
+    执行解析并构造成功响应体（同步请求与回调任务共用）
+
+    带 document_id 时记录逐页指纹，同一文档的新版本只重新解析变化的页面。
+    """
+    metric_inc("parse_requests_total")
+    lang, detection = _resolve_lang(data, lang)
+    fingerprints = _page_fingerprints(data) if INCREMENTAL_PARSE and document_id else None
+
+    incremental = None
+    if fingerprints and document_id:
+        incremental = _parse_incremental(filename, data, document_id, lang, tenant, fingerprints)
+
+    if incremental is not None:
+        markdown_content, backend_used, schedule, incremental_info = incremental
+        coalesced = False
+    else:
+        estimate = SCHEDULER.estimate(data, len(data))
+        key = flight_key(
+            data,
+            lang=lang or "",
+            backend=os.environ.get("MINERU_BACKEND", "pipeline"),
+        )
+
+        with _PARSE_FLIGHTS.join(
+            key, lambda: _parse_upload(filename, data, lang, tenant, estimate)
+        ) as (outcome, coalesced):
+            markdown_content = outcome.markdown
+            backend_used, schedule = outcome.backend, outcome.schedule
+
+            # 处理图片：上传到 MinIO 并更新链接（合并的请求各自上传到自己的 document_id 下）
+            uploaded: Dict[str, Dict[str, str]] = {}
+            if document_id:
+                logger.info(f"Processing images for document_id: {document_id}")
+                uploaded = _upload_output_images(outcome.output_dir, document_id)
+                markdown_content = _link_uploaded_images(markdown_content, uploaded)
+
+            incremental_info = None
+            if fingerprints and document_id:
+                version = _save_full_parse(document_id, lang, fingerprints, outcome.output_dir, uploaded)
+                incremental_info = {
+                    "mode": "full",
+                    "renderer": "mineru",
+                    "version": version,
+                    "pagesTotal": len(fingerprints),
+                    "pagesReused": 0,
+                    "pagesReparsed": len(fingerprints),
+                }
+
+    pages = _split_pages(markdown_content)
+
+    processing_time = int((time.time() - start_time) * 1000)
+
+    logger.info(f"Task completed. Processing time: {processing_time}ms")
+
+    return {
+        "code": "success",
+        "message": "Task completed successfully",
+        "data": {
+            "taskId": task_id,
+            "status": "completed",
+            "extracted": markdown_content,
+            "pages": pages,
+            "metadata": {
+                "processingTime": processing_time,
+                "fileName": filename,
+                "pageCount": len(pages),
+                "backend": backend_used,
+                "apiMode": "python-api" if MINERU_API_AVAILABLE else "cli",
+                "modelPersistent": MINERU_API_AVAILABLE,
+                "contentLength": len(markdown_content),
+                "document_id": document_id,
+                "coalesced": coalesced,
+                "language": lang,
+                "languageDetection": detection,
+                "schedule": schedule,
+                "incremental": incremental_info,
+            },
+        },
+    }
+
+
+def _extract_error(exc: Exception) -> Tuple[int, str]:
+    """将解析异常映射为 (HTTP 状态码, 错误信息)"""
+    if isinstance(exc, ScratchQuotaExceeded):
+        logger.warning(f"Scratch quota exceeded: {exc}")
+        return status.HTTP_507_INSUFFICIENT_STORAGE, str(exc)
+    if isinstance(exc, subprocess.TimeoutExpired):
+        return status.HTTP_504_GATEWAY_TIMEOUT, "文档处理超时（超过指定时间）"
+    error_msg = str(exc)
+    logger.error(f"Error: {error_msg}")
+    return status.HTTP_500_INTERNAL_SERVER_ERROR, error_msg
+
+
+def _request_tenant(request: Request) -> str:
+    """调度使用的租户标识（X-Tenant-Id 请求头，未提供时为 default）"""
+    tenant = request.headers.get("X-Tenant-Id", "").strip()
+    return tenant[:64] if tenant else "default"
+
+
+def _result_url(task_id: str) -> str:
+    return f"{os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')}/v4/extract/task/{task_id}"
+
+
+def _run_async_extract(
+    task_id: str,
+    filename: str,
+    data: bytes,
+    document_id: Optional[str],
+    lang: Optional[str],
+    callback_url: str,
+    callback_secret: Optional[str],
+    tenant: str = "default",
+) -> None:
+    """回调模式的后台任务：解析完成后保存结果并投递回调"""
+    start_time = time.time()
+    manifest: Dict[str, object] = {
+        "taskId": task_id,
+        "document_id": document_id,
+        "fileName": filename,
+        "resultUrl": _result_url(task_id),
+    }
+    try:
+        payload = _extract_document(filename, data, document_id, lang, start_time, task_id, tenant)
+        RESULT_STORE.put(task_id, payload)
+        metadata = payload["data"]["metadata"]  # type: ignore[index]
+        manifest.update(
+            {
+                "status": "completed",
+                "pageCount": metadata["pageCount"],
+                "contentLength": metadata["contentLength"],
+                "processingTime": metadata["processingTime"],
+            }
+        )
+    except Exception as exc:
+        _, message = _extract_error(exc)
+        processing_time = int((time.time() - start_time) * 1000)
+        RESULT_STORE.put(
+            task_id,
+            {
+                "code": "error",
+                "message": message,
+                "data": {"taskId": task_id, "status": "failed", "processingTime": processing_time},
+            },
+        )
+        manifest.update({"status": "failed", "error": message, "processingTime": processing_time})
+
+    manifest["completedAt"] = time.time()
+    WEBHOOKS.enqueue(callback_url, callback_secret, manifest)
+
+
+@app.post("/v4/extract/task")
+def create_task(
+    request: Request,
+    file: UploadFile = File(...),
+    document_id: Optional[str] = Form(None),
+    lang: Optional[str] = Form(None),
+    callback_url: Optional[str] = Form(None),
+    callback_secret: Optional[str] = Form(None),
+) -> Response:
+    """
+    创建文档提取任务（优化版 - 优先使用 Python API）
+    
+    参数:
+        - file: PDF 文件
         - document_id: (可选) 文档 ID，用于图片上传到 MinIO
-        - lang: (可选) 语言代码，如 'ch' (简体中文), 'en' (英文), 'chinese_cht' (繁体中文) 等
-               如果不传递，默认使用 'ch' (简体中文)
+        - lang: (可选) 语言代码，如 'ch' (简体中文), 'en' (英文), 'chinese_cht' (繁体中文) 等，
+               或 'auto' 自动检测。不传递时使用 MINERU_DEFAULT_LANG（默认 'ch'），
+               自动检测时检测结果（语言、置信度）在 metadata.languageDetection 中返回
+        - callback_url: (可选) 回调地址。传递时立即返回 202 和 taskId，
+               解析完成或失败后向该地址 POST 结果摘要，完整结果通过 GET /v4/extract/task/{taskId} 获取
+        - callback_secret: (可选) 回调签名密钥（HMAC-SHA256）
+
+    内容和参数完全相同的并发请求会合并到同一个解析任务，共享解析结果；
+    图片仍按各自的 document_id 上传。
+    解析任务按 MINERU_SCHED_POLICY 排队，请求头 X-Tenant-Id 用于按租户公平调度，
+    预估与实际耗时在 metadata.schedule 中返回。
     """
     start_time = time.time()
     if file.filename is None or file.filename.strip() == "":
@@ -498,6 +2176,11 @@ def create_task(
             message="只支持 PDF 文件",
         )
 
+    if callback_url:
+        callback_error = validate_callback_url(callback_url)
+        if callback_error:
+            return _error_response(status_code=status.HTTP_400_BAD_REQUEST, message=callback_error)
+
     file_bytes = file.file
     file_bytes.seek(0, os.SEEK_END)
     size = file_bytes.tell()
@@ -509,106 +2192,396 @@ def create_task(
             message=f"文件大小超过限制（最大 {MAX_FILE_SIZE // (1024 * 1024)}MB）",
         )
 
-    temp_dir = tempfile.mkdtemp()
-    backend_used = "unknown"
+    filename = os.path.basename(file.filename)
+    data = file_bytes.read()
+    task_id = new_task_id()
+    tenant = _request_tenant(request)
+
+    if callback_url:
+        RESULT_STORE.put(task_id, {"code": "success", "data": {"taskId": task_id, "status": "processing"}})
+        _submit_async_job(
+            task_id,
+            {
+                "filename": filename,
+                "document_id": document_id,
+                "lang": lang,
+                "callback_url": callback_url,
+                "callback_secret": callback_secret,
+                "tenant": tenant,
+            },
+            data,
+        )
+        logger.info(f"Accepted async task {task_id} for {filename} (callback: {callback_url})")
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                "code": "success",
+                "message": "Task accepted",
+                "data": {
+                    "taskId": task_id,
+                    "status": "processing",
+                    "resultUrl": _result_url(task_id),
+                },
+            },
+        )
+
     try:
-        filename = os.path.basename(file.filename)
-        pdf_path = os.path.join(temp_dir, filename)
-        output_dir = os.path.join(temp_dir, "output")
+        return encoded_response(
+            request,
+            _extract_document(filename, data, document_id, lang, start_time, task_id, tenant),
+        )
+    except Exception as exc:
+        status_code, message = _extract_error(exc)
+        return _error_response(
+            status_code=status_code,
+            message=message,
+            processing_time=int((time.time() - start_time) * 1000),
+        )
 
-        with open(pdf_path, "wb") as f:
-            f.write(file_bytes.read())
 
-        os.makedirs(output_dir, exist_ok=True)
+@app.get("/v4/extract/task/{task_id}")
+def get_task(request: Request, task_id: str) -> Response:
+    """查询回调模式任务的状态和结果"""
+    try:
+        record = RESULT_STORE.get(task_id)
+    except ValueError as e:
+        return _error_response(status_code=status.HTTP_400_BAD_REQUEST, message=str(e))
+    if record is None:
+        return _error_response(status_code=status.HTTP_404_NOT_FOUND, message=f"任务不存在或已过期: {task_id}")
+    return encoded_response(request, record)
 
-        logger.info(f"Processing {filename}...")
 
-        # 优先使用 Python API（模型常驻），否则降级到 CLI
-        try:
-            if MINERU_API_AVAILABLE:
-                md_path = _process_pdf_with_python_api(pdf_path, output_dir, lang)
-                backend_used = "python-api-persistent"
-            else:
-                md_path = _process_pdf_with_cli(pdf_path, output_dir)
-                backend_used = "cli-fallback"
-        except Exception as api_error:
-            logger.warning(f"Python API failed, falling back to CLI: {api_error}")
-            md_path = _process_pdf_with_cli(pdf_path, output_dir)
-            backend_used = "cli-fallback"
+# 批量提取：每组文档一次 do_parse 调用
+MINERU_BATCH_GROUP_SIZE = int(os.environ.get("MINERU_BATCH_GROUP_SIZE", "8"))
+MINERU_BATCH_MAX_DOCUMENTS = int(os.environ.get("MINERU_BATCH_MAX_DOCUMENTS", "500"))
+# manifest 中 object_key 允许读取的存储桶（逗号分隔），默认只允许 MINIO_BUCKET_NAME；
+# 服务的 MinIO 凭证可能能访问更多存储桶，不能由调用方任意指定
+MINERU_BATCH_ALLOWED_BUCKETS = [
+    bucket.strip()
+    for bucket in os.environ.get(
+        "MINERU_BATCH_ALLOWED_BUCKETS", os.environ.get("MINIO_BUCKET_NAME", "deepmed")
+    ).split(",")
+    if bucket.strip()
+]
 
-        logger.info(f"Found markdown file: {md_path}")
 
-        with open(md_path, "r", encoding="utf-8") as f:
-            markdown_content = f.read()
+@dataclass
+class _BatchItem:
+    """批量请求中的单个文档"""
+    index: int
+    file_name: str
+    lang: Optional[str]
+    document_id: Optional[str]
+    upload: Optional[UploadFile] = None
+    object_key: Optional[str] = None
+    bucket: Optional[str] = None
+    size: int = 0
+    error: Optional[str] = None
+    result: Optional[Dict[str, object]] = None
+    language_detection: Optional[Dict[str, object]] = None
+    estimate: Optional[_CostEstimate] = None
 
-        # 处理图片：上传到 MinIO 并更新链接
-        if document_id:
-            logger.info(f"Processing images for document_id: {document_id}")
-            markdown_content = _process_images_and_update_markdown(
-                markdown_content,
-                output_dir,
-                document_id
-            )
+    def to_result(self) -> Dict[str, object]:
+        payload: Dict[str, object] = {
+            "index": self.index,
+            "fileName": self.file_name,
+            "document_id": self.document_id,
+        }
+        if self.object_key:
+            payload["objectKey"] = self.object_key
+        if self.error is not None or self.result is None:
+            payload["status"] = "failed"
+            payload["error"] = self.error or "文档未被处理"
+        else:
+            payload["status"] = "completed"
+            payload.update(self.result)
+        if self.lang:
+            payload["language"] = self.lang
+        if self.language_detection is not None:
+            payload["languageDetection"] = self.language_detection
+        if self.estimate is not None:
+            payload["schedule"] = {"pages": self.estimate.pages, "estimatedSeconds": self.estimate.seconds}
+        return payload
 
-        paragraphs = [p.strip() for p in markdown_content.split("\n\n") if p.strip()]
-        pages: List[Dict[str, object]] = []
-        for idx, paragraph in enumerate(paragraphs, start=1):
-            pages.append(
-                {
-                    "pageNum": idx,
-                    "content": paragraph,
-                    "tokens": len(paragraph.split()),
-                }
-            )
 
-        processing_time = int((time.time() - start_time) * 1000)
-        task_id = f"task_{int(time.time() * 1000)}"
+def _build_batch_items(
+    files: List[UploadFile],
+    manifest: Optional[str],
+    default_lang: Optional[str],
+) -> List[_BatchItem]:
+    """
+    根据上传文件和 manifest 构建批量条目
 
-        logger.info(f"Task completed. Processing time: {processing_time}ms")
+    manifest 为 JSON 数组，每项包含 filename（对应上传文件）或 object_key（MinIO 对象），
+    以及可选的 lang / document_id / bucket。bucket 必须在 MINERU_BATCH_ALLOWED_BUCKETS 中，
+    否则该条目失败。未出现在 manifest 中的上传文件使用默认语言。
+    """
+    uploads: Dict[str, List[UploadFile]] = {}
+    for upload in files:
+        uploads.setdefault(os.path.basename(upload.filename or ""), []).append(upload)
 
-        return JSONResponse(
-            content={
-                "code": "success",
-                "message": "Task completed successfully",
-                "data": {
-                    "taskId": task_id,
-                    "status": "completed",
-                    "extracted": markdown_content,
-                    "pages": pages,
-                    "metadata": {
-                        "processingTime": processing_time,
-                        "fileName": filename,
-                        "pageCount": len(pages),
-                        "backend": backend_used,
-                        "apiMode": "python-api" if MINERU_API_AVAILABLE else "cli",
-                        "modelPersistent": MINERU_API_AVAILABLE,
-                        "contentLength": len(markdown_content),
-                        "document_id": document_id,
-                    },
-                },
-            }
+    entries = json.loads(manifest) if manifest else []
+    if not isinstance(entries, list):
+        raise ValueError("manifest 必须是 JSON 数组")
+
+    items: List[_BatchItem] = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError("manifest 的每一项必须是 JSON 对象")
+        object_key = entry.get("object_key")
+        file_name = os.path.basename(entry.get("filename") or (object_key or ""))
+        item = _BatchItem(
+            index=len(items),
+            file_name=file_name,
+            lang=entry.get("lang") or default_lang,
+            document_id=entry.get("document_id"),
+            object_key=object_key,
+            bucket=entry.get("bucket"),
         )
+        if object_key and item.bucket and item.bucket not in MINERU_BATCH_ALLOWED_BUCKETS:
+            item.error = f"不允许读取存储桶: {item.bucket}"
+        elif not object_key:
+            candidates = uploads.get(file_name)
+            if candidates:
+                item.upload = candidates.pop(0)
+            else:
+                item.error = f"未找到上传文件: {file_name}"
+        items.append(item)
 
-    except subprocess.TimeoutExpired:
-        processing_time = int((time.time() - start_time) * 1000)
-        return _error_response(
-            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
-            message="文档处理超时（超过指定时间）",
-            processing_time=processing_time,
+    for remaining in uploads.values():
+        for upload in remaining:
+            items.append(
+                _BatchItem(
+                    index=len(items),
+                    file_name=os.path.basename(upload.filename or ""),
+                    lang=default_lang,
+                    document_id=None,
+                    upload=upload,
+                )
+            )
+    return items
+
+
+def _validate_batch_item(item: _BatchItem, minio_client: Optional[Minio]) -> None:
+    if item.error is not None:
+        return
+    if not item.file_name or not _allowed_file(item.file_name):
+        item.error = "只支持 PDF 文件"
+        return
+
+    if item.upload is not None:
+        item.upload.file.seek(0, os.SEEK_END)
+        item.size = item.upload.file.tell()
+        item.upload.file.seek(0)
+    else:
+        if minio_client is None:
+            item.error = "MinIO 客户端不可用，无法读取对象"
+            return
+        bucket = item.bucket or os.environ.get("MINIO_BUCKET_NAME", "deepmed")
+        try:
+            item.size = minio_client.stat_object(bucket, item.object_key).size
+        except Exception as e:
+            item.error = f"读取对象失败: {e}"
+            return
+
+    if item.size > MAX_FILE_SIZE:
+        item.error = f"文件大小超过限制（最大 {MAX_FILE_SIZE // (1024 * 1024)}MB）"
+
+
+def _finish_batch_item(item: _BatchItem, md_path: str, backend: str) -> None:
+    with open(md_path, "r", encoding="utf-8") as f:
+        markdown_content = f.read()
+
+    if item.document_id:
+        # 只扫描该文档自己的输出目录，避免同组文档的图片混在一起
+        markdown_content = _process_images_and_update_markdown(
+            markdown_content,
+            os.path.dirname(md_path),
+            item.document_id,
         )
 
-    except Exception as exc:
-        processing_time = int((time.time() - start_time) * 1000)
-        error_msg = str(exc)
-        logger.error(f"Error: {error_msg}")
+    item.result = {
+        "extracted": markdown_content,
+        "pageCount": len(_split_pages(markdown_content)),
+        "contentLength": len(markdown_content),
+        "backend": backend,
+    }
+
+
+def _process_batch_group(items: List[_BatchItem], minio_client: Optional[Minio], tenant: str) -> None:
+    """
+    处理一组文档：整组调用一次 do_parse，失败时逐个重试以隔离出错的文档
+
+    整组按各文档预估耗时之和排队等待执行位，逐个重试时每个文档单独排队。
+    """
+    group_start = time.time()
+    work_dir = SCRATCH.allocate(int(sum(item.size for item in items) * SCRATCH_EXPANSION_FACTOR))
+    try:
+        input_dir = os.path.join(work_dir, "input")
+        output_dir = os.path.join(work_dir, "output")
+        os.makedirs(input_dir, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+
+        staged: List[Tuple[_BatchItem, str]] = []
+        for item in items:
+            # 组内文件名必须唯一，加上序号前缀
+            stem = re.sub(r"[^\w.-]", "_", os.path.splitext(item.file_name)[0])[:80]
+            pdf_path = os.path.join(input_dir, f"{item.index:05d}_{stem}.pdf")
+            try:
+                if item.upload is not None:
+                    item.upload.file.seek(0)
+                    with open(pdf_path, "wb") as f:
+                        shutil.copyfileobj(item.upload.file, f)
+                else:
+                    bucket = item.bucket or os.environ.get("MINIO_BUCKET_NAME", "deepmed")
+                    minio_client.fget_object(bucket, item.object_key, pdf_path)  # type: ignore[union-attr]
+                item.lang, item.language_detection = _resolve_lang(pdf_path, item.lang)
+                item.estimate = SCHEDULER.estimate(pdf_path, item.size)
+                staged.append((item, pdf_path))
+            except Exception as e:
+                item.error = f"读取文件失败: {e}"
+
+        if not staged:
+            return
+
+        try:
+            if not MINERU_API_AVAILABLE:
+                raise RuntimeError("MinerU Python API not available")
+            estimates = [item.estimate for item, _ in staged if item.estimate is not None]
+            group_estimate = functools.reduce(_CostEstimate.combine, estimates)
+            with SCHEDULER.slot(tenant, group_estimate):
+                md_paths = _process_pdfs_with_python_api(
+                    [pdf_path for _, pdf_path in staged],
+                    output_dir,
+                    [item.lang for item, _ in staged],
+                    group_estimate.timeout,
+                )
+            for (item, _), md_path in zip(staged, md_paths):
+                try:
+                    _finish_batch_item(item, md_path, "python-api-persistent")
+                except Exception as e:
+                    item.error = str(e)
+            return
+        except subprocess.TimeoutExpired as group_error:
+            if len(staged) == 1:
+                # 超时不降级到 CLI（与单文档接口一致），单文档组直接失败
+                staged[0][0].error = _extract_error(group_error)[1]
+                return
+            logger.warning(f"Batch group timed out, retrying documents individually: {group_error}")
+        except Exception as group_error:
+            if len(staged) > 1:
+                logger.warning(f"Batch group failed, retrying documents individually: {group_error}")
+
+        for item, pdf_path in staged:
+            try:
+                doc_output_dir = os.path.join(work_dir, f"single-{item.index:05d}")
+                os.makedirs(doc_output_dir, exist_ok=True)
+                estimate = item.estimate or SCHEDULER.estimate(pdf_path, item.size)
+                with SCHEDULER.slot(tenant, estimate):
+                    if len(staged) == 1 and MINERU_API_AVAILABLE:
+                        # 单文档组已用 Python API 试过，直接降级到 CLI
+                        md_path = _process_pdf_with_cli(pdf_path, doc_output_dir, estimate.timeout)
+                        backend_used = "cli-fallback"
+                    else:
+                        md_path, backend_used = _parse_pdf_file(pdf_path, doc_output_dir, item.lang, estimate.timeout)
+                _finish_batch_item(item, md_path, backend_used)
+            except Exception as e:
+                logger.error(f"Batch document {item.file_name} failed: {e}")
+                item.error = str(e)
+    finally:
+        SCRATCH.release(work_dir)
+        metric_inc("batch_groups_total")
+        metric_observe("batch_group_seconds", time.time() - group_start)
+
+
+@app.post("/v4/extract/batch")
+def create_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    manifest: Optional[str] = Form(None),
+    lang: Optional[str] = Form(None),
+) -> Response:
+    """
+    批量提取文档（用于大批量导入 / 回填）
+
+    参数:
+        - files: 多个 PDF 文件
+        - manifest: (可选) JSON 数组，每项为
+              {"filename": "a.pdf" | "object_key": "path/in/bucket.pdf",
+               "lang": "en", "document_id": "...", "bucket": "..."}
+          object_key 表示直接从 MinIO 读取，无需上传
+        - lang: (可选) 未在 manifest 中指定语言的文档使用的默认语言；
+              为 'auto'（或不传递且 MINERU_DEFAULT_LANG=auto）时逐个文档自动检测
+
+    文档按 MINERU_BATCH_GROUP_SIZE 分组，每组一次 do_parse 调用；
+    返回每个文档的结果或错误，单个文档失败不影响其他文档。
+    """
+    start_time = time.time()
+    try:
+        items = _build_batch_items(files or [], manifest, lang)
+    except ValueError as e:
+        return _error_response(status_code=status.HTTP_400_BAD_REQUEST, message=f"manifest 无效: {e}")
+
+    if not items:
+        return _error_response(status_code=status.HTTP_400_BAD_REQUEST, message="未选择文件")
+    if len(items) > MINERU_BATCH_MAX_DOCUMENTS:
         return _error_response(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            message=error_msg,
-            processing_time=processing_time,
+            status_code=status.HTTP_400_BAD_REQUEST,
+            message=f"单次批量最多 {MINERU_BATCH_MAX_DOCUMENTS} 个文档",
         )
 
-    finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+    minio_client = _get_minio_client() if any(item.object_key for item in items) else None
+    for item in items:
+        _validate_batch_item(item, minio_client)
+
+    valid = [item for item in items if item.error is None]
+    group_size = max(1, MINERU_BATCH_GROUP_SIZE)
+    groups = [valid[i:i + group_size] for i in range(0, len(valid), group_size)]
+    metric_inc("batch_requests_total")
+    metric_inc("batch_documents_total", len(items))
+    logger.info(f"Batch request: {len(items)} documents, {len(groups)} groups of up to {group_size}")
+
+    # 副本模式下各组可以并行分发到不同副本
+    parallelism = MINERU_REPLICAS if REPLICA_POOL is not None else 1
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        tenant = _request_tenant(request)
+        futures = [executor.submit(_process_batch_group, group, minio_client, tenant) for group in groups]
+        for future, group in zip(futures, groups):
+            try:
+                future.result()
+            except Exception as e:
+                # 例如临时空间配额不足：整组标记失败
+                for item in group:
+                    if item.result is None and item.error is None:
+                        item.error = str(e)
+
+    results = [item.to_result() for item in items]
+    succeeded = sum(1 for result in results if result["status"] == "completed")
+    metric_inc("batch_documents_failed_total", len(results) - succeeded)
+    processing_time = int((time.time() - start_time) * 1000)
+    logger.info(f"Batch completed: {succeeded}/{len(results)} succeeded in {processing_time}ms")
+
+    return encoded_response(
+        request,
+        {
+            "code": "success",
+            "message": "Batch completed",
+            "data": {
+                "batchId": f"batch_{int(time.time() * 1000)}",
+                "status": "completed",
+                "total": len(results),
+                "succeeded": succeeded,
+                "failed": len(results) - succeeded,
+                "results": results,
+                "metadata": {
+                    "processingTime": processing_time,
+                    "groupSize": group_size,
+                    "groups": len(groups),
+                    "apiMode": "python-api" if MINERU_API_AVAILABLE else "cli",
+                },
+            },
+        },
+    )
 
 
 @app.get("/formats")
@@ -623,9 +2596,29 @@ def supported_formats() -> Dict[str, object]:
     }
 
 
-@app.get("/info")
-def info() -> Dict[str, object]:
-    """返回服务信息"""
+@app.get("/metrics")
+def metrics() -> Dict[str, object]:
+    """返回进程内指标"""
+    return {
+        "service": "mineru",
+        "metrics": metrics_snapshot(),
+        "parse_in_flight": _PARSE_FLIGHTS.in_flight(),
+        "replicas": REPLICA_POOL.stats() if REPLICA_POOL is not None else [],
+        "webhooks_pending": WEBHOOKS.pending(),
+        "async_jobs_journaled": JOB_JOURNAL.pending(),
+        "drain": _DRAIN.stats(),
+        "scheduler": SCHEDULER.stats(),
+        "timestamp": time.time(),
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _mineru_version() -> str:
+    """MinerU 版本号（只计算一次）：优先读取包元数据，避免每次启动子进程"""
+    try:
+        return importlib.metadata.version("mineru")
+    except importlib.metadata.PackageNotFoundError:
+        pass
     try:
         version_result = subprocess.run(
             ["mineru", "--version"],
@@ -633,27 +2626,48 @@ def info() -> Dict[str, object]:
             text=True,
             timeout=5,
         )
-        version = (
+        return (
             version_result.stdout.strip()
             if version_result.returncode == 0
             else "unknown"
         )
     except Exception:
-        version = "unknown"
+        return "unknown"
+
+
+@functools.lru_cache(maxsize=1)
+def _service_capabilities() -> Dict[str, object]:
+    """进程生命周期内不变的服务能力信息（只计算一次）"""
+    return {
+        "version": _mineru_version(),
+        "mineru_backend": os.environ.get("MINERU_BACKEND", "pipeline"),
+        "supported_formats": ["pdf"],
+        "model_source": os.environ.get("MINERU_MODEL_SOURCE", "local"),
+        **encoding_capabilities(),
+    }
+
 
+@app.get("/info")
+def info() -> Dict[str, object]:
+    """返回服务信息（版本与能力信息已缓存，适合监控频繁调用）"""
+    capabilities = _service_capabilities()
     return {
         "service": "MinerU Docker (Optimized - Persistent Model)",
-        "version": version,
+        "version": capabilities["version"],
         "backend": "python-api" if MINERU_API_AVAILABLE else "cli",
         "api_mode": "python-api" if MINERU_API_AVAILABLE else "cli",
         "model_persistent": MINERU_API_AVAILABLE,
         "model_warmed_up": MODEL_WARMED_UP,
         "optimization": "Models persist in memory, no reload between requests" if MINERU_API_AVAILABLE else "CLI mode (reloads each time)",
         "performance": "Fast (model reuse)" if MINERU_API_AVAILABLE else "Slower (model reload each time)",
-        "supported_formats": ["pdf"],
-        "model_source": os.environ.get("MINERU_MODEL_SOURCE", "local"),
+        "supported_formats": capabilities["supported_formats"],
+        "model_source": capabilities["model_source"],
+        "capabilities": capabilities,
         "reference": "https://opendatalab.github.io/MinerU/",
         "environment": APP_ENV,
+        "startup": STARTUP_TIMINGS,
+        "scratch": SCRATCH.stats(),
+        "replicas": REPLICA_POOL.stats() if REPLICA_POOL is not None else [],
     }
 
 
@@ -662,6 +2676,9 @@ def _resolve_reload(app_env: str) -> bool:
     return _normalize_boolean(os.environ.get("UVICORN_RELOAD"), default_reload)
 
 
+STARTUP_TIMINGS["module_import_seconds"] = round(time.time() - _MODULE_START, 3)
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     host = os.environ.get("HOST", "0.0.0.0")
@@ -672,6 +2689,11 @@ if __name__ == "__main__":
     if reload_enabled:
         workers = 1  # Uvicorn reload 模式仅支持单进程
 
+    if MINERU_REPLICAS > 0 and workers > 1:
+        # 副本模式下由前端进程统一调度，多个 uvicorn worker 会各自启动一组副本
+        logger.warning("MINERU_REPLICAS is set, forcing UVICORN_WORKERS=1")
+        workers = 1
+
     logger.info(f"Starting MinerU API Server on port {port}...")
     logger.info(
         "Reference: https://opendatalab.github.io/MinerU/zh/quick_start/docker_deployment/"
@@ -688,4 +2710,5 @@ if __name__ == "__main__":
         reload=reload_enabled,
         workers=workers,
         log_level=log_level,
+        timeout_graceful_shutdown=int(DRAIN_GRACE_SECONDS),
     )
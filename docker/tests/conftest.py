@@ -0,0 +1,47 @@
+"""
+MarkItDown / MinerU API 服务的测试
+
+两个服务的入口文件都叫 api_server.py，这里按文件路径分别导入为 markitdown_api_server
+和 mineru_api_server；共用组件所在的 docker/common 加入 sys.path（与 PYTHONPATH=docker/common 等效）。
+
+运行：python -m pytest docker/tests
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+from types import ModuleType
+
+import pytest
+
+DOCKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 服务在导入时根据环境变量创建数据目录和临时空间，测试使用独立的临时目录
+_DATA_DIR = tempfile.mkdtemp(prefix="docker-tests-")
+os.environ["DATA_DIR"] = _DATA_DIR
+os.environ["SCRATCH_ROOT"] = os.path.join(_DATA_DIR, "scratch")
+os.environ.pop("SCRATCH_TMPFS_ROOT", None)
+
+sys.path.insert(0, os.path.join(DOCKER_DIR, "common"))
+
+
+def _load_service(name: str, service: str) -> ModuleType:
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(DOCKER_DIR, service, "api_server.py"))
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def markitdown_api() -> ModuleType:
+    return _load_service("markitdown_api_server", "markitdown")
+
+
+@pytest.fixture(scope="session")
+def mineru_api() -> ModuleType:
+    return _load_service("mineru_api_server", "mineru")
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+
+def _fake_worker_main(index, conn):
+    """代替真实转换进程：hang.* 一直不返回，crash.* 直接退出，其余立即返回"""
+    conn.send(("ready", 0.0))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        _, _, filename, _ = job
+        if filename.startswith("hang."):
+            time.sleep(60)
+        if filename.startswith("crash."):
+            os._exit(3)
+        conn.send(("done", f"converted {filename} in {os.getpid()}"))
+
+
+@pytest.fixture
+def pool(markitdown_api, monkeypatch):
+    class FakePool(markitdown_api._ConvertPool):
+        def _start_process(self, worker):
+            ctx = multiprocessing.get_context("fork")
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_fake_worker_main, args=(worker.index, child_conn), daemon=True)
+            process.start()
+            child_conn.close()
+            return process, parent_conn
+
+    monkeypatch.setitem(markitdown_api.CONVERT_TIMEOUTS, "txt", 0.5)
+    pool = FakePool(1)
+    pool.start()
+    yield pool
+    pool.stop(timeout=1)
+
+
+def _wait_restarted(pool, restarts):
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        worker = pool.stats()[0]
+        if worker["restarts"] >= restarts and worker["alive"]:
+            return worker
+        time.sleep(0.02)
+    raise AssertionError("convert worker was not restarted")
+
+
+def test_pool_converts_in_worker(pool):
+    result = pool.convert(b"hello", "txt", "a.txt")
+    assert result.startswith("converted a.txt")
+    assert pool.stats()[0]["completed"] == 1
+
+
+def test_pool_kills_and_replaces_worker_on_timeout(markitdown_api, pool):
+    old_pid = pool.stats()[0]["pid"]
+    started = time.time()
+    with pytest.raises(markitdown_api.ConvertTimeout):
+        pool.convert(b"", "txt", "hang.txt")
+    # 按该格式的超时返回，不等待转换进程
+    assert time.time() - started < 5
+
+    worker = _wait_restarted(pool, 1)
+    assert worker["timeouts"] == 1
+    assert worker["pid"] != old_pid
+    assert not os.path.exists(f"/proc/{old_pid}") or open(f"/proc/{old_pid}/stat").read().split()[2] == "Z"
+
+    # 补充的进程继续处理后续请求
+    result = pool.convert(b"", "txt", "b.txt")
+    assert result == f"converted b.txt in {worker['pid']}"
+
+
+def test_pool_replaces_worker_that_exits_mid_conversion(pool):
+    old_pid = pool.stats()[0]["pid"]
+    with pytest.raises(RuntimeError, match="异常退出"):
+        pool.convert(b"", "txt", "crash.txt")
+    worker = _wait_restarted(pool, 1)
+    assert worker["failed"] == 1
+    assert worker["pid"] != old_pid
+    assert pool.convert(b"", "txt", "c.txt").startswith("converted c.txt")
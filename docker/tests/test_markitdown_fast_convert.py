@@ -0,0 +1,73 @@
+import io
+import json
+
+
+def _convert(api, data, extension, **kwargs):
+    stats = api._FastConvertStats()
+    chunks = list(api._fast_convert(io.BytesIO(data), extension, stats, **kwargs))
+    return chunks, stats
+
+
+def test_csv_to_markdown_table(markitdown_api):
+    data = "name,value,note\r\na,1,x|y\r\nb,2\r\n\r\nc,3,\"multi\nline\"\r\n".encode("utf-8")
+    chunks, stats = _convert(markitdown_api, data, "csv")
+    assert "".join(chunks) == (
+        "| name | value | note |\n"
+        "| --- | --- | --- |\n"
+        "| a | 1 | x\\|y |\n"
+        "| b | 2 |  |\n"
+        "| c | 3 | multi line |\n"
+    )
+    assert stats.rows == 3
+    assert not stats.truncated
+
+
+def test_csv_max_rows_truncates(markitdown_api):
+    data = ("id\n" + "".join(f"{i}\n" for i in range(100))).encode("utf-8")
+    chunks, stats = _convert(markitdown_api, data, "csv", max_rows=5)
+    lines = "".join(chunks).splitlines()
+    assert lines == ["| id |", "| --- |", "| 0 |", "| 1 |", "| 2 |", "| 3 |", "| 4 |"]
+    assert stats.rows == 5
+    assert stats.truncated
+
+
+def test_tsv_skips_leading_blank_rows_and_decodes_bom(markitdown_api):
+    data = "﻿\t\na\tb\n1\t2\n".encode("utf-8")
+    chunks, stats = _convert(markitdown_api, data, "tsv", max_rows=1)
+    assert "".join(chunks) == "| a | b |\n| --- | --- |\n| 1 | 2 |\n"
+    assert stats.rows == 1
+    assert not stats.truncated
+
+
+def test_tsv_max_rows_truncates(markitdown_api):
+    data = b"a\tb\n1\t2\n3\t4\n"
+    chunks, stats = _convert(markitdown_api, data, "tsv", max_rows=1)
+    assert "".join(chunks) == "| a | b |\n| --- | --- |\n| 1 | 2 |\n"
+    assert stats.truncated
+
+
+def test_json_passes_through_unchanged(markitdown_api):
+    data = json.dumps({"rows": [{"id": i} for i in range(50)]}, indent=2).encode("utf-8")
+    # max_rows 只作用于表格和 txt，JSON 不截断
+    chunks, stats = _convert(markitdown_api, data, "json", max_rows=3)
+    assert "".join(chunks) == data.decode("utf-8")
+    assert not stats.truncated
+
+
+def test_output_is_chunked(markitdown_api, monkeypatch):
+    monkeypatch.setattr(markitdown_api, "FAST_CONVERT_CHUNK_BYTES", 64)
+    data = ("id,text\n" + "".join(f"{i},{'x' * 20}\n" for i in range(50))).encode("utf-8")
+    chunks, stats = _convert(markitdown_api, data, "csv")
+    assert len(chunks) > 10
+    assert all(len(chunk) < 64 + 40 for chunk in chunks)
+    assert "".join(chunks).count("\n") == 52
+    assert stats.rows == 50
+
+
+def test_use_fast_path(markitdown_api, monkeypatch):
+    monkeypatch.setattr(markitdown_api, "FAST_CONVERT_MIN_BYTES", 1000)
+    assert markitdown_api._use_fast_path("tsv", 10, None, None)
+    assert not markitdown_api._use_fast_path("csv", 10, None, None)
+    assert markitdown_api._use_fast_path("csv", 10, 5, None)
+    assert markitdown_api._use_fast_path("json", 1000, None, None)
+    assert not markitdown_api._use_fast_path("docx", 10_000, 5, None)
@@ -0,0 +1,112 @@
+from typing import List
+
+import pytest
+
+_TEXT = b"The quick brown fox jumps over the lazy dog. " * 8
+
+
+def _text_stream(text: bytes = _TEXT, font: bytes = b"F1") -> bytes:
+    return b"BT /" + font + b" 10 Tf 40 700 Td (" + text + b") Tj ET\n"
+
+
+def _make_pdf(pages: List[bytes]) -> bytes:
+    """生成最小的 PDF：每页一个内容流，共用 Helvetica（F1）、Symbol（F2）字体和一张 1x1 灰度图（Im1）"""
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # 页面树，页面对象编号确定后填写
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Symbol >>",
+        b"<< /Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray "
+        b"/BitsPerComponent 8 /Length 1 >>\nstream\n\x80\nendstream",
+    ]
+    kids = []
+    for content in pages:
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> /XObject << /Im1 5 0 R >> >> >>"
+            % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def _route(api, pages):
+    triage = api._triage_pdf(_make_pdf(pages))
+    return triage["backend"], triage["reason"], triage["features"]
+
+
+def test_born_digital_pdf_stays_in_markitdown(markitdown_api):
+    backend, reason, features = _route(markitdown_api, [_text_stream()] * 3)
+    assert (backend, reason) == ("markitdown", "born_digital")
+    assert features["page_count"] == 3
+    assert features["chars_per_page"] == len(_TEXT)
+
+
+def test_pages_without_text_layer_are_scanned(markitdown_api):
+    backend, reason, _ = _route(markitdown_api, [b"q 612 0 0 792 0 0 cm /Im1 Do Q\n"] * 2)
+    assert (backend, reason) == ("mineru", "scanned")
+
+
+def test_image_heavy_pages_go_to_mineru(markitdown_api):
+    page = _text_stream() + b"q 612 0 0 700 0 0 cm /Im1 Do Q\n"
+    backend, reason, features = _route(markitdown_api, [page] * 2)
+    assert (backend, reason) == ("mineru", "image_heavy")
+    assert features["image_coverage"] > 0.8
+
+
+def test_symbol_font_counts_as_formulas(markitdown_api):
+    page = _text_stream() + _text_stream(b"abgdpqrs" * 10, font=b"F2")
+    backend, reason, features = _route(markitdown_api, [page])
+    assert (backend, reason) == ("mineru", "formulas")
+    assert features["math_ratio"] > 0.1
+
+
+def test_ruled_pages_go_to_mineru_unless_too_long(markitdown_api, monkeypatch):
+    rules = b"".join(b"%d 100 20 10 re S\n" % (10 + i * 10) for i in range(50))
+    pages = [_text_stream() + rules] * 3
+    assert _route(markitdown_api, pages)[:2] == ("mineru", "tables")
+
+    monkeypatch.setattr(markitdown_api, "TRIAGE_MINERU_MAX_PAGES", 2)
+    assert _route(markitdown_api, pages)[:2] == ("markitdown", "tables_but_too_many_pages")
+
+
+def test_unparseable_pdf_goes_to_mineru(markitdown_api):
+    triage = markitdown_api._triage_pdf(b"not a pdf")
+    assert (triage["backend"], triage["reason"]) == ("mineru", "unparseable")
+
+
+def test_samples_pages_across_long_documents(markitdown_api, monkeypatch):
+    monkeypatch.setattr(markitdown_api, "TRIAGE_SAMPLE_PAGES", 4)
+    # 只有抽样页有文本层：如果读到了其他页，平均字符数会变化
+    sampled = markitdown_api._sample_pages(20, 4)
+    assert sampled == [0, 6, 13, 19]
+    pages = [_text_stream() if index in sampled else b"" for index in range(20)]
+    backend, reason, features = _route(markitdown_api, pages)
+    assert (backend, reason) == ("markitdown", "born_digital")
+    assert features["page_count"] == 20
+    assert features["sampled_pages"] == 4
+    assert features["chars_per_page"] == len(_TEXT)
+
+
+@pytest.mark.parametrize("char, expected", [("∑", True), ("≤", True), ("𝑥", True), ("α", False), ("a", False)])
+def test_math_chars(markitdown_api, char, expected):
+    assert markitdown_api._is_math_char(char) is expected
+
+
+def test_resolve_pdf_backend_only_triages_auto(markitdown_api):
+    assert markitdown_api._resolve_pdf_backend(b"", "markitdown") == ("markitdown", None)
+    backend, triage = markitdown_api._resolve_pdf_backend(_make_pdf([_text_stream()]), "auto")
+    assert backend == "markitdown"
+    assert triage["reason"] == "born_digital"
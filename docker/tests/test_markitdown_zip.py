@@ -0,0 +1,79 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+
+def _zip(members, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_rejects_unreadable_archive(markitdown_api):
+    with pytest.raises(markitdown_api.ZipRejected, match="无法读取"):
+        markitdown_api._open_zip(io.BytesIO(b"not a zip"))
+
+
+def test_rejects_too_many_members(markitdown_api, monkeypatch):
+    monkeypatch.setattr(markitdown_api, "ZIP_MAX_MEMBERS", 3)
+    data = _zip([(f"{i}.txt", b"x") for i in range(4)])
+    with pytest.raises(markitdown_api.ZipRejected, match="成员数 4"):
+        markitdown_api._open_zip(io.BytesIO(data))
+
+
+def test_rejects_total_uncompressed_size(markitdown_api, monkeypatch):
+    monkeypatch.setattr(markitdown_api, "ZIP_MAX_TOTAL_BYTES", 1000)
+    data = _zip([("a.txt", b"x" * 600), ("b.txt", b"y" * 600)])
+    with pytest.raises(markitdown_api.ZipRejected, match="解压后大小 1200"):
+        markitdown_api._open_zip(io.BytesIO(data))
+
+
+def test_rejects_archive_compression_ratio(markitdown_api):
+    data = _zip([("zeros.txt", b"\0" * (8 * 1024 * 1024))])
+    with pytest.raises(markitdown_api.ZipRejected, match="压缩比"):
+        markitdown_api._open_zip(io.BytesIO(data))
+
+
+def test_skips_suspicious_and_unsupported_members(markitdown_api, monkeypatch):
+    monkeypatch.setattr(markitdown_api, "ZIP_MAX_MEMBER_BYTES", 3 * 1024 * 1024)
+    data = _zip(
+        [
+            ("docs/readme.txt", b"hello"),
+            # 整个压缩包的压缩比正常，但单个成员的压缩比过高
+            ("random.bin.txt", os.urandom(2 * 1024 * 1024)),
+            ("zeros.txt", b"\0" * (2 * 1024 * 1024)),
+            ("big.csv", os.urandom(3 * 1024 * 1024 + 1)),
+            ("nested.zip", b"PK"),
+            ("tool.exe", b"MZ"),
+            ("__MACOSX/._readme.txt", b""),
+            ("docs/.hidden.txt", b"x"),
+        ]
+    )
+    plan = markitdown_api._open_zip(io.BytesIO(data))
+    assert [name for _, name in plan.members] == ["docs/readme.txt", "random.bin.txt"]
+    reasons = {item["name"]: item["error"] for item in plan.skipped}
+    assert set(reasons) == {"zeros.txt", "big.csv", "nested.zip", "tool.exe"}
+    assert "压缩比" in reasons["zeros.txt"]
+    assert "文件大小超过限制" in reasons["big.csv"]
+    assert reasons["nested.zip"] == reasons["tool.exe"] == "不支持的文件格式"
+
+
+def test_decodes_gbk_member_names(markitdown_api):
+    # 中文 Windows 打包时文件名按 GBK 编码且不设置 UTF-8 标记（zipfile 写入非 ASCII 文件名时总是用 UTF-8）
+    encoded = "报告.txt".encode("gbk")
+    data = _zip([("XXXX.txt", b"x")]).replace(b"XXXX.txt", encoded)
+    plan = markitdown_api._open_zip(io.BytesIO(data))
+    assert [name for _, name in plan.members] == ["报告.txt"]
+
+
+def test_convert_zip_reports_members_in_archive_order(markitdown_api):
+    data = _zip([("b.txt", b"second"), ("a.txt", b"first"), ("c.exe", b"MZ")])
+    result = markitdown_api._convert_zip("x.zip", data, None, None, 0.0, "markitdown")
+    assert result["content"] == (
+        "Content from the zip file `x.zip`:\n\n## File: b.txt\n\nsecond\n\n## File: a.txt\n\nfirst"
+    )
+    assert result["metadata"]["summary"] == {"members": 3, "completed": 2, "failed": 0, "skipped": 1}
@@ -0,0 +1,155 @@
+import io
+import json
+import os
+
+import pytest
+from minio.error import S3Error
+
+
+def _pdf(sizes):
+    pdfium = pytest.importorskip("pypdfium2")
+    pdf = pdfium.PdfDocument.new()
+    for width, height in sizes:
+        pdf.new_page(width, height)
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    pdf.close()
+    return buffer.getvalue()
+
+
+A4, LETTER, A5 = (595, 842), (612, 792), (420, 595)
+
+
+def test_page_fingerprints_match_unchanged_pages(mineru_api):
+    v1 = mineru_api._page_fingerprints(_pdf([A4, LETTER, A5]))
+    v2 = mineru_api._page_fingerprints(_pdf([A4, A5, LETTER, A5]))
+    assert len(v1) == 3 and len(v2) == 4
+    assert len(set(v1)) == 3
+    # 按指纹匹配而不是按页码：插入页面后其余页面仍能对应上
+    assert [fp in v1 for fp in v2] == [True, True, True, True]
+    assert v2[0] == v1[0] and v2[2] == v1[1]
+    assert mineru_api._page_fingerprints(b"not a pdf") is None
+
+
+class _FakeMinio:
+    def __init__(self):
+        self.objects = set()
+
+    def stat_object(self, bucket, name):
+        if name not in self.objects:
+            raise S3Error("NoSuchKey", "missing", name, "req", "host", None)
+
+
+@pytest.fixture
+def incremental(mineru_api, monkeypatch, tmp_path):
+    """用假的解析器和 MinIO 驱动 _extract_document：解析器按给定页面生成 content_list 和图片"""
+    minio = _FakeMinio()
+
+    def upload(client, bucket, path, document_id, filename):
+        name = f"documents/{document_id}/images/{filename}"
+        minio.objects.add(name)
+        return f"http://minio/{bucket}/{name}"
+
+    monkeypatch.delenv("MINIO_BUCKET_NAME", raising=False)
+    monkeypatch.setattr(mineru_api, "INCREMENTAL_PARSE", True)
+    monkeypatch.setattr(mineru_api, "VERSION_STORE", mineru_api.ResultStore(str(tmp_path / "versions"), 3600))
+    monkeypatch.setattr(mineru_api, "_get_minio_client", lambda: minio)
+    monkeypatch.setattr(mineru_api, "_upload_image_to_minio", upload)
+    monkeypatch.setattr(mineru_api, "_pdf_subset", lambda data, indices: json.dumps(indices).encode())
+
+    state = {"parses": []}
+
+    def parse_upload(filename, data, lang, tenant, estimate):
+        spec = state["next"]
+        work_dir = str(tmp_path / f"work-{len(state['parses'])}")
+        output_dir = os.path.join(work_dir, "out")
+        auto_dir = os.path.join(output_dir, "doc", "auto")
+        os.makedirs(os.path.join(auto_dir, "images"))
+        blocks = []
+        for page_idx, (label, image) in enumerate(spec):
+            blocks.append({"type": "text", "text": f"Page {label}", "text_level": 1, "page_idx": page_idx})
+            blocks.append({"type": "header", "text": "running header", "page_idx": page_idx})
+            if image:
+                blocks.append({"type": "image", "img_path": f"images/{image}", "page_idx": page_idx})
+                with open(os.path.join(auto_dir, "images", image), "wb") as f:
+                    f.write(b"img")
+        with open(os.path.join(auto_dir, "doc_content_list.json"), "w", encoding="utf-8") as f:
+            json.dump(blocks, f)
+        state["parses"].append((filename, data))
+        return mineru_api._ParseOutcome(
+            work_dir=work_dir, output_dir=output_dir, filename=filename, markdown="NATIVE MARKDOWN", backend="fake"
+        )
+
+    monkeypatch.setattr(mineru_api, "_parse_upload", parse_upload)
+
+    def run(fingerprints, spec, data=b"%PDF"):
+        state["next"] = spec
+        monkeypatch.setattr(mineru_api, "_page_fingerprints", lambda _: list(fingerprints))
+        result = mineru_api._extract_document("doc.pdf", data, "doc-1", "ch", 0.0, "task")
+        return result["data"]["extracted"], result["data"]["metadata"]["incremental"]
+
+    state["run"] = run
+    state["minio"] = minio
+    return state
+
+
+def test_full_parse_keeps_native_markdown_and_records_pages(incremental):
+    markdown, info = incremental["run"](["f0", "f1", "f2"], [("0", None), ("1", "a.jpg"), ("2", None)])
+    assert markdown == "NATIVE MARKDOWN"
+    assert info["mode"] == "full"
+    assert info["version"] == 1
+
+
+def test_changed_pages_are_reparsed_and_spliced(incremental):
+    run = incremental["run"]
+    run(["f0", "f1", "f2", "f3"], [("0", None), ("1", "a.jpg"), ("2", None), ("3", "b.jpg")])
+
+    markdown, info = run(["f0", "f1", "f2-new", "f3"], [("2 edited", "c.jpg")])
+    assert info["mode"] == "incremental"
+    assert info["version"] == 2
+    assert (info["pagesReused"], info["pagesReparsed"], info["reparsedPages"]) == (3, 1, [3])
+    # 只把变化的页面（从 0 开始的页码 2）交给解析器
+    assert incremental["parses"][-1] == ("doc_pages.pdf", b"[2]")
+    assert markdown == "\n\n".join(
+        [
+            "# Page 0",
+            "# Page 1\n\n![](http://minio/deepmed/documents/doc-1/images/a.jpg)",
+            "# Page 2 edited\n\n![](http://minio/deepmed/documents/doc-1/images/c.jpg)",
+            "# Page 3\n\n![](http://minio/deepmed/documents/doc-1/images/b.jpg)",
+        ]
+    )
+
+    # 页面顺序调整、删除页面时按指纹复用，不需要解析
+    markdown, info = run(["f3", "f0", "f2-new"], [])
+    assert (info["mode"], info["pagesReparsed"]) == ("incremental", 0)
+    assert markdown == "\n\n".join(
+        [
+            "# Page 3\n\n![](http://minio/deepmed/documents/doc-1/images/b.jpg)",
+            "# Page 0",
+            "# Page 2 edited\n\n![](http://minio/deepmed/documents/doc-1/images/c.jpg)",
+        ]
+    )
+    assert len(incremental["parses"]) == 2
+
+
+def test_falls_back_to_full_parse_when_too_many_pages_change(incremental):
+    run = incremental["run"]
+    run(["f0", "f1", "f2"], [("0", None), ("1", None), ("2", None)])
+    markdown, info = run(["g0", "g1", "f2"], [("0", None), ("1", None), ("2", None)])
+    assert (markdown, info["mode"], info["version"]) == ("NATIVE MARKDOWN", "full", 2)
+
+
+def test_falls_back_to_full_parse_when_stored_image_is_gone(incremental):
+    run = incremental["run"]
+    run(["f0", "f1", "f2"], [("0", None), ("1", "a.jpg"), ("2", None)])
+    incremental["minio"].objects.discard("documents/doc-1/images/a.jpg")
+    markdown, info = run(["f0", "f1", "f2-new"], [("0", None), ("1", "a.jpg"), ("2", None)])
+    assert (markdown, info["mode"]) == ("NATIVE MARKDOWN", "full")
+    assert "documents/doc-1/images/a.jpg" in incremental["minio"].objects
+
+
+def test_language_change_forces_full_parse(mineru_api, incremental):
+    run = incremental["run"]
+    run(["f0", "f1"], [("0", None), ("1", None)])
+    result = mineru_api._extract_document("doc.pdf", b"%PDF", "doc-1", "en", 0.0, "task")
+    assert result["data"]["metadata"]["incremental"]["mode"] == "full"
@@ -0,0 +1,119 @@
+import io
+import threading
+import time
+
+import pytest
+
+
+def _estimate(api, seconds, pages=None):
+    return api._CostEstimate(pages, 0, seconds, api._timeout_for(seconds, pages))
+
+
+def _ticket(api, seq, seconds, enqueued_at, tenant="default"):
+    return api._Ticket(seq, tenant, _estimate(api, seconds), enqueued_at)
+
+
+def test_sjf_prefers_short_jobs(mineru_api):
+    scheduler = mineru_api._ParseScheduler("sjf", aging_rate=0.0)
+    long_job = _ticket(mineru_api, 1, 100, 0.0)
+    short_job = _ticket(mineru_api, 2, 10, 500.0)
+    assert min([long_job, short_job], key=scheduler._sort_key) is short_job
+
+
+def test_sjf_aging_prevents_starvation(mineru_api):
+    scheduler = mineru_api._ParseScheduler("sjf", aging_rate=1.0)
+    long_job = _ticket(mineru_api, 1, 100, 0.0)
+    # 长任务等待的时间抵扣了预估耗时：晚 50 秒到达的短任务仍然优先，晚 95 秒到达的不再插队
+    assert min([long_job, _ticket(mineru_api, 2, 10, 50.0)], key=scheduler._sort_key).seq == 2
+    assert min([long_job, _ticket(mineru_api, 3, 10, 95.0)], key=scheduler._sort_key) is long_job
+
+
+def test_fifo_keeps_arrival_order(mineru_api):
+    scheduler = mineru_api._ParseScheduler("fifo", aging_rate=1.0)
+    tickets = [_ticket(mineru_api, 1, 100, 0.0), _ticket(mineru_api, 2, 1, 1.0)]
+    assert sorted(reversed(tickets), key=scheduler._sort_key) == tickets
+
+
+def test_unknown_policy_falls_back_to_sjf(mineru_api):
+    assert mineru_api._ParseScheduler("lottery", aging_rate=1.0).policy == "sjf"
+
+
+def test_fair_interleaves_tenants(mineru_api):
+    scheduler = mineru_api._ParseScheduler("fair", aging_rate=1.0)
+    order = ["a", "a", "a", "b", "c", "b"]
+    for tenant in order:
+        scheduler._waiting.append(scheduler._admit(tenant, _estimate(mineru_api, 10)))
+    ranked = [t.tenant for t in sorted(scheduler._waiting, key=scheduler._sort_key)]
+    # 每个租户按已获得的服务量轮流执行，租户 a 先提交的大量任务不会挡住 b 和 c
+    assert ranked == ["a", "b", "c", "a", "b", "a"]
+
+
+def test_fair_counts_estimated_cost(mineru_api):
+    scheduler = mineru_api._ParseScheduler("fair", aging_rate=1.0)
+    for tenant, seconds in [("big", 100), ("big", 100), ("small", 10), ("small", 10), ("small", 10)]:
+        scheduler._waiting.append(scheduler._admit(tenant, _estimate(mineru_api, seconds)))
+    ranked = [t.tenant for t in sorted(scheduler._waiting, key=scheduler._sort_key)]
+    assert ranked == ["small", "small", "small", "big", "big"]
+
+
+def test_slot_runs_waiting_jobs_by_policy(mineru_api, monkeypatch):
+    monkeypatch.setattr(mineru_api, "MINERU_PARSE_CONCURRENCY", 1)
+    monkeypatch.setattr(mineru_api, "REPLICA_POOL", None)
+    scheduler = mineru_api._ParseScheduler("sjf", aging_rate=0.0)
+    release = threading.Event()
+    started = []
+
+    def run(name, seconds, hold=False):
+        with scheduler.slot("default", _estimate(mineru_api, seconds)):
+            started.append(name)
+            if hold:
+                release.wait(5)
+
+    def wait_for(predicate):
+        deadline = time.time() + 5
+        while not predicate():
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=run, args=("running", 1, True))]
+    threads[0].start()
+    wait_for(lambda: started == ["running"])
+    for name, seconds in [("long", 100), ("medium", 50), ("short", 5)]:
+        thread = threading.Thread(target=run, args=(name, seconds))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: len(scheduler.stats()["waiting"]) == len(threads) - 1)
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert started == ["running", "short", "medium", "long"]
+    stats = scheduler.stats()
+    assert stats["running"] == [] and stats["waiting"] == []
+
+
+def test_estimate_reads_page_count(mineru_api):
+    pdfium = pytest.importorskip("pypdfium2")
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(7):
+        pdf.new_page(612, 792)
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    pdf.close()
+    data = buffer.getvalue()
+
+    scheduler = mineru_api._ParseScheduler("sjf", aging_rate=1.0)
+    estimate = scheduler.estimate(data, len(data))
+    assert estimate.pages == 7
+    assert estimate.seconds == pytest.approx(
+        mineru_api.MINERU_SCHED_BASE_SECONDS + scheduler.seconds_per_page * 7, abs=0.01
+    )
+
+
+def test_estimate_falls_back_to_size_while_pdfium_is_busy(mineru_api, monkeypatch):
+    monkeypatch.setattr(mineru_api, "MINERU_SCHED_PRESCAN_WAIT_SECONDS", 0.05)
+    scheduler = mineru_api._ParseScheduler("sjf", aging_rate=1.0)
+    with mineru_api._PDFIUM_LOCK:
+        estimate = scheduler.estimate(b"%PDF", 1024 * 1024)
+    assert estimate.pages is None
+    assert estimate.timeout == mineru_api.MINERU_TIMEOUT_SECONDS
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+
+import pytest
+
+from server_common import ScratchQuotaExceeded, ScratchSpace, SingleFlight, flight_key
+
+
+# ---------------------------------------------------------------------------
+# SingleFlight
+# ---------------------------------------------------------------------------
+
+
+def test_single_flight_shares_result_and_cleans_up_once():
+    cleaned = []
+    flights = SingleFlight("test", cleanup=cleaned.append)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+
+    def join():
+        with flights.join("key", work) as (result, coalesced):
+            results.append((result, coalesced))
+
+    leader = threading.Thread(target=join)
+    leader.start()
+    assert started.wait(5)
+    waiters = [threading.Thread(target=join) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    # 等待者都已挂到同一个 flight 上
+    deadline = time.time() + 5
+    while flights._flights["key"].refs < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader, *waiters]:
+        thread.join(5)
+
+    assert calls == [1]
+    assert sorted(results) == [("result", False), ("result", True), ("result", True), ("result", True)]
+    assert cleaned == ["result"]
+    assert flights.in_flight() == 0
+
+
+def test_single_flight_propagates_leader_exception_to_waiters():
+    cleaned = []
+    flights = SingleFlight("test", cleanup=cleaned.append)
+    started = threading.Event()
+    release = threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def join():
+        try:
+            with flights.join("key", work):
+                errors.append(None)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=join)
+    leader.start()
+    assert started.wait(5)
+    waiters = [threading.Thread(target=join) for _ in range(2)]
+    for thread in waiters:
+        thread.start()
+    deadline = time.time() + 5
+    while flights._flights["key"].refs < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader, *waiters]:
+        thread.join(5)
+
+    assert len(errors) == 3
+    assert all(isinstance(e, ValueError) and str(e) == "boom" for e in errors)
+    # 失败的 flight 没有结果可清理，之后的请求重新执行
+    assert cleaned == []
+    assert flights.in_flight() == 0
+    with flights.join("key", lambda: "retry") as (result, coalesced):
+        assert (result, coalesced) == ("retry", False)
+
+
+def test_flight_key_depends_on_content_and_params():
+    assert flight_key(b"a", lang="ch") == flight_key(b"a", lang="ch")
+    assert flight_key(b"a", lang="ch") != flight_key(b"b", lang="ch")
+    assert flight_key(b"a", lang="ch") != flight_key(b"a", lang="en")
+
+
+# ---------------------------------------------------------------------------
+# ScratchSpace
+# ---------------------------------------------------------------------------
+
+
+def _scratch(tmp_path, **overrides) -> ScratchSpace:
+    options = dict(
+        name="test_scratch",
+        root=str(tmp_path / "disk"),
+        tmpfs_root=None,
+        tmpfs_max_bytes=0,
+        request_quota=10 * 1024 * 1024,
+        total_quota=16 * 1024 * 1024,
+        orphan_ttl=3600,
+    )
+    options.update(overrides)
+    return ScratchSpace(**options)
+
+
+def test_scratch_rejects_requests_over_quota(tmp_path):
+    scratch = _scratch(tmp_path)
+    with pytest.raises(ScratchQuotaExceeded):
+        scratch.allocate(11 * 1024 * 1024)
+
+    first = scratch.allocate(8 * 1024 * 1024)
+    # 总配额按预留量计算
+    with pytest.raises(ScratchQuotaExceeded):
+        scratch.allocate(9 * 1024 * 1024)
+    assert scratch.stats()["reserved_bytes"] == 8 * 1024 * 1024
+
+    scratch.release(first)
+    assert not os.path.exists(first)
+    assert scratch.stats()["reserved_bytes"] == 0
+    with scratch.workdir(9 * 1024 * 1024) as path:
+        assert os.path.isdir(path)
+    assert not os.path.exists(path)
+
+
+def test_scratch_prefers_tmpfs_for_small_requests(tmp_path):
+    scratch = _scratch(tmp_path, tmpfs_root=str(tmp_path / "tmpfs"), tmpfs_max_bytes=1024)
+    small = scratch.allocate(100)
+    large = scratch.allocate(4096)
+    assert small.startswith(str(tmp_path / "tmpfs"))
+    assert large.startswith(str(tmp_path / "disk"))
+
+
+def test_scratch_sweeper_removes_orphans_but_keeps_live_dirs(tmp_path):
+    scratch = _scratch(tmp_path)
+    active = scratch.allocate(1024)
+
+    # 已退出进程遗留的目录：owner 锁文件不存在 / 未被持有
+    root = tmp_path / "disk"
+    orphan = root / "4242-deadbeef--leftover"
+    orphan.mkdir()
+    (orphan / "file.bin").write_bytes(b"x" * 10)
+    stale_lock = root / ".owner-4343-cafebabe"
+    stale_lock.write_text("")
+    os.utime(stale_lock, (time.time() - 120, time.time() - 120))
+    (root / "4343-cafebabe--other").mkdir()
+    # 本进程遗留但未登记的目录只有超过 TTL 才删除
+    finished = root / f"{scratch._owner_id}--finished"
+    finished.mkdir()
+    unrelated = root / "unrelated"
+    unrelated.mkdir()
+
+    assert scratch.sweep_orphans() == 2
+    assert os.path.isdir(active)
+    assert finished.is_dir()
+    assert unrelated.is_dir()
+    assert not orphan.exists()
+    assert not stale_lock.exists()
+
+    os.utime(finished, (time.time() - 7200, time.time() - 7200))
+    assert scratch.sweep_orphans() == 1
+    assert not finished.exists()
+    assert os.path.isdir(active)
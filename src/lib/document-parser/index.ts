@@ -12,7 +12,7 @@ import path from 'path';
 import os from 'os';
 import axios from 'axios';
 import FormData from 'form-data';
-import { getDocumentParser, hasUserDocumentContext } from './user-context';
+import { getDocumentParser, getUserDocumentContext, hasUserDocumentContext } from './user-context';
 
 export type ParserType = 'markitdown-docker' | 'mineru-docker' | 'mineru-cloud';
 
@@ -109,6 +109,11 @@ async function convertWithDockerMarkItDown(
     if (language) {
       form.append('language', language);
     }
+    // PDF 解析服务：markitdown | mineru | auto（auto 由 MarkItDown 服务按 PDF 特征自动分流到 MinerU）
+    const pdfBackend = process.env.MARKITDOWN_PDF_BACKEND;
+    if (pdfBackend) {
+      form.append('pdf_backend', pdfBackend);
+    }
 
     // 使用 axios 发送请求（更好的 form-data 支持）
     // 添加超时配置（5分钟）
@@ -165,6 +170,8 @@ async function convertWithDockerMarkItDown(
         processingTime,
         fileName: result.metadata?.filename,
         language: normalizedMarkitdownLanguage ?? language,
+        conversionPath: result.metadata?.conversion_path,
+        triage: result.metadata?.triage,
       },
     };
   } catch (error) {
@@ -289,6 +296,8 @@ async function convertWithDockerMinerU(
     const response = await axios.post(`${mineruUrl}/v4/extract/task`, form, {
       headers: {
         ...form.getHeaders(),
+        // 按用户公平调度（MinerU 服务 MINERU_SCHED_POLICY=fair 时生效）
+        ...(hasUserDocumentContext() ? { 'X-Tenant-Id': getUserDocumentContext().userId } : {}),
       },
       maxBodyLength: Infinity,
       maxContentLength: Infinity,